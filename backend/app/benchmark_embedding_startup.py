@@ -0,0 +1,50 @@
+"""
+Startup benchmark for the embedding backends.
+
+Each backend is measured in a fresh interpreter so import cost and memory are
+not shared: time to import the module, time to load the model (together the
+cold start), time of the first query encode, and peak RSS of the process. Run from the app directory:
+
+    python benchmark_embedding_startup.py
+"""
+import json
+import subprocess
+import sys
+
+PROBE = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+from embedding_backend import load_embedding_model
+from embedding_index import EMBEDDING_MODEL_NAME
+imported = time.perf_counter()
+model = load_embedding_model(EMBEDDING_MODEL_NAME, backend=sys.argv[1])
+loaded = time.perf_counter()
+model.encode(["What is a noun?"], convert_to_numpy=True)
+ready = time.perf_counter()
+print(json.dumps({
+    "backend": type(model).__name__,
+    "import_s": imported - start,
+    "load_s": loaded - imported,
+    "first_query_s": ready - loaded,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch_loaded": "torch" in sys.modules,
+}))
+"""
+
+
+def run_backend(backend: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, backend],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    print(f"{'requested':<10}{'loaded':<24}{'import s':>10}{'load s':>8}{'cold start s':>14}"
+          f"{'first query s':>15}{'peak RSS MB':>13}{'torch':>7}")
+    for backend in ("onnx", "torch"):
+        r = run_backend(backend)
+        print(f"{backend:<10}{r['backend']:<24}{r['import_s']:>10.2f}{r['load_s']:>8.2f}"
+              f"{r['import_s'] + r['load_s']:>14.2f}{r['first_query_s']:>15.3f}"
+              f"{r['peak_rss_mb']:>13.0f}{str(r['torch_loaded']):>7}")
@@ -0,0 +1,128 @@
+"""
+Benchmark for Quiz1 question selection.
+
+Replays the old /quiz1/ random walk (random topic -> random subtopic -> MCQ at
+the current hardness, up to 1000 tries, four queries per try) against dealing
+from a per-attempt deck (PlacementIndex.deck(), as question_bank.build_placement_deck
+builds it) on a synthetic "quiz1" subject, and reports the database queries per
+request. A deck request costs the subject query and the attempt row, plus one
+row read for a question not served before; the request that starts an attempt
+also reads the subject layout to build the deck. It also checks that the decks
+spread first questions over topics like the walk does. No database is needed.
+Run from the app directory:
+
+    python benchmark_quiz1_selection.py
+"""
+import random
+import statistics
+import time
+from collections import Counter
+
+from placement_index import PlacementIndex
+
+TOPICS = 20
+SUBTOPICS_PER_TOPIC = 10
+QUESTIONS_PER_LEVEL = 5
+MAX_ATTEMPTS = 1000
+REQUESTS = 2000
+ATTEMPT_LENGTH = 10
+
+
+def build_bank(sparse_level: int):
+    """
+    (topic_id, subtopic_id, mcq_id, hardness_level) rows. Every subtopic has
+    QUESTIONS_PER_LEVEL questions at each level except sparse_level, which only
+    the very last subtopic has.
+    """
+    rows = []
+    mcq_id = 0
+    last_subtopic = TOPICS * SUBTOPICS_PER_TOPIC - 1
+    for topic_id in range(TOPICS):
+        for s in range(SUBTOPICS_PER_TOPIC):
+            subtopic_id = topic_id * SUBTOPICS_PER_TOPIC + s
+            for level in range(1, 11):
+                if level == sparse_level and subtopic_id != last_subtopic:
+                    continue
+                for _ in range(QUESTIONS_PER_LEVEL):
+                    rows.append((topic_id, subtopic_id, mcq_id, level))
+                    mcq_id += 1
+    return rows
+
+
+def random_walk_queries(rows, level: int, exclude: set) -> int:
+    """Queries the old loop issues for one request."""
+    by_subtopic = {}
+    topics = {}
+    for topic_id, subtopic_id, mcq_id, hardness_level in rows:
+        topics.setdefault(topic_id, set()).add(subtopic_id)
+        if hardness_level == level and mcq_id not in exclude:
+            by_subtopic.setdefault(subtopic_id, []).append(mcq_id)
+    topic_ids = list(topics)
+    queries = 0
+    for _ in range(MAX_ATTEMPTS):
+        queries += 4  # subject, topic, subtopic, MCQ
+        subtopic_id = random.choice(list(topics[random.choice(topic_ids)]))
+        if by_subtopic.get(subtopic_id):
+            break
+    return queries
+
+
+def walk_subtopic(rows, level: int):
+    """Subtopic the old loop serves a first question at level from, or None."""
+    topics = {}
+    has_level = set()
+    for topic_id, subtopic_id, _, hardness_level in rows:
+        topics.setdefault(topic_id, set()).add(subtopic_id)
+        if hardness_level == level:
+            has_level.add(subtopic_id)
+    topic_ids = list(topics)
+    for _ in range(MAX_ATTEMPTS):
+        subtopic_id = random.choice(list(topics[random.choice(topic_ids)]))
+        if subtopic_id in has_level:
+            return subtopic_id
+    return None
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<40}{statistics.mean(samples):>10.1f}{p99:>10}{samples[-1]:>10}")
+
+
+if __name__ == "__main__":
+    sparse_level = 10
+    rows = build_bank(sparse_level)
+    index = PlacementIndex(rows)
+    topic_of_mcq = {mcq_id: topic_id for topic_id, _, mcq_id, _ in rows}
+    served = set()
+
+    print(f"{TOPICS} topics x {SUBTOPICS_PER_TOPIC} subtopics, level {sparse_level} only in one subtopic\n")
+    print(f"{'queries per request':<40}{'mean':>10}{'p99':>10}{'max':>10}")
+    for label, level, exclude in (
+        ("common level", 5, set()),
+        ("sparse level", sparse_level, set()),
+        ("sparse level, all answered", sparse_level,
+         {mcq_id for _, _, mcq_id, hardness_level in rows if hardness_level == sparse_level}),
+    ):
+        report(f"random walk, {label}", [random_walk_queries(rows, level, exclude) for _ in range(REQUESTS)])
+        deck_queries = []
+        for request in range(REQUESTS):
+            # Attempts of ATTEMPT_LENGTH questions; the first request builds the deck
+            position = request % ATTEMPT_LENGTH
+            if position == 0:
+                ids = [mcq_id for mcq_id in index.deck(level, ATTEMPT_LENGTH) if mcq_id not in exclude]
+            mcq_id = ids[position] if position < len(ids) else None
+            deck_queries.append(2 + (position == 0) + (mcq_id is not None and mcq_id not in served))
+            served.add(mcq_id)
+        report(f"deck, {label}", deck_queries)
+
+    # Share of first questions per topic: the walk picks a topic uniformly
+    walk_topics = Counter(walk_subtopic(rows, 5) // SUBTOPICS_PER_TOPIC for _ in range(REQUESTS))
+    deck_topics = Counter(topic_of_mcq[index.deck(5, 1)[0]] for _ in range(REQUESTS))
+    spread = max(abs(walk_topics[t] - deck_topics[t]) / REQUESTS for t in range(TOPICS))
+    print(f"\nfirst-question topic share, largest walk/deck gap: {spread:.3f} (uniform share {1 / TOPICS:.3f})")
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        index.deck(sparse_level, ATTEMPT_LENGTH)
+    print(f"deck build: {(time.perf_counter() - start) / REQUESTS * 1e6:.1f} us")
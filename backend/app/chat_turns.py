@@ -0,0 +1,45 @@
+"""
+Append-only storage for explain conversation turns.
+
+Each turn is one chat_turns row keyed by (user_id, subtopic_id, seq), where
+seq is UserProgress.turn_count after the increment that records the turn.
+Recording a turn is one small INSERT instead of rewriting a JSONB array on
+user_progress, and readers fetch the newest turns with a keyset scan on the
+unique index.
+"""
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from .database.models import ChatTurn
+
+# Most turns any reader looks at (the old chat_memory cap)
+CHAT_MEMORY_TURNS = 30
+
+
+async def load_turns(db, user_id: int, subtopic_id: int, after_seq: int = 0, through_seq: Optional[int] = None,
+                     limit: int = CHAT_MEMORY_TURNS) -> list:
+    """The newest `limit` turns with after_seq < seq <= through_seq, oldest first, as question/answer dicts."""
+    query = select(ChatTurn.question, ChatTurn.answer).filter(
+        ChatTurn.user_id == user_id,
+        ChatTurn.subtopic_id == subtopic_id,
+        ChatTurn.seq > after_seq
+    )
+    if through_seq is not None:
+        query = query.filter(ChatTurn.seq <= through_seq)
+    result = await db.execute(query.order_by(ChatTurn.seq.desc()).limit(limit))
+    return [{"question": row.question, "answer": row.answer} for row in reversed(result.all())]
+
+
+async def append_turn(db, user_id: int, subtopic_id: int, seq: int, question: str, answer: str):
+    """Add a turn to the current transaction."""
+    db.add(ChatTurn(user_id=user_id, subtopic_id=subtopic_id, seq=seq, question=question, answer=answer))
+
+
+async def clear_turns(db, user_id: int, subtopic_id: int):
+    await db.execute(
+        delete(ChatTurn).filter(
+            ChatTurn.user_id == user_id,
+            ChatTurn.subtopic_id == subtopic_id
+        )
+    )
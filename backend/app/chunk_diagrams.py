@@ -0,0 +1,47 @@
+"""
+Chunk -> diagram resolution, done once at ingestion time.
+
+A chunk that mentions an "image description" shows the diagram whose
+description matches the chunk's heading (the first line, with \section,
+\subsection or \textbf stripped), compared case-insensitively. The ingestion
+scripts store the result on Explain.chunk_diagrams as
+{"<chunk index>": <diagram id>}, so requests never have to parse chunks or
+search Diagram.description.
+
+This module has no package-relative imports so the ingestion scripts can use
+it as well as the routers.
+"""
+import re
+from typing import Iterable, Optional
+
+
+def chunk_diagram_description(chunk) -> Optional[str]:
+    """The diagram description a chunk refers to, or None if it shows no diagram."""
+    if not isinstance(chunk, str) or "image description" not in chunk.lower():
+        return None
+
+    first_line = chunk.split('\n')[0].strip()  # e.g., "\subsection*{Union of Sets}" or "\textbf{Key Concepts}"
+    match = re.match(r'\\(section|subsection|textbf)\*?\{([^}]*)\}', first_line)
+    if match:
+        description = match.group(2).strip()  # e.g., "সম্পাদ্য ১ ধাপ ১" or "Introduction"
+    else:
+        # Fallback: Remove braces and keep the line as is
+        description = first_line.replace("{", "").replace("}", "").strip()
+    return description or None
+
+
+def resolve_chunk_diagrams(chunks: list, diagrams: Iterable) -> dict:
+    """
+    Map chunk indexes to diagram ids. diagrams are (id, description) pairs
+    for the chunks' subtopic.
+    """
+    by_description = {}
+    for diagram_id, description in diagrams:
+        by_description.setdefault(description.lower(), diagram_id)
+
+    mapping = {}
+    for index, chunk in enumerate(chunks):
+        description = chunk_diagram_description(chunk)
+        if description and description.lower() in by_description:
+            mapping[str(index)] = by_description[description.lower()]
+    return mapping
@@ -0,0 +1,47 @@
+"""
+Immutable, version-stamped cache of Explain chunks.
+
+Explain.chunks only changes when the ingestion scripts run, and they stamp
+every row with Explain.content_version (a hash of the chunks). Requests read
+just the version; the chunk list is loaded once per subtopic and version per
+worker and shared by reference as a tuple. A new version replaces the old
+entry, so re-ingestion takes effect on the next request; the scripts run in
+their own processes, so the version is the only invalidation. Rows without a
+content_version (ingested before it existed, see insert_chunk_embeddings.py)
+are loaded on every call and never cached.
+"""
+import os
+from typing import Optional
+
+from cachetools import LRUCache
+from prometheus_client import Counter
+from sqlalchemy import select
+
+from .database.models import Explain
+
+CHUNK_STORE_MAX_SUBTOPICS = int(os.getenv("CHUNK_STORE_MAX_SUBTOPICS", "1024"))
+
+CHUNK_STORE_LOOKUPS = Counter(
+    "chunk_store_lookups_total",
+    "Explain chunk lookups served from memory (hit) or the database (miss)",
+    ["result"]
+)
+
+# subtopic_id -> (content_version, chunks tuple)
+_store = LRUCache(maxsize=CHUNK_STORE_MAX_SUBTOPICS)
+
+
+async def get_chunks(db, subtopic_id: int, version: Optional[str]) -> tuple:
+    """The subtopic's chunks for this content version (empty if there is no Explain row)."""
+    entry = _store.get(subtopic_id)
+    if entry is not None and version is not None and entry[0] == version:
+        CHUNK_STORE_LOOKUPS.labels(result="hit").inc()
+        return entry[1]
+
+    CHUNK_STORE_LOOKUPS.labels(result="miss").inc()
+    result = await db.execute(select(Explain.chunks).filter(Explain.subtopic_id == subtopic_id))
+    chunks = tuple(result.scalar_one_or_none() or ())
+    if version is not None:
+        _store[subtopic_id] = (version, chunks)
+    return chunks
+
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text,DateTime, Boolean, Float,JSON,LargeBinary
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Text,DateTime, Boolean, Float,JSON,LargeBinary, UniqueConstraint, Index
+from sqlalchemy.orm import relationship, deferred
 from .session import Base
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import ARRAY
@@ -32,6 +32,8 @@ class Subtopic(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     topic_id = Column(Integer, ForeignKey("topics.id"))
+    # Bumped whenever MCQs are added, see question_bank.py
+    question_bank_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     topic = relationship("Topic", back_populates="subtopics")
     questions = relationship("MCQ", back_populates="subtopic")
@@ -111,6 +113,14 @@ class QuizAttempt(Base):
     subtopic_id = Column(Integer, ForeignKey("subtopics.id"), index=True, nullable=False)
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    deck = Column(JSONB, nullable=True)  # Question deck and cursors, see question_bank.py
+    # Running counters, bumped in the statement that inserts each answer (see record_answer in router/quizzes.py)
+    questions_tried = Column(Integer, nullable=False, default=0, server_default="0")
+    quiz2_correct = Column(Integer, nullable=False, default=0, server_default="0")
+    quiz3_correct = Column(Integer, nullable=False, default=0, server_default="0")
+    last_hardness_level = Column(Integer, nullable=True)
+    last_is_correct = Column(Boolean, nullable=True)  # Resume goes a level up or down from last_hardness_level
+    total_response_time = Column(Float, nullable=False, default=0.0, server_default="0")
     user = relationship("User", back_populates="attempts")
     subject = relationship("Subject")
     topic = relationship("Topic")
@@ -146,6 +156,21 @@ class QuizScore(Base):
     attempt = relationship("QuizAttempt", back_populates="score")
 
 
+# Latest quiz result per user and subtopic, kept up to date when a quiz completes (read by the dashboard)
+class UserSubtopicMastery(Base):
+    __tablename__ = "user_subtopic_mastery"
+    __table_args__ = (
+        UniqueConstraint("user_id", "subtopic_id", name="uq_user_subtopic_mastery"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    subtopic_id = Column(Integer, ForeignKey("subtopics.id"), nullable=False)
+    attempt_id = Column(Integer, ForeignKey("quiz_attempts.id"), nullable=False)  # Latest completed QuizAttempt
+    total_correct = Column(Integer, nullable=True)  # NULL: the attempt has no score (not taken on the dashboard)
+    completion_percentage = Column(Float, nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=False)
+
+
 
 
 class Explain(Base):
@@ -154,31 +179,109 @@ class Explain(Base):
     id = Column(Integer, primary_key=True, index=True)
     subtopic_id = Column(Integer, ForeignKey("subtopics.id"))
     chunks = Column(JSONB, nullable=False)  # Store list of chunk texts as JSONB
-    index_faiss_embedding = Column(JSONB, nullable=True)  # Nullable embedding column for 384-dim vectors
+    content_version = Column(String(64), nullable=True)  # sha256 of chunks, set by the ingestion scripts
+    chunk_embeddings = deferred(Column(LargeBinary, nullable=True))  # float32 .npy blob, one row per chunk
+    chunk_diagrams = Column(JSONB, nullable=True)  # {"<chunk index>": diagram id}, resolved at ingestion
+    semantic_cache_version = Column(Integer, default=0, server_default="0", nullable=False)  # Bumped by purge_semantic_cache.py
 
     subtopic = relationship("Subtopic", back_populates="explains")
 
 
 
-    # NEW: UserProgress model to store chunk_index and chat_memory
+    # NEW: UserProgress model to store chunk_index; the conversation itself lives in chat_turns
 class UserProgress(Base):
     __tablename__ = "user_progress"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
     subtopic_id = Column(Integer, ForeignKey("subtopics.id"), index=True, nullable=False)
     chunk_index = Column(Integer, default=0, nullable=False)  # Tracks current chunk
-    chat_memory = Column(JSONB, default=list, nullable=False)  # Stores question-answer pairs
     
-     # 🚀 NEW: Pre-generation columns for continue responses
-    next_continue_response = Column(Text, nullable=True)  # Pre-generated AI response
-    next_continue_image = Column(Text, nullable=True)     # Base64 encoded image
-    next_response_chunk_index = Column(Integer, nullable=True)  # Which chunk this response is for
+    # Turns older than the verbatim window are folded into a running summary
+    memory_summary = Column(Text, nullable=True)
+    turn_count = Column(Integer, default=0, server_default="0", nullable=False)  # Turns recorded so far (last chat_turns.seq)
+    summarized_through = Column(Integer, default=0, server_default="0", nullable=False)  # Turns covered by memory_summary
+
+    # Continue pacing, used to size the pre-generation lookahead
+    last_continue_at = Column(DateTime(timezone=True), nullable=True)
+    continue_interval_seconds = Column(Float, nullable=True)  # Smoothed time between continues
+    # Bumped whenever the conversation diverges from the pre-generated lookahead
+    lookahead_epoch = Column(Integer, default=0, server_default="0", nullable=False)
     
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     user = relationship("User", back_populates="progress")
     subtopic = relationship("Subtopic")
 
 
+# One explain question/answer pair, appended per turn
+class ChatTurn(Base):
+    __tablename__ = "chat_turns"
+    __table_args__ = (
+        UniqueConstraint("user_id", "subtopic_id", "seq", name="uq_chat_turns_seq"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    subtopic_id = Column(Integer, ForeignKey("subtopics.id"), nullable=False)
+    seq = Column(Integer, nullable=False)  # UserProgress.turn_count when the turn was recorded
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Pre-generated "continue" responses for the chunks ahead of UserProgress.chunk_index
+class PregeneratedResponse(Base):
+    __tablename__ = "pregenerated_responses"
+    __table_args__ = (
+        UniqueConstraint("user_id", "subtopic_id", "chunk_index", name="uq_pregenerated_responses_target"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    subtopic_id = Column(Integer, ForeignKey("subtopics.id"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    response = Column(Text, nullable=False)
+    image = Column(Text, nullable=True)  # "/assets/{sha256}" reference
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Gemini answers to context-free prompts (no chat memory), shared across students.
+# Keyed by a hash of the normalized prompt, model and temperature; each key
+# holds a few variants so students don't all read identical text.
+class SharedResponse(Base):
+    __tablename__ = "shared_responses"
+    __table_args__ = (
+        UniqueConstraint("cache_key", "variant", name="uq_shared_responses_key_variant"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), nullable=False)
+    variant = Column(Integer, nullable=False, default=0)
+    subtopic_id = Column(Integer, ForeignKey("subtopics.id"), index=True, nullable=False)
+    content_version = Column(String(64), nullable=False)  # Explain.content_version it was generated from
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+# Durable queue of "continue" pre-generation jobs, one row per target chunk
+class PregenerationJob(Base):
+    __tablename__ = "pregeneration_jobs"
+    __table_args__ = (
+        UniqueConstraint("user_id", "subtopic_id", "chunk_index", name="uq_pregeneration_jobs_target"),
+        Index("ix_pregeneration_jobs_claim", "status", "run_after"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    subtopic_id = Column(Integer, ForeignKey("subtopics.id"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)  # Chunk the response is pre-generated for
+    subject = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, running, done, failed, expired
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 # Add this new Diagram class
 class Diagram(Base):
     __tablename__ = "diagrams"
@@ -187,6 +290,7 @@ class Diagram(Base):
     subtopic_id = Column(Integer, ForeignKey("subtopics.id"))
     description = Column(Text, nullable=False)
     image_content = Column(LargeBinary, nullable=False)  # Use LargeBinary for PNG binary data
+    content_sha256 = Column(String(64), index=True)  # Served at /assets/{content_sha256}
 
     subtopic = relationship("Subtopic", back_populates="diagrams")
     
@@ -218,6 +322,13 @@ class Quiz1Attempt(Base):
     user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    deck = Column(JSONB, nullable=True)  # Question deck and cursors, see question_bank.py
+    # Running counters, bumped in the statement that inserts each answer (see record_answer in router/quizzes.py)
+    questions_tried = Column(Integer, nullable=False, default=0, server_default="0")
+    total_correct = Column(Integer, nullable=False, default=0, server_default="0")
+    last_hardness_level = Column(Integer, nullable=True)
+    last_is_correct = Column(Boolean, nullable=True)  # Resume goes a level up or down from last_hardness_level
+    total_response_time = Column(Float, nullable=False, default=0.0, server_default="0")
     user = relationship("User")
     answers = relationship("Quiz1", back_populates="attempt")
     score = relationship("Quiz1Score", uselist=False, back_populates="attempt")
@@ -242,6 +353,13 @@ class PractiseAttempt(Base):
     topic_id = Column(Integer, ForeignKey("topics.id"), nullable=False)
     subtopic_id = Column(Integer, ForeignKey("subtopics.id"), nullable=False)
     started_at = Column(DateTime(timezone=True), server_default=func.now())
+    deck = Column(JSONB, nullable=True)  # Question deck and cursors, see question_bank.py
+    # Running counters, bumped in the statement that inserts each answer (see record_answer in router/quizzes.py)
+    questions_tried = Column(Integer, nullable=False, default=0, server_default="0")
+    total_correct = Column(Integer, nullable=False, default=0, server_default="0")
+    last_hardness_level = Column(Integer, nullable=True)
+    last_is_correct = Column(Boolean, nullable=True)  # Resume goes a level up or down from last_hardness_level
+    total_response_time = Column(Float, nullable=False, default=0.0, server_default="0")
 
     user = relationship("User")
     subject = relationship("Subject")
@@ -270,6 +388,7 @@ class FacialExpression(Base):
     name = Column(String, nullable=False)
     facial_expression = Column(String, nullable=False)
     image = Column(LargeBinary, nullable=False)
+    content_sha256 = Column(String(64), index=True)  # Served at /assets/{content_sha256}
     
     
 # Add this to your models.py file
@@ -0,0 +1,63 @@
+"""
+Per-request database usage metrics.
+
+instrument_engine() hooks an engine's cursor events; inside a
+track_db_usage(endpoint) block every statement is counted and timed, and the
+totals are observed once when the block exits. The tracker lives in a
+ContextVar, which SQLAlchemy's asyncio layer carries into the greenlet that
+runs the statement.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Histogram
+from sqlalchemy import event
+
+DB_QUERIES = Histogram(
+    "db_queries_per_request",
+    "Database statements executed per request",
+    ["endpoint"],
+    buckets=[1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50]
+)
+DB_SECONDS = Histogram(
+    "db_seconds_per_request",
+    "Time spent in database statements per request",
+    ["endpoint"],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+
+_usage = ContextVar("db_usage", default=None)
+
+
+class DbUsage:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def instrument_engine(engine):
+    """Attach the counters to a (sync) engine; pass async_engine.sync_engine for async engines."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["db_usage_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        usage = _usage.get()
+        if usage is not None:
+            usage.queries += 1
+            usage.seconds += time.perf_counter() - conn.info["db_usage_start"]
+
+
+@contextmanager
+def track_db_usage(endpoint: str):
+    usage = DbUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+        DB_QUERIES.labels(endpoint=endpoint).observe(usage.queries)
+        DB_SECONDS.labels(endpoint=endpoint).observe(usage.seconds)
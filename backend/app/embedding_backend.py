@@ -0,0 +1,121 @@
+"""
+Pluggable, lazily loaded sentence embedding backends.
+
+The default backend runs an int8-quantized ONNX export of all-MiniLM-L6-v2 on
+ONNX Runtime, which needs neither torch nor sentence-transformers at runtime.
+The torch SentenceTransformer is only used when EMBEDDING_BACKEND=torch or the
+ONNX backend cannot be loaded. Nothing is loaded at import time: the model is
+built on first encode() or by an explicit warmup().
+
+Both backends expose SentenceTransformer's encode(sentences, convert_to_numpy=True)
+and return L2-normalised float32 embeddings, so callers do not care which one
+is active. Their vectors are not interchangeable, though (the ONNX export is
+quantized), so every loaded encoder carries an embedding_space name that
+embedding_index.chunks_version stamps into Explain.content_version.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx")  # "onnx" or "torch"
+EMBEDDING_ONNX_REPO = os.getenv("EMBEDDING_ONNX_REPO", "sentence-transformers/all-MiniLM-L6-v2")
+# quint8 AVX2 runs on every x86-64 Cloud Run CPU; qint8_avx512 / qint8_arm64 are also published
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_MAX_SEQ_LENGTH = 256  # same as the sentence-transformers config for MiniLM
+
+
+class OnnxSentenceEncoder:
+    """Mean-pooled, normalised MiniLM embeddings computed with ONNX Runtime."""
+
+    def __init__(self, repo_id: str = EMBEDDING_ONNX_REPO, file_name: str = EMBEDDING_ONNX_FILE,
+                 max_seq_length: int = EMBEDDING_MAX_SEQ_LENGTH):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(repo_id, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        self.session = ort.InferenceSession(
+            hf_hub_download(repo_id, file_name),
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.embedding_space = f"onnx:{repo_id}/{file_name}"
+
+    def encode(self, sentences, convert_to_numpy: bool = True, batch_size: int = 32) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        if not batches:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.vstack(batches)
+
+
+def _load_torch_encoder(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    encoder = SentenceTransformer(model_name)
+    encoder.embedding_space = f"torch:{model_name}"
+    return encoder
+
+
+def load_embedding_model(model_name: str, backend: str = EMBEDDING_BACKEND):
+    """Build the configured backend, falling back to torch if ONNX is unavailable."""
+    if backend == "onnx":
+        try:
+            encoder = OnnxSentenceEncoder()
+            logger.info(f"Loaded ONNX embedding backend ({EMBEDDING_ONNX_FILE})")
+            return encoder
+        except Exception as e:
+            logger.warning(f"ONNX embedding backend unavailable, falling back to torch: {e}")
+    encoder = _load_torch_encoder(model_name)
+    logger.info(f"Loaded torch embedding backend ({model_name})")
+    return encoder
+
+
+class LazyEmbeddingModel:
+    """Defers loading the embedding backend until first use or warmup()."""
+
+    def __init__(self, model_name: str, backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self._model = None
+        self._lock = threading.Lock()
+
+    def warmup(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    model = load_embedding_model(self.model_name, self.backend)
+                    model.encode(["warmup"], convert_to_numpy=True)
+                    self._model = model
+        return self._model
+
+    @property
+    def embedding_space(self) -> str:
+        """Backend and model the vectors come from (loads the model if needed)."""
+        return self.warmup().embedding_space
+
+    def encode(self, sentences, convert_to_numpy: bool = True):
+        return self.warmup().encode(sentences, convert_to_numpy=convert_to_numpy)
@@ -0,0 +1,119 @@
+"""
+Micro-batching front-end for the shared sentence embedding model.
+
+Concurrent encode() calls are collected for a short window and run through the
+model as one batched forward pass on the thread pool. Recent query embeddings
+are kept in an LRU, and identical queries already waiting in the current batch
+share a single slot.
+"""
+import asyncio
+import os
+import time
+
+import numpy as np
+from cachetools import LRUCache
+from prometheus_client import Counter, Histogram
+
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+
+EMBEDDING_BATCH_SIZE = Histogram(
+    "embedding_batch_size",
+    "Number of texts encoded per batched forward pass",
+    buckets=[1, 2, 4, 8, 16, 32, 64, 128]
+)
+EMBEDDING_QUEUE_WAIT = Histogram(
+    "embedding_queue_wait_seconds",
+    "Time an encode request waited before its batch started",
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+)
+EMBEDDING_CACHE_HITS = Counter(
+    "embedding_query_cache_hits_total",
+    "Query embeddings served from the LRU cache"
+)
+EMBEDDING_CACHE_MISSES = Counter(
+    "embedding_query_cache_misses_total",
+    "Query embeddings that had to be computed"
+)
+
+
+class EmbeddingBatcher:
+    def __init__(self, model, executor, window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch: int = EMBEDDING_MAX_BATCH, cache_size: int = EMBEDDING_CACHE_SIZE):
+        self.model = model
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._cache = LRUCache(maxsize=cache_size)
+        self._pending = {}  # text -> future, for texts queued but not yet encoded
+        self._queue = None
+        self._worker = None
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Return the embedding of a single text as a 1-D float32 vector."""
+        key = " ".join(text.split())
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            EMBEDDING_CACHE_HITS.inc()
+            return cached
+        EMBEDDING_CACHE_MISSES.inc()
+
+        future = self._pending.get(key)
+        if future is None:
+            self._ensure_worker()
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            await self._queue.put((key, future, time.perf_counter()))
+        # Shield so one cancelled caller does not cancel the shared result
+        return await asyncio.shield(future)
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _collect_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        embeddings = self.model.encode(texts, convert_to_numpy=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+
+            started = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                EMBEDDING_QUEUE_WAIT.observe(started - enqueued_at)
+            EMBEDDING_BATCH_SIZE.observe(len(batch))
+
+            texts = [text for text, _, _ in batch]
+            try:
+                embeddings = await loop.run_in_executor(self.executor, self._encode_batch, texts)
+            except Exception as e:
+                for text, future, _ in batch:
+                    self._pending.pop(text, None)
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for i, (text, future, _) in enumerate(batch):
+                self._cache[text] = embeddings[i]
+                self._pending.pop(text, None)
+                if not future.done():
+                    future.set_result(embeddings[i])
@@ -0,0 +1,134 @@
+"""
+Per-subtopic FAISS indexes for Explain chunks.
+
+Chunk embeddings are computed once at ingestion time and stored on
+Explain.chunk_embeddings as a float32 .npy blob, stamped with
+Explain.content_version, which hashes the chunks together with the embedding
+space (backend and model) that encoded them. At query time a ready FAISS index is served from a
+bounded LRU cache keyed by (subtopic_id, content_version), so a custom
+question only has to encode itself and search.
+
+This module has no package-relative imports so the ingestion scripts can use
+it as well as the routers.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Memory cap for cached indexes (flat L2 indexes are 4 bytes per dimension per chunk)
+EMBEDDING_INDEX_CACHE_MB = int(os.getenv("EMBEDDING_INDEX_CACHE_MB", "64"))
+
+INDEX_CACHE_HITS = Counter(
+    "embedding_index_cache_hits_total",
+    "Explain FAISS index cache hits"
+)
+INDEX_CACHE_MISSES = Counter(
+    "embedding_index_cache_misses_total",
+    "Explain FAISS index cache misses"
+)
+INDEX_CACHE_EVICTIONS = Counter(
+    "embedding_index_cache_evictions_total",
+    "Explain FAISS indexes evicted to stay under the memory cap"
+)
+INDEX_CACHE_BYTES = Gauge(
+    "embedding_index_cache_bytes",
+    "Approximate memory held by cached Explain FAISS indexes"
+)
+
+
+def chunks_version(chunks: list, embedding_space: str = None) -> str:
+    """
+    Content hash of an Explain chunk list, used as Explain.content_version.
+
+    Pass the encoder's embedding_space when the version stamps stored chunk
+    embeddings, so vectors from another backend or model never match it.
+    """
+    payload = json.dumps(chunks, ensure_ascii=False, separators=(",", ":"))
+    if embedding_space:
+        payload = f"{embedding_space}\n{payload}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def encode_chunks(model, chunks: list) -> np.ndarray:
+    """Encode chunk texts into a contiguous float32 matrix."""
+    embeddings = model.encode(list(chunks), convert_to_numpy=True)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def pack_embeddings(embeddings: np.ndarray) -> bytes:
+    """Serialize an embedding matrix for Explain.chunk_embeddings."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(embeddings, dtype=np.float32), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def unpack_embeddings(blob: bytes) -> np.ndarray:
+    """Inverse of pack_embeddings."""
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+
+def build_index(embeddings: np.ndarray):
+    import faiss  # imported on first use to keep it off the startup path
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    return index
+
+
+class FaissIndexCache:
+    """
+    Thread-safe LRU of FAISS indexes bounded by approximate memory use.
+
+    Only one version per subtopic is kept: storing a new content version drops
+    the old one. Re-indexing a subtopic (the ingestion scripts, in their own
+    processes) changes Explain.content_version, so the key is the only
+    invalidation needed.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (subtopic_id, version) -> (index, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, subtopic_id: int, version: str):
+        key = (subtopic_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                INDEX_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+        INDEX_CACHE_HITS.inc()
+        return entry[0]
+
+    def put(self, subtopic_id: int, version: str, index):
+        """Cache an index and return it (oversized indexes are returned uncached)."""
+        nbytes = index.ntotal * index.d * 4
+        if nbytes > self.max_bytes:
+            return index
+
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == subtopic_id]:
+                self._bytes -= self._entries.pop(key)[1]
+
+            self._entries[(subtopic_id, version)] = (index, nbytes)
+            self._bytes += nbytes
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                INDEX_CACHE_EVICTIONS.inc()
+
+            INDEX_CACHE_BYTES.set(self._bytes)
+        return index
+
+
+index_cache = FaissIndexCache(max_bytes=EMBEDDING_INDEX_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,44 @@
+"""
+Event-loop lag monitor.
+
+A background task sleeps for EVENT_LOOP_LAG_INTERVAL_SECONDS and records how
+much later than requested it woke up. Anything that blocks the loop (a
+synchronous database call, CPU work outside the executor) shows up directly
+in event_loop_lag_seconds, which loadtest_event_loop_lag.py reads back.
+"""
+import asyncio
+import os
+
+from prometheus_client import Histogram
+
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.1"))
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a timer",
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+
+_monitor = None
+
+
+async def _measure_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+def start_lag_monitor(interval: float = EVENT_LOOP_LAG_INTERVAL_SECONDS):
+    global _monitor
+    if _monitor is None:
+        _monitor = asyncio.get_running_loop().create_task(_measure_lag(interval))
+
+
+async def stop_lag_monitor():
+    global _monitor
+    if _monitor is not None:
+        _monitor.cancel()
+        await asyncio.gather(_monitor, return_exceptions=True)
+        _monitor = None
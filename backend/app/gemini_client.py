@@ -0,0 +1,128 @@
+"""
+Gemini calls on the SDK's native asyncio client.
+
+All generation is awaited on the event loop instead of being parked in a
+thread pool. Admission goes through the priority scheduler in llm_scheduler,
+which bounds concurrent calls per instance (GEMINI_MAX_CONCURRENCY) and keeps
+speculative pre-generation behind interactive requests. Every call has a
+timeout, and cancelling the awaiting task (e.g. when the client disconnects)
+cancels the HTTP request to Gemini.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from google import genai
+from google.genai import types
+from prometheus_client import Gauge, Histogram
+
+from .llm_scheduler import INTERACTIVE, llm_scheduler
+
+# Setup Gemini API globally
+api_key = os.getenv("GEMINI_API_KEY")
+if not api_key:
+    raise RuntimeError("Gemini API key not configured")
+
+# Create client
+client = genai.Client(api_key=api_key)
+MODEL = "gemini-2.5-flash"
+
+# Whole-call timeout for blocking calls, per-chunk idle timeout for streams
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+
+GEMINI_IN_FLIGHT = Gauge(
+    "gemini_requests_in_flight",
+    "Gemini calls currently holding a concurrency slot"
+)
+GEMINI_LATENCY = Histogram(
+    "gemini_request_latency_seconds",
+    "Gemini call latency (whole stream for streaming calls)",
+    ["mode"],
+    buckets=[0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0]
+)
+
+
+def build_gemini_request(prompt: str, system_instruction: str = "", temperature: float = 0.2, image: Optional[bytes] = None) -> tuple:
+    """
+    Build the contents list and generation config shared by the blocking and
+    streaming Gemini calls.
+    """
+    # Build contents list
+    contents = []
+
+    # Add image if provided
+    if image:
+        image_part = types.Part.from_bytes(
+            data=image,
+            mime_type="image/png"  # Diagrams are ingested as PNG files
+        )
+        contents.append(image_part)
+    # Add text prompt
+    contents.append(prompt)
+
+    config = types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=-1),
+        system_instruction=system_instruction,  # Move this OUTSIDE config
+        temperature=temperature
+    )
+    return contents, config
+
+
+async def generate_gemini_response(prompt: str, system_instruction: str = "", temperature: float = 0.2, image: Optional[bytes] = None,
+                                   priority: int = INTERACTIVE) -> str:
+    """
+    Generate response using Gemini API
+
+    Args:
+        prompt: The prompt to send to Gemini
+        temperature: Temperature setting for generation (default 0.2)
+        priority: llm_scheduler.INTERACTIVE or llm_scheduler.SPECULATIVE
+
+    Returns:
+        Generated text response
+
+    Raises:
+        asyncio.TimeoutError: if Gemini does not answer within GEMINI_TIMEOUT_SECONDS
+        llm_scheduler.JobDropped: if a speculative call was not admitted
+    """
+    contents, config = build_gemini_request(prompt, system_instruction, temperature, image)
+    async with llm_scheduler.slot(priority):
+        GEMINI_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                client.aio.models.generate_content(model=MODEL, contents=contents, config=config),
+                timeout=GEMINI_TIMEOUT_SECONDS
+            )
+        finally:
+            GEMINI_IN_FLIGHT.dec()
+            GEMINI_LATENCY.labels(mode="blocking").observe(time.perf_counter() - start)
+    return response.text.strip()
+
+
+async def stream_gemini_response(prompt: str, system_instruction: str = "", temperature: float = 0.2, image: Optional[bytes] = None):
+    """
+    Stream a Gemini response, yielding markdown text deltas as they arrive.
+    Chunks that carry no text (e.g. thinking-only chunks) are skipped.
+    """
+    contents, config = build_gemini_request(prompt, system_instruction, temperature, image)
+    async with llm_scheduler.slot(INTERACTIVE):
+        GEMINI_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            stream = await asyncio.wait_for(
+                client.aio.models.generate_content_stream(model=MODEL, contents=contents, config=config),
+                timeout=GEMINI_TIMEOUT_SECONDS
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=GEMINI_TIMEOUT_SECONDS)
+                except StopAsyncIteration:
+                    break
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            GEMINI_IN_FLIGHT.dec()
+            GEMINI_LATENCY.labels(mode="stream").observe(time.perf_counter() - start)
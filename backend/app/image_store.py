@@ -0,0 +1,114 @@
+"""
+Content-addressed image store.
+
+Diagrams and facial expressions are identified by the SHA-256 of their bytes
+(content_sha256, set at ingestion) and served from /assets/{sha256}, so API
+responses carry a short reference instead of an inline base64 blob and the
+browser can cache each image forever. Bytes are read once per worker and kept
+in an LRU bounded by IMAGE_CACHE_MB; since an asset can never change under its
+hash, nothing here needs invalidating.
+
+Facial expressions are a small, static set: load_expression_pool() reads them
+once at startup into a pool of references grouped by expression (with their
+bytes pre-warmed in the LRU), and random_expression() picks from it without
+touching the database.
+"""
+import hashlib
+import os
+import random
+from typing import Optional
+
+from cachetools import LRUCache
+from prometheus_client import Counter
+from sqlalchemy import select
+
+from .database.models import Diagram, FacialExpression
+
+IMAGE_CACHE_MB = int(os.getenv("IMAGE_CACHE_MB", "64"))
+ASSET_PREFIX = "/assets/"
+
+IMAGE_CACHE_LOOKUPS = Counter(
+    "image_cache_lookups_total",
+    "Image lookups served from memory (hit) or the database (miss)",
+    ["result"]
+)
+
+# sha256 -> image bytes
+_assets = LRUCache(maxsize=IMAGE_CACHE_MB * 1024 * 1024, getsizeof=len)
+# diagram_id -> sha256
+_diagram_hashes = LRUCache(maxsize=100000)
+# facial_expression -> [asset reference]
+_expressions = {}
+
+
+def content_sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def asset_ref(sha256: Optional[str]) -> Optional[str]:
+    """URL path of an asset, relative to the API base URL."""
+    return f"{ASSET_PREFIX}{sha256}" if sha256 else None
+
+
+async def get_diagram_ref(db, diagram_id: Optional[int]) -> Optional[str]:
+    """Asset reference of a diagram, or None."""
+    if diagram_id is None:
+        return None
+    sha256 = _diagram_hashes.get(diagram_id)
+    if sha256 is None:
+        result = await db.execute(select(Diagram.content_sha256).filter(Diagram.id == diagram_id))
+        sha256 = result.scalar_one_or_none()
+        if sha256 is None:
+            return None
+        _diagram_hashes[diagram_id] = sha256
+    return asset_ref(sha256)
+
+
+async def get_asset(db, sha256: str) -> Optional[bytes]:
+    """Bytes of the diagram or facial expression with this hash, or None."""
+    content = _assets.get(sha256)
+    if content is not None:
+        IMAGE_CACHE_LOOKUPS.labels(result="hit").inc()
+        return content
+
+    IMAGE_CACHE_LOOKUPS.labels(result="miss").inc()
+    for column, key in ((Diagram.image_content, Diagram.content_sha256),
+                        (FacialExpression.image, FacialExpression.content_sha256)):
+        result = await db.execute(select(column).filter(key == sha256).limit(1))
+        content = result.scalar_one_or_none()
+        if content:
+            break
+    else:
+        return None
+    if len(content) <= _assets.maxsize:
+        _assets[sha256] = content
+    return content
+
+
+async def get_asset_for_ref(db, ref: Optional[str]) -> Optional[bytes]:
+    """Bytes behind an asset reference returned by get_diagram_ref()."""
+    if not ref or not ref.startswith(ASSET_PREFIX):
+        return None
+    return await get_asset(db, ref[len(ASSET_PREFIX):])
+
+
+async def load_expression_pool(db):
+    """Load every facial expression into the in-memory pool (called at startup)."""
+    result = await db.execute(
+        select(FacialExpression.facial_expression, FacialExpression.content_sha256, FacialExpression.image)
+    )
+    pool = {}
+    for expression, sha256, image in result.all():
+        sha256 = sha256 or content_sha256(image)
+        pool.setdefault(expression, []).append(asset_ref(sha256))
+        if len(image) <= _assets.maxsize:
+            _assets[sha256] = image
+    _expressions.clear()
+    _expressions.update(pool)
+    print(f"✅ Loaded {sum(len(refs) for refs in pool.values())} facial expressions into the image pool")
+
+
+def random_expression(expressions) -> Optional[str]:
+    """Asset reference of a random image showing one of the given expressions, or None."""
+    refs = [ref for expression in expressions for ref in _expressions.get(expression, ())]
+    return random.choice(refs) if refs else None
@@ -0,0 +1,31 @@
+from database.session import SessionLocal
+from database.models import Explain, Diagram
+from chunk_diagrams import resolve_chunk_diagrams
+
+def backfill_chunk_diagrams():
+    """
+    Resolve Explain.chunk_diagrams for every Explain row. Run after adding
+    diagrams to an existing subtopic, or once for rows ingested before the
+    map existed.
+    """
+    db = SessionLocal()
+    try:
+        for explain in db.query(Explain).all():
+            if not explain.chunks:
+                print(f"Explain {explain.id} has no chunks. Skipping.")
+                continue
+
+            diagrams = db.query(Diagram.id, Diagram.description).filter(
+                Diagram.subtopic_id == explain.subtopic_id
+            ).all()
+            explain.chunk_diagrams = resolve_chunk_diagrams(explain.chunks, diagrams)
+            db.commit()
+            print(f"Mapped {len(explain.chunk_diagrams)} chunks to diagrams for subtopic {explain.subtopic_id}")
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    backfill_chunk_diagrams()
@@ -0,0 +1,36 @@
+from database.session import SessionLocal
+from database.models import Explain
+from embedding_backend import load_embedding_model
+from embedding_index import EMBEDDING_MODEL_NAME, chunks_version, encode_chunks, pack_embeddings
+
+def backfill_chunk_embeddings():
+    """
+    Compute content_version and chunk_embeddings for Explain rows that were
+    ingested before embeddings were persisted, or whose chunks or embedding
+    backend have changed since.
+    """
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    db = SessionLocal()
+    try:
+        for explain in db.query(Explain).all():
+            if not explain.chunks:
+                print(f"Explain {explain.id} has no chunks. Skipping.")
+                continue
+
+            version = chunks_version(explain.chunks, model.embedding_space)
+            if explain.content_version == version and explain.chunk_embeddings:
+                print(f"Explain {explain.id} is up to date. Skipping.")
+                continue
+
+            explain.content_version = version
+            explain.chunk_embeddings = pack_embeddings(encode_chunks(model, explain.chunks))
+            db.commit()
+            print(f"Stored {len(explain.chunks)} chunk embeddings for subtopic {explain.subtopic_id}")
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    backfill_chunk_embeddings()
@@ -1,6 +1,9 @@
 import json
 from database.session import SessionLocal
-from database.models import Subtopic, Explain
+from database.models import Subtopic, Explain, SharedResponse, Diagram
+from embedding_backend import load_embedding_model
+from embedding_index import EMBEDDING_MODEL_NAME, chunks_version, encode_chunks, pack_embeddings, unpack_embeddings
+from chunk_diagrams import resolve_chunk_diagrams
 
 json_file_name = "chunk.json"
 subtopic_name = "Number"
@@ -17,16 +20,9 @@ def insert_chunk_to_subtopic():
         print("Invalid JSON format in set_latex_image.json.")
         return
 
-    # # Load index vectors from JSON file
-    # try:
-    #     with open('set_latex_index.json', 'r') as f:
-    #         index_vectors = json.load(f)
-    # except FileNotFoundError:
-    #     print("set_latex_index.json not found. Please place it in the working directory.")
-    #     return
-    # except json.JSONDecodeError:
-    #     print("Invalid JSON format in set_latex_index.json.")
-    #     return
+    # Compute chunk embeddings once, at ingestion time
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    chunk_embeddings = pack_embeddings(encode_chunks(model, chunks))
 
     db = SessionLocal()
     try:
@@ -44,24 +40,37 @@ def insert_chunk_to_subtopic():
             db.commit()
             print(f"Deleted existing Explain entry for subtopic: {subtopic.name}")
 
+        # Resolve each chunk's diagram once, here, instead of on every request
+        diagrams = db.query(Diagram.id, Diagram.description).filter(Diagram.subtopic_id == subtopic.id).all()
+
         # Create new Explain entry
         explain = Explain(
             subtopic_id=subtopic.id,
             chunks=chunks,
-            # index_faiss_embedding=index_vectors
+            content_version=chunks_version(chunks, model.embedding_space),
+            chunk_embeddings=chunk_embeddings,
+            chunk_diagrams=resolve_chunk_diagrams(chunks, diagrams)
         )
         db.add(explain)
         db.commit()
         db.refresh(explain)
         print(f"Inserted new Explain entry for subtopic: {subtopic.name}")
 
+        # Shared answers generated from the old chunks can no longer be served
+        db.query(SharedResponse).filter(
+            SharedResponse.subtopic_id == subtopic.id,
+            SharedResponse.content_version != explain.content_version
+        ).delete(synchronize_session=False)
+        db.commit()
+
         # Verify the explains relationship
         subtopic = db.query(Subtopic).filter(Subtopic.name == subtopic_name).first()
         print(f"Subtopic: {subtopic.name}")
         print(f"Explains: {[e.chunks for e in subtopic.explains]}")
         if subtopic.explains:
             print(f"First Explain's Subtopic: {subtopic.explains[0].subtopic.name}")
-            print(f"First Explain's Index (first 5 values of first vector): {subtopic.explains[0].index_faiss_embedding[0][:5] if subtopic.explains[0].index_faiss_embedding else None}")
+            first_embeddings = subtopic.explains[0].chunk_embeddings
+            print(f"First Explain's embeddings shape: {unpack_embeddings(first_embeddings).shape if first_embeddings else None}")
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
@@ -1,9 +1,17 @@
 import re
 import json
 import os
+import hashlib
 from sqlalchemy.orm import Session
 from database.session import SessionLocal
-from database.models import Subject, Topic, Subtopic, Explain, Diagram
+from database.models import Subject, Topic, Subtopic, Explain, Diagram, SharedResponse
+from embedding_backend import load_embedding_model
+from embedding_index import EMBEDDING_MODEL_NAME, chunks_version, encode_chunks, pack_embeddings
+from chunk_diagrams import resolve_chunk_diagrams
+
+# Chunk embeddings are computed here once so queries never re-encode chunks.
+# Use the same backend as the server so stored and query vectors match.
+model = load_embedding_model(EMBEDDING_MODEL_NAME)
 
 def extract_latex_parts(latex_content):
     """
@@ -76,7 +84,8 @@ def add_images_to_diagrams(db: Session, subtopic: Subtopic, image_folder: str):
         new_diagram = Diagram(
             subtopic_id=subtopic.id,
             description=description,
-            image_content=image_content
+            image_content=image_content,
+            content_sha256=hashlib.sha256(image_content).hexdigest()
         )
         db.add(new_diagram)
         print(f"Added image '{image_filename}' to subtopic '{subtopic.name}' with description '{description}'.")
@@ -160,18 +169,29 @@ def process_latex_file(latex_file_path: str, image_folder: str, subject_name: st
                 db.commit()
                 print(f"Deleted existing Explain entry for subtopic: {subtopic_name}")
 
+            # Process images first so each chunk's diagram can be resolved now, not per request
+            add_images_to_diagrams(db, subtopic, image_folder)
+            diagrams = db.query(Diagram.id, Diagram.description).filter(Diagram.subtopic_id == subtopic.id).all()
+
             # Create new Explain entry
             explain = Explain(
                 subtopic_id=subtopic.id,
-                chunks=chunks
+                chunks=chunks,
+                content_version=chunks_version(chunks, model.embedding_space),
+                chunk_embeddings=pack_embeddings(encode_chunks(model, chunks)),
+                chunk_diagrams=resolve_chunk_diagrams(chunks, diagrams)
             )
             db.add(explain)
             db.commit()
             db.refresh(explain)
             print(f"Inserted new Explain entry for subtopic: {subtopic_name}")
 
-            # Process images
-            add_images_to_diagrams(db, subtopic, image_folder)
+            # Shared answers generated from the old chunks can no longer be served
+            db.query(SharedResponse).filter(
+                SharedResponse.subtopic_id == subtopic.id,
+                SharedResponse.content_version != explain.content_version
+            ).delete(synchronize_session=False)
+            db.commit()
 
     except Exception as e:
         print(f"Error processing {latex_file_path}: {str(e)}")
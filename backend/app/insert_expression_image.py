@@ -1,4 +1,5 @@
 import os
+import hashlib
 from sqlalchemy.orm import Session
 from database.session import SessionLocal
 from database.models import FacialExpression
@@ -50,7 +51,8 @@ def populate_facial_expressions(folder_path: str):
                     facial_expression = FacialExpression(
                         name=character_name,
                         facial_expression=expression,
-                        image=image_data
+                        image=image_data,
+                        content_sha256=hashlib.sha256(image_data).hexdigest()
                     )
 
                     # Add to session
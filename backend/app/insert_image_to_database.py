@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from database.models import Subtopic, Diagram
 from database.session import SessionLocal
 import os
+import hashlib
 
 def add_images_to_diagrams(db: Session, subtopic_name: str, image_folder: str = "images"):
     """
@@ -56,7 +57,8 @@ def add_images_to_diagrams(db: Session, subtopic_name: str, image_folder: str =
         new_diagram = Diagram(
             subtopic_id=subtopic.id,
             description=description,
-            image_content=image_content
+            image_content=image_content,
+            content_sha256=hashlib.sha256(image_content).hexdigest()
         )
 
         # Step 8: Add to database
@@ -83,8 +83,23 @@ def insert_data(db, data):
                             "subtopic_id": subtopic.id
                         }
                         db.add(MCQ(**mcq_data))
+                        # Running servers reload this subtopic's question bank on the next request
+                        db.query(Subtopic).filter(Subtopic.id == subtopic.id).update(
+                            {Subtopic.question_bank_version: Subtopic.question_bank_version + 1},
+                            synchronize_session=False
+                        )
                         db.commit()
                         print(f"Inserted new MCQ: {mcq['question']}")
+                    elif (existing_mcq.explanation, existing_mcq.hardness_level) != (mcq["explanation"], mcq["hardness_level"]):
+                        # Update the edited MCQ; bumping the version drops the cached copies in running servers
+                        existing_mcq.explanation = mcq["explanation"]
+                        existing_mcq.hardness_level = mcq["hardness_level"]
+                        db.query(Subtopic).filter(Subtopic.id == existing_mcq.subtopic_id).update(
+                            {Subtopic.question_bank_version: Subtopic.question_bank_version + 1},
+                            synchronize_session=False
+                        )
+                        db.commit()
+                        print(f"Updated MCQ: {mcq['question']}")
                     else:
                         print(f"MCQ already exists: {mcq['question']}")
 
@@ -0,0 +1,147 @@
+"""
+In-process admission control for LLM calls with priority classes.
+
+INTERACTIVE work (a student waiting on /explains/) is always admitted ahead of
+SPECULATIVE work (pre-generation). Speculative jobs may only occupy part of
+the concurrency budget, and they are dropped rather than queued without bound:
+when the speculative queue is full, or when a job has waited longer than
+LLM_SPECULATIVE_MAX_WAIT_SECONDS for a slot.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+INTERACTIVE = 0
+SPECULATIVE = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", SPECULATIVE: "speculative"}
+
+LLM_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "200"))
+LLM_MAX_SPECULATIVE_RUNNING = int(os.getenv("LLM_MAX_SPECULATIVE_RUNNING", str(max(1, LLM_MAX_CONCURRENCY // 2))))
+LLM_MAX_SPECULATIVE_QUEUE = int(os.getenv("LLM_MAX_SPECULATIVE_QUEUE", "100"))
+LLM_SPECULATIVE_MAX_WAIT_SECONDS = float(os.getenv("LLM_SPECULATIVE_MAX_WAIT_SECONDS", "30"))
+
+LLM_QUEUE_DEPTH = Gauge(
+    "llm_scheduler_queue_depth",
+    "LLM jobs waiting for a slot",
+    ["priority"]
+)
+LLM_RUNNING = Gauge(
+    "llm_scheduler_running",
+    "LLM jobs holding a slot",
+    ["priority"]
+)
+LLM_QUEUE_WAIT = Histogram(
+    "llm_scheduler_wait_seconds",
+    "Time an LLM job waited for a slot",
+    ["priority"],
+    buckets=[0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+LLM_DROPPED = Counter(
+    "llm_scheduler_dropped_total",
+    "Speculative LLM jobs dropped instead of run",
+    ["reason"]
+)
+
+
+class JobDropped(Exception):
+    """Raised to a speculative job that was not admitted."""
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_speculative_running: int = LLM_MAX_SPECULATIVE_RUNNING,
+                 max_speculative_queue: int = LLM_MAX_SPECULATIVE_QUEUE,
+                 speculative_max_wait: float = LLM_SPECULATIVE_MAX_WAIT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.max_speculative_running = max_speculative_running
+        self.max_speculative_queue = max_speculative_queue
+        self.speculative_max_wait = speculative_max_wait
+        self._running = {INTERACTIVE: 0, SPECULATIVE: 0}
+        self._waiters = {INTERACTIVE: deque(), SPECULATIVE: deque()}
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        """Hold one LLM slot for the duration of the block."""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def _has_capacity(self, priority: int) -> bool:
+        if sum(self._running.values()) >= self.max_concurrency:
+            return False
+        return priority == INTERACTIVE or self._running[SPECULATIVE] < self.max_speculative_running
+
+    def _can_start_now(self, priority: int) -> bool:
+        # Never overtake waiting jobs of the same or a higher priority
+        if self._waiters[INTERACTIVE]:
+            return False
+        if priority == SPECULATIVE and self._waiters[SPECULATIVE]:
+            return False
+        return self._has_capacity(priority)
+
+    def _start(self, priority: int):
+        self._running[priority] += 1
+        LLM_RUNNING.labels(priority=PRIORITY_NAMES[priority]).set(self._running[priority])
+
+    def _update_depth(self, priority: int):
+        LLM_QUEUE_DEPTH.labels(priority=PRIORITY_NAMES[priority]).set(len(self._waiters[priority]))
+
+    async def _acquire(self, priority: int):
+        name = PRIORITY_NAMES[priority]
+        if self._can_start_now(priority):
+            self._start(priority)
+            LLM_QUEUE_WAIT.labels(priority=name).observe(0)
+            return
+
+        if priority == SPECULATIVE and len(self._waiters[SPECULATIVE]) >= self.max_speculative_queue:
+            LLM_DROPPED.labels(reason="queue_full").inc()
+            raise JobDropped("speculative queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        self._update_depth(priority)
+        enqueued_at = time.perf_counter()
+        timeout = self.speculative_max_wait if priority == SPECULATIVE else None
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we gave up: hand it back
+                self._release(priority)
+            else:
+                future.cancel()
+                self._waiters[priority].remove(future)
+                self._update_depth(priority)
+            if isinstance(e, asyncio.TimeoutError):
+                LLM_DROPPED.labels(reason="wait_timeout").inc()
+                raise JobDropped("speculative job waited too long for a slot")
+            raise
+        LLM_QUEUE_WAIT.labels(priority=name).observe(time.perf_counter() - enqueued_at)
+
+    def _release(self, priority: int):
+        self._running[priority] -= 1
+        LLM_RUNNING.labels(priority=PRIORITY_NAMES[priority]).set(self._running[priority])
+        self._dispatch()
+
+    def _dispatch(self):
+        for priority in (INTERACTIVE, SPECULATIVE):
+            waiters = self._waiters[priority]
+            while waiters and self._has_capacity(priority):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._start(priority)
+                future.set_result(None)
+            self._update_depth(priority)
+            if waiters:
+                # Lower priorities wait until this class is drained
+                return
+
+
+llm_scheduler = LLMScheduler()
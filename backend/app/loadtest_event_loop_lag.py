@@ -0,0 +1,97 @@
+"""
+Load test for event-loop lag under mixed quiz and explain traffic.
+
+Runs three phases against a running server and reports the
+event_loop_lag_seconds histogram (event_loop_lag.py) accumulated during each:
+idle, explain streams only, and explain streams mixed with quiz and dashboard
+requests. With every router on the async engine the mixed phase should stay
+as flat as the explain-only phase. Run a single worker so every request
+shares one loop, then from the app directory:
+
+    LOADTEST_TOKEN=<jwt> LOADTEST_USER_ID=<id> python loadtest_event_loop_lag.py maths algebra "linear equations"
+"""
+import asyncio
+import os
+import sys
+import time
+from urllib.parse import quote
+
+import httpx
+
+BASE_URL = os.getenv("LOADTEST_BASE_URL", "http://localhost:8000")
+TOKEN = os.getenv("LOADTEST_TOKEN", "")
+USER_ID = os.getenv("LOADTEST_USER_ID", "1")
+PHASE_SECONDS = float(os.getenv("LOADTEST_PHASE_SECONDS", "30"))
+EXPLAIN_CLIENTS = int(os.getenv("LOADTEST_EXPLAIN_CLIENTS", "10"))
+QUIZ_CLIENTS = int(os.getenv("LOADTEST_QUIZ_CLIENTS", "40"))
+
+
+async def read_lag_histogram(client: httpx.AsyncClient) -> dict:
+    """Cumulative bucket counts of event_loop_lag_seconds, keyed by upper bound."""
+    text = (await client.get(f"{BASE_URL}/metrics/")).text
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith("event_loop_lag_seconds_bucket"):
+            le = line.split('le="')[1].split('"')[0]
+            buckets[float(le)] = float(line.rsplit(" ", 1)[1])
+    return buckets
+
+
+def quantile(before: dict, after: dict, q: float) -> float:
+    """Upper bound of the bucket holding quantile q of the observations in between."""
+    deltas = sorted((le, after[le] - before.get(le, 0)) for le in after)
+    total = deltas[-1][1]
+    if not total:
+        return 0.0
+    for le, count in deltas:
+        if count >= q * total:
+            return le
+    return float("inf")
+
+
+async def explain_client(client: httpx.AsyncClient, path: str, headers: dict, deadline: float):
+    while time.monotonic() < deadline:
+        async with client.stream("POST", f"{BASE_URL}{path}/explains/stream/", headers=headers,
+                                 json={"query": "explain", "is_initial": False}) as response:
+            async for _ in response.aiter_bytes():
+                pass
+
+
+async def quiz_client(client: httpx.AsyncClient, path: str, dashboard: str, headers: dict, deadline: float):
+    while time.monotonic() < deadline:
+        await client.post(f"{BASE_URL}{path}/quiz/", headers=headers)
+        await client.get(f"{BASE_URL}{dashboard}", headers=headers)
+
+
+async def run_phase(client: httpx.AsyncClient, name: str, tasks) -> None:
+    before = await read_lag_histogram(client)
+    await asyncio.gather(*tasks)
+    after = await read_lag_histogram(client)
+    print(f"{name:<16}{quantile(before, after, 0.5) * 1000:>10.1f}{quantile(before, after, 0.99) * 1000:>10.1f}"
+          f"{quantile(before, after, 1.0) * 1000:>10.1f}")
+
+
+async def main(subject: str, topic: str, subtopic: str):
+    path = "/" + "/".join(quote(part) for part in (subject, topic, subtopic))
+    dashboard = f"/dashboard/{quote(subject)}/{quote(topic)}/"
+    headers = {"Authorization": f"Bearer {TOKEN}", "user-id": USER_ID}
+
+    async with httpx.AsyncClient(timeout=None) as client:
+        print(f"{'lag (ms)':<16}{'p50':>10}{'p99':>10}{'max':>10}")
+
+        await run_phase(client, "idle", [asyncio.sleep(PHASE_SECONDS)])
+
+        deadline = time.monotonic() + PHASE_SECONDS
+        await run_phase(client, "explain", [explain_client(client, path, headers, deadline)
+                                            for _ in range(EXPLAIN_CLIENTS)])
+
+        deadline = time.monotonic() + PHASE_SECONDS
+        await run_phase(client, "explain + quiz",
+                        [explain_client(client, path, headers, deadline) for _ in range(EXPLAIN_CLIENTS)] +
+                        [quiz_client(client, path, dashboard, headers, deadline) for _ in range(QUIZ_CLIENTS)])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        sys.exit(__doc__)
+    asyncio.run(main(*sys.argv[1:]))
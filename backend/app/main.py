@@ -19,6 +19,7 @@ from .router.dashboard import router as dashboard_router
 from .router.explain import router as explains_router
 from .router.revise import router as revise_router 
 from .router.user_interactions import router as interactions_router 
+from .router.assets import router as assets_router
 from fastapi import Request
 from starlette.middleware.sessions import SessionMiddleware
 
@@ -31,8 +32,10 @@ from fastapi.middleware.cors import CORSMiddleware
 
 
 from .database.models import Subject, Topic, Subtopic, User, Explain
-import faiss
-from sentence_transformers import SentenceTransformer
+from .router.explain import model as embedding_model, executor, AsyncSessionLocal, pre_generate_continue_response
+from .pregeneration_queue import start_pregeneration_workers, stop_pregeneration_workers
+from .image_store import load_expression_pool
+from .event_loop_lag import start_lag_monitor, stop_lag_monitor
 from pylatexenc.latex2text import LatexNodes2Text
 
 from jose import jwt
@@ -44,6 +47,7 @@ import requests
 import base64  # Add this import for base64 encoding
 import json 
 import time 
+import asyncio
 
 
 # BEFORE - Add these imports
@@ -454,10 +458,45 @@ app.include_router(dashboard_router)
 app.include_router(explains_router)
 app.include_router(revise_router)
 app.include_router(interactions_router)
+app.include_router(assets_router)
 
 # @app.on_event("startup")
 # async def startup_event():
 #     Base.metadata.create_all(bind=engine)
+
+# Load the embedding model in the background so startup is not blocked;
+# a request that needs it before warmup finishes simply waits for the load.
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "1") == "1"
+
+@app.on_event("startup")
+async def warmup_embedding_model():
+    if EMBEDDING_WARMUP:
+        asyncio.get_event_loop().run_in_executor(executor, embedding_model.warmup)
+
+# Facial expressions shown on quiz screens are served from memory
+@app.on_event("startup")
+async def load_expressions():
+    async with AsyncSessionLocal() as db:
+        await load_expression_pool(db)
+
+# Workers that drain the pre-generation job table (see pregeneration_queue.py)
+@app.on_event("startup")
+async def start_pregeneration():
+    start_pregeneration_workers(AsyncSessionLocal, pre_generate_continue_response)
+
+@app.on_event("shutdown")
+async def stop_pregeneration():
+    await stop_pregeneration_workers()
+
+# Event-loop lag histogram (see event_loop_lag.py)
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    start_lag_monitor()
+
+@app.on_event("shutdown")
+async def stop_event_loop_monitor():
+    await stop_lag_monitor()
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
@@ -0,0 +1,227 @@
+# migrate_db.py
+# create_all() in main.py only creates missing tables, so columns added to
+# existing tables are applied here. Every statement is idempotent.
+import sys
+
+from sqlalchemy import text
+from database.session import Base, engine
+import database.models  # noqa: F401 - registers the tables with Base
+
+# UserProgress.chat_memory: copy the pairs of progress rows that have no
+# chat_turns yet (seq ends at turn_count, backfilled from the array length)
+CHAT_MEMORY_BACKFILL = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'user_progress' AND column_name = 'chat_memory') THEN
+        UPDATE user_progress SET turn_count = jsonb_array_length(chat_memory)
+        WHERE turn_count = 0 AND jsonb_array_length(chat_memory) > 0;
+
+        INSERT INTO chat_turns (user_id, subtopic_id, seq, question, answer)
+        SELECT p.user_id, p.subtopic_id,
+               p.turn_count - jsonb_array_length(p.chat_memory) + t.ord,
+               COALESCE(t.pair->>'question', ''), COALESCE(t.pair->>'answer', '')
+        FROM user_progress p
+        CROSS JOIN LATERAL jsonb_array_elements(p.chat_memory) WITH ORDINALITY AS t(pair, ord)
+        WHERE NOT EXISTS (SELECT 1 FROM chat_turns c
+                          WHERE c.user_id = p.user_id AND c.subtopic_id = p.subtopic_id)
+        ON CONFLICT ON CONSTRAINT uq_chat_turns_seq DO NOTHING;
+    END IF;
+END $$
+"""
+
+MIGRATIONS = [
+    # Explain: persisted chunk embeddings stamped with a content hash
+    "ALTER TABLE explains ADD COLUMN IF NOT EXISTS content_version VARCHAR(64)",
+    "ALTER TABLE explains ADD COLUMN IF NOT EXISTS chunk_embeddings BYTEA",
+    # Explain: chunk -> diagram map resolved at ingestion (backfill: insert_chunk_diagrams.py)
+    "ALTER TABLE explains ADD COLUMN IF NOT EXISTS chunk_diagrams JSONB",
+    # Explain: bumped to drop the subtopic's semantic cache answers on every instance
+    "ALTER TABLE explains ADD COLUMN IF NOT EXISTS semantic_cache_version INTEGER NOT NULL DEFAULT 0",
+    # Subtopic: MCQ bank version for the in-memory question bank
+    "ALTER TABLE subtopics ADD COLUMN IF NOT EXISTS question_bank_version INTEGER NOT NULL DEFAULT 0",
+    # Attempts: per-attempt question deck (question_bank.py); older attempts are dealt one lazily
+    "ALTER TABLE quiz_attempts ADD COLUMN IF NOT EXISTS deck JSONB",
+    "ALTER TABLE quiz1_attempts ADD COLUMN IF NOT EXISTS deck JSONB",
+    "ALTER TABLE practise_attempts ADD COLUMN IF NOT EXISTS deck JSONB",
+    # Attempts: running answer counters (record_answer in router/quizzes.py),
+    # added and backfilled from the answers once
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'quiz_attempts' AND column_name = 'questions_tried') THEN
+            ALTER TABLE quiz_attempts
+                ADD COLUMN questions_tried INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN quiz2_correct INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN quiz3_correct INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN last_hardness_level INTEGER,
+                ADD COLUMN total_response_time DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+            UPDATE quiz_attempts a
+            SET questions_tried = s.tried, quiz2_correct = s.quiz2_correct, quiz3_correct = s.quiz3_correct,
+                last_hardness_level = s.last_hardness_level, total_response_time = s.total_response_time
+            FROM (
+                SELECT qa.attempt_id, count(*) AS tried,
+                       count(*) FILTER (WHERE qa.quiz_type = 'quiz2' AND qa.is_correct) AS quiz2_correct,
+                       count(*) FILTER (WHERE qa.quiz_type = 'quiz3' AND qa.is_correct) AS quiz3_correct,
+                       (array_agg(m.hardness_level ORDER BY qa.id DESC))[1] AS last_hardness_level,
+                       COALESCE(sum(qa.response_time), 0) AS total_response_time
+                FROM quiz_answers qa LEFT JOIN mcqs m ON m.id = qa.question_id
+                GROUP BY qa.attempt_id
+            ) s
+            WHERE a.id = s.attempt_id;
+        END IF;
+
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'quiz1_attempts' AND column_name = 'questions_tried') THEN
+            ALTER TABLE quiz1_attempts
+                ADD COLUMN questions_tried INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN total_correct INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN last_hardness_level INTEGER,
+                ADD COLUMN total_response_time DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+            UPDATE quiz1_attempts a
+            SET questions_tried = s.tried, total_correct = s.total_correct,
+                last_hardness_level = s.last_hardness_level, total_response_time = s.total_response_time
+            FROM (
+                SELECT attempt_id, count(*) AS tried,
+                       count(*) FILTER (WHERE is_correct) AS total_correct,
+                       (array_agg(hardness_level ORDER BY id DESC))[1] AS last_hardness_level,
+                       COALESCE(sum(response_time), 0) AS total_response_time
+                FROM quiz1s
+                GROUP BY attempt_id
+            ) s
+            WHERE a.id = s.attempt_id;
+        END IF;
+
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'practise_attempts' AND column_name = 'questions_tried') THEN
+            ALTER TABLE practise_attempts
+                ADD COLUMN questions_tried INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN total_correct INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN last_hardness_level INTEGER,
+                ADD COLUMN total_response_time DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+            UPDATE practise_attempts a
+            SET questions_tried = s.tried, total_correct = s.total_correct,
+                last_hardness_level = s.last_hardness_level, total_response_time = s.total_response_time
+            FROM (
+                SELECT pa.attempt_id, count(*) AS tried,
+                       count(*) FILTER (WHERE pa.is_correct) AS total_correct,
+                       (array_agg(m.hardness_level ORDER BY pa.id DESC))[1] AS last_hardness_level,
+                       COALESCE(sum(pa.response_time), 0) AS total_response_time
+                FROM practise_answers pa LEFT JOIN mcqs m ON m.id = pa.question_id
+                GROUP BY pa.attempt_id
+            ) s
+            WHERE a.id = s.attempt_id;
+        END IF;
+    END $$
+    """,
+    # user_subtopic_mastery: no score yet (NULL) for a latest attempt without a score row
+    "ALTER TABLE user_subtopic_mastery ALTER COLUMN total_correct DROP NOT NULL",
+    "ALTER TABLE user_subtopic_mastery ALTER COLUMN completion_percentage DROP NOT NULL",
+    # user_subtopic_mastery: backfill from the latest completed quiz attempt per
+    # user and subtopic (as the dashboard used to compute it: an attempt without
+    # a score row shadows older ones and shows as not taken)
+    """
+    INSERT INTO user_subtopic_mastery (user_id, subtopic_id, attempt_id, total_correct, completion_percentage, completed_at)
+    SELECT latest.user_id, latest.subtopic_id, latest.id, s.total_correct,
+           CASE WHEN s.total_correct * 10.0 >= 75 THEN 100 ELSE s.total_correct * 10.0 END,
+           latest.completed_at
+    FROM (
+        SELECT DISTINCT ON (user_id, subtopic_id) id, user_id, subtopic_id, completed_at
+        FROM quiz_attempts
+        WHERE completed_at IS NOT NULL AND user_id IS NOT NULL
+        ORDER BY user_id, subtopic_id, completed_at DESC
+    ) latest
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(total_correct, 0) AS total_correct FROM quiz_scores
+        WHERE attempt_id = latest.id ORDER BY id LIMIT 1
+    ) s ON TRUE
+    ON CONFLICT ON CONSTRAINT uq_user_subtopic_mastery DO NOTHING
+    """,
+    # Attempts: correctness of the last answer, for resuming at the next level
+    "ALTER TABLE quiz_attempts ADD COLUMN IF NOT EXISTS last_is_correct BOOLEAN",
+    """
+    UPDATE quiz_attempts a SET last_is_correct = s.is_correct
+    FROM (SELECT DISTINCT ON (attempt_id) attempt_id, is_correct FROM quiz_answers ORDER BY attempt_id, id DESC) s
+    WHERE a.id = s.attempt_id AND a.last_is_correct IS NULL
+    """,
+    "ALTER TABLE quiz1_attempts ADD COLUMN IF NOT EXISTS last_is_correct BOOLEAN",
+    """
+    UPDATE quiz1_attempts a SET last_is_correct = s.is_correct
+    FROM (SELECT DISTINCT ON (attempt_id) attempt_id, is_correct FROM quiz1s ORDER BY attempt_id, id DESC) s
+    WHERE a.id = s.attempt_id AND a.last_is_correct IS NULL
+    """,
+    "ALTER TABLE practise_attempts ADD COLUMN IF NOT EXISTS last_is_correct BOOLEAN",
+    """
+    UPDATE practise_attempts a SET last_is_correct = s.is_correct
+    FROM (SELECT DISTINCT ON (attempt_id) attempt_id, is_correct FROM practise_answers ORDER BY attempt_id, id DESC) s
+    WHERE a.id = s.attempt_id AND a.last_is_correct IS NULL
+    """,
+    # Images are served content-addressed from /assets/{sha256}
+    "ALTER TABLE diagrams ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64)",
+    "UPDATE diagrams SET content_sha256 = encode(sha256(image_content), 'hex') WHERE content_sha256 IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_diagrams_content_sha256 ON diagrams (content_sha256)",
+    "ALTER TABLE facial_expressions ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64)",
+    "UPDATE facial_expressions SET content_sha256 = encode(sha256(image), 'hex') WHERE content_sha256 IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_facial_expressions_content_sha256 ON facial_expressions (content_sha256)",
+    "DELETE FROM pregenerated_responses WHERE image IS NOT NULL AND image NOT LIKE '/assets/%'",
+    # UserProgress: continue pacing for adaptive lookahead; the single
+    # pre-generation slot moved to the pregenerated_responses table
+    "ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS last_continue_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS continue_interval_seconds DOUBLE PRECISION",
+    "ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS lookahead_epoch INTEGER NOT NULL DEFAULT 0",
+    # UserProgress: running chat-memory summary for token-budgeted prompts
+    "ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS memory_summary TEXT",
+    "ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS turn_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS summarized_through INTEGER NOT NULL DEFAULT 0",
+    # UserProgress.chat_memory: rows inserted without it get an empty list, so
+    # the column can stay until the contract step while older revisions read it
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'user_progress' AND column_name = 'chat_memory') THEN
+            ALTER TABLE user_progress ALTER COLUMN chat_memory SET DEFAULT '[]'::jsonb;
+        END IF;
+    END $$
+    """,
+    CHAT_MEMORY_BACKFILL,
+]
+
+# Contract step: drops columns that the current release no longer reads. Run
+# it (python migrate_db.py --contract) only once a release without them is the
+# only one serving; on a rolling deploy the previous revision still reads them
+# while the expand migrations above run.
+CONTRACT_MIGRATIONS = [
+    # Explain: the old JSONB embedding column was never written by the ingestion
+    # scripts; chunk_embeddings is recomputed from the chunks (insert_chunk_embeddings.py)
+    "ALTER TABLE explains DROP COLUMN IF EXISTS index_faiss_embedding",
+    # UserProgress: the single pre-generation slot, replaced by pregenerated_responses
+    "ALTER TABLE user_progress DROP COLUMN IF EXISTS next_continue_response",
+    "ALTER TABLE user_progress DROP COLUMN IF EXISTS next_continue_image",
+    "ALTER TABLE user_progress DROP COLUMN IF EXISTS next_response_chunk_index",
+    # UserProgress.chat_memory: copy what older revisions wrote meanwhile, then drop it
+    CHAT_MEMORY_BACKFILL,
+    "ALTER TABLE user_progress DROP COLUMN IF EXISTS chat_memory",
+]
+
+
+def run_migrations(contract: bool = False):
+    print("Applying migrations...")
+    # New tables first, so data can be copied into them
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
+        if contract:
+            print("Applying contract migrations...")
+            for statement in CONTRACT_MIGRATIONS:
+                conn.execute(text(statement))
+    print("✅ Migrations applied!")
+
+
+if __name__ == "__main__":
+    run_migrations(contract="--contract" in sys.argv)
@@ -0,0 +1,58 @@
+"""
+Eligibility index for the Quiz1 placement test.
+
+Quiz1 used to draw a random topic of the "quiz1" subject, then a random
+subtopic of that topic, then a random unanswered MCQ of the subtopic at the
+current hardness level, starting over when any step came up empty. The index
+holds, for every hardness level, the subtopics that have questions at that
+level and their weight, and deck() deals the same distribution up front as a
+weighted shuffle, for the per-attempt question decks (see
+question_bank.build_placement_deck).
+
+Pure Python with no database or package imports, so benchmark_quiz1_selection.py
+can run it directly.
+"""
+import heapq
+import random
+from collections import defaultdict
+from typing import Iterable
+
+
+class PlacementIndex:
+    def __init__(self, rows: Iterable):
+        """
+        rows: (topic_id, subtopic_id, mcq_id, hardness_level) tuples, with
+        mcq_id None for subtopics that have no questions yet.
+        """
+        subtopics_per_topic = defaultdict(set)
+        buckets = defaultdict(lambda: defaultdict(list))  # hardness -> subtopic_id -> [mcq id]
+        topic_of = {}
+        for topic_id, subtopic_id, mcq_id, hardness_level in rows:
+            subtopics_per_topic[topic_id].add(subtopic_id)
+            topic_of[subtopic_id] = topic_id
+            if mcq_id is not None and hardness_level is not None:
+                buckets[hardness_level][subtopic_id].append(mcq_id)
+
+        # A subtopic is reached with probability 1/topics * 1/subtopics-of-its-topic;
+        # the topic count is the same for everyone, so only the second factor is kept.
+        self.by_hardness = {
+            hardness_level: [
+                (1.0 / len(subtopics_per_topic[topic_of[subtopic_id]]), ids)
+                for subtopic_id, ids in by_subtopic.items()
+            ]
+            for hardness_level, by_subtopic in buckets.items()
+        }
+
+    def deck(self, hardness_level: int, size: int) -> list:
+        """
+        Up to size distinct MCQ ids at hardness_level in a weighted shuffle
+        (each id gets key u ** (1 / weight), its subtopic's weight split over
+        its questions), close to the order the old random walk reached them in.
+        """
+        keyed = [
+            (random.random() ** (len(ids) / weight), mcq_id)
+            for weight, ids in self.by_hardness.get(hardness_level, [])
+            for mcq_id in ids
+        ]
+        return [mcq_id for _, mcq_id in heapq.nlargest(size, keyed)]
+
@@ -0,0 +1,244 @@
+"""
+Durable, deduplicated queue for "continue" pre-generation.
+
+Jobs live in the pregeneration_jobs table with one row per
+(user_id, subtopic_id, chunk_index), so a double-click on "continue" cannot
+start a second Gemini call for the same chunk. Worker coroutines on every
+instance claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED, retry failures
+with backoff, and let jobs expire once the student has likely moved on. A job
+left "running" by an instance that died is reclaimed after its lease runs out.
+
+Lookahead is adaptive: a job for chunk k queues k + 1 once it is done, up to
+lookahead_depth() chunks past the student's position. Students who press
+"continue" quickly get a deeper buffer, idle students get none.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql import func
+from prometheus_client import Counter
+
+from .database.models import PregenerationJob
+from .llm_scheduler import JobDropped
+
+PREGEN_WORKERS = int(os.getenv("PREGEN_WORKERS", "4"))
+PREGEN_MAX_ATTEMPTS = int(os.getenv("PREGEN_MAX_ATTEMPTS", "3"))
+PREGEN_JOB_TTL_SECONDS = int(os.getenv("PREGEN_JOB_TTL_SECONDS", "900"))
+PREGEN_LEASE_SECONDS = int(os.getenv("PREGEN_LEASE_SECONDS", "300"))
+PREGEN_POLL_SECONDS = float(os.getenv("PREGEN_POLL_SECONDS", "2"))
+PREGEN_RETRY_BACKOFF_SECONDS = float(os.getenv("PREGEN_RETRY_BACKOFF_SECONDS", "5"))
+PREGEN_RETENTION_HOURS = int(os.getenv("PREGEN_RETENTION_HOURS", "24"))
+
+# Adaptive lookahead
+PREGEN_MAX_LOOKAHEAD = int(os.getenv("PREGEN_MAX_LOOKAHEAD", "3"))
+PREGEN_FAST_CONTINUE_SECONDS = float(os.getenv("PREGEN_FAST_CONTINUE_SECONDS", "20"))
+PREGEN_IDLE_SECONDS = float(os.getenv("PREGEN_IDLE_SECONDS", "600"))
+PREGEN_INTERVAL_SMOOTHING = float(os.getenv("PREGEN_INTERVAL_SMOOTHING", "0.5"))
+
+PREGEN_JOBS = Counter(
+    "pregeneration_jobs_total",
+    "Pre-generation jobs by outcome",
+    ["outcome"]  # enqueued, done, retried, deferred, failed, expired
+)
+PREGEN_CACHE_LOOKUPS = Counter(
+    "pregeneration_cache_lookups_total",
+    "Continue requests served from a pre-generated response (hit) or generated live (miss)",
+    ["result"]
+)
+
+_wakeup = asyncio.Event()
+_workers = []
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def continue_timing(progress, now: datetime) -> dict:
+    """
+    UserProgress values to write for a "continue" at time now: the timestamp
+    and a smoothed interval between continues. Gaps longer than
+    PREGEN_IDLE_SECONDS (a new session) do not count towards the interval.
+    """
+    interval = progress.continue_interval_seconds
+    if progress.last_continue_at:
+        elapsed = (now - _as_utc(progress.last_continue_at)).total_seconds()
+        if 0 <= elapsed <= PREGEN_IDLE_SECONDS:
+            interval = elapsed if interval is None else (
+                PREGEN_INTERVAL_SMOOTHING * elapsed + (1 - PREGEN_INTERVAL_SMOOTHING) * interval
+            )
+    return dict(last_continue_at=now, continue_interval_seconds=interval)
+
+
+def lookahead_depth(progress, now: datetime) -> int:
+    """How many chunks past progress.chunk_index to keep pre-generated."""
+    if progress.last_updated and (now - _as_utc(progress.last_updated)).total_seconds() > PREGEN_IDLE_SECONDS:
+        return 0
+    interval = progress.continue_interval_seconds
+    if interval is None:
+        return 1
+    if interval <= PREGEN_FAST_CONTINUE_SECONDS:
+        return PREGEN_MAX_LOOKAHEAD
+    return max(1, min(PREGEN_MAX_LOOKAHEAD, int(PREGEN_MAX_LOOKAHEAD * PREGEN_FAST_CONTINUE_SECONDS / interval)))
+
+
+async def enqueue_pregeneration(db, user_id: int, subtopic_id: int, chunk_index: int, subject: str,
+                                restart: bool = False):
+    """
+    Queue pre-generation of the response for chunk_index.
+
+    A job that is already pending or running for the same target is left
+    alone. A finished one is re-armed, and the handler then decides whether
+    the stored response is still usable. With restart=True a running job is
+    re-armed too, for when the conversation changed under it.
+    """
+    values = dict(
+        user_id=user_id,
+        subtopic_id=subtopic_id,
+        chunk_index=chunk_index,
+        subject=subject,
+        status="pending",
+        attempts=0,
+        run_after=func.now(),
+        expires_at=func.now() + timedelta(seconds=PREGEN_JOB_TTL_SECONDS),
+        locked_at=None,
+        last_error=None,
+    )
+    stmt = pg_insert(PregenerationJob).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_pregeneration_jobs_target",
+        set_={key: stmt.excluded[key] for key in values if key not in ("user_id", "subtopic_id", "chunk_index")},
+        where=PregenerationJob.status != "pending" if restart else PregenerationJob.status.in_(("done", "failed", "expired"))
+    )
+    await db.execute(stmt)
+    await db.commit()
+    PREGEN_JOBS.labels(outcome="enqueued").inc()
+    _wakeup.set()
+
+
+async def claim_next_job(db):
+    """Claim one due job, or return None when there is nothing to do."""
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(PregenerationJob)
+        .filter(or_(
+            and_(PregenerationJob.status == "pending", PregenerationJob.run_after <= func.now()),
+            and_(PregenerationJob.status == "running",
+                 PregenerationJob.locked_at < func.now() - timedelta(seconds=PREGEN_LEASE_SECONDS))
+        ))
+        .order_by(PregenerationJob.run_after)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = result.scalar_one_or_none()
+    if job is None:
+        await db.commit()
+        return None
+
+    if job.expires_at <= now or job.attempts >= PREGEN_MAX_ATTEMPTS:
+        job.status = "expired" if job.expires_at <= now else "failed"
+        await db.commit()
+        PREGEN_JOBS.labels(outcome=job.status).inc()
+        return await claim_next_job(db)
+
+    job.status = "running"
+    job.locked_at = func.now()
+    job.attempts += 1
+    await db.commit()
+    return job
+
+
+async def _finish_job(session_factory, job, error: Exception = None):
+    values = dict(locked_at=None)
+    if error is None:
+        values.update(status="done", last_error=None)
+        outcome = "done"
+    elif isinstance(error, JobDropped):
+        # Shed by the LLM scheduler under load: try again later without using up an attempt
+        values.update(status="pending", attempts=job.attempts - 1,
+                      run_after=func.now() + timedelta(seconds=PREGEN_RETRY_BACKOFF_SECONDS))
+        outcome = "deferred"
+    elif job.attempts >= PREGEN_MAX_ATTEMPTS:
+        values.update(status="failed", last_error=str(error)[:1000])
+        outcome = "failed"
+    else:
+        backoff = PREGEN_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+        values.update(status="pending", last_error=str(error)[:1000],
+                      run_after=func.now() + timedelta(seconds=backoff))
+        outcome = "retried"
+
+    async with session_factory() as db:
+        await db.execute(
+            update(PregenerationJob)
+            .filter(PregenerationJob.id == job.id, PregenerationJob.status == "running")
+            .values(**values)
+        )
+        await db.commit()
+    PREGEN_JOBS.labels(outcome=outcome).inc()
+
+
+async def _purge_finished_jobs(session_factory):
+    async with session_factory() as db:
+        await db.execute(
+            delete(PregenerationJob).filter(
+                PregenerationJob.status.in_(("done", "failed", "expired")),
+                PregenerationJob.updated_at < func.now() - timedelta(hours=PREGEN_RETENTION_HOURS)
+            )
+        )
+        await db.commit()
+
+
+async def _worker(worker_id: int, session_factory, handler):
+    loop = asyncio.get_running_loop()
+    next_purge = loop.time()
+    while True:
+        try:
+            async with session_factory() as db:
+                job = await claim_next_job(db)
+
+            if job is None:
+                if worker_id == 0 and loop.time() >= next_purge:
+                    await _purge_finished_jobs(session_factory)
+                    next_purge = loop.time() + 600
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), PREGEN_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                _wakeup.clear()
+                continue
+
+            try:
+                await handler(job.user_id, job.subtopic_id, job.chunk_index, job.subject)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Pre-generation job {job.id} failed: {e}")
+                await _finish_job(session_factory, job, e)
+            else:
+                await _finish_job(session_factory, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Pre-generation worker {worker_id} error: {e}")
+            await asyncio.sleep(PREGEN_POLL_SECONDS)
+
+
+def start_pregeneration_workers(session_factory, handler, count: int = PREGEN_WORKERS):
+    """
+    Start worker coroutines on the running loop.
+
+    handler(user_id, subtopic_id, chunk_index, subject) does the work and
+    raises to request a retry.
+    """
+    for worker_id in range(count):
+        _workers.append(asyncio.get_running_loop().create_task(_worker(worker_id, session_factory, handler)))
+
+
+async def stop_pregeneration_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
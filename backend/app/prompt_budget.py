@@ -0,0 +1,111 @@
+"""
+Token budgeting for explain prompts.
+
+build_prompt used to paste up to 30 full question/answer pairs into every
+prompt. Now only turns not yet folded into UserProgress.memory_summary are
+sent verbatim, newest first, as long as the prompt stays inside the
+subject's token budget. Older turns are folded into the running summary off
+the hot path (see fold_chat_memory in router/explain.py) once more than
+MEMORY_VERBATIM_TURNS + MEMORY_FOLD_BATCH of them are pending.
+
+Token counts are estimates (about 4 characters per token for Latin script,
+2 for Bengali), which is close enough for budgeting and metrics without a
+tokenizer call.
+"""
+import os
+
+from prometheus_client import Histogram
+
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+PROMPT_TOKEN_BUDGETS = {
+    "English": int(os.getenv("PROMPT_TOKEN_BUDGET_ENGLISH", str(DEFAULT_PROMPT_TOKEN_BUDGET))),
+    "গণিত": int(os.getenv("PROMPT_TOKEN_BUDGET_MATH", "6000")),
+    "উচ্চতর গণিত": int(os.getenv("PROMPT_TOKEN_BUDGET_MATH", "6000")),
+}
+
+# Turns always kept verbatim, and how many older ones to fold per summary update
+MEMORY_VERBATIM_TURNS = int(os.getenv("MEMORY_VERBATIM_TURNS", "4"))
+MEMORY_FOLD_BATCH = int(os.getenv("MEMORY_FOLD_BATCH", "4"))
+
+TOKEN_BUCKETS = [250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000]
+PROMPT_TOKENS = Histogram(
+    "explain_prompt_tokens",
+    "Estimated tokens per explain prompt (system instruction included)",
+    ["subject"],
+    buckets=TOKEN_BUCKETS
+)
+MEMORY_TOKENS = Histogram(
+    "explain_memory_tokens",
+    "Estimated tokens of chat memory and summary per explain prompt",
+    ["subject"],
+    buckets=TOKEN_BUCKETS
+)
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) // 2 + 1
+
+
+def prompt_token_budget(subject: str) -> int:
+    return PROMPT_TOKEN_BUDGETS.get(subject, DEFAULT_PROMPT_TOKEN_BUDGET)
+
+
+def format_turn(pair: dict) -> str:
+    return f"User: {pair['question']}\nAssistant: {pair['answer']}"
+
+
+def build_memory_text(turns: list, summary: str, budget_tokens: int) -> str:
+    """
+    Summary plus the newest turns that fit in budget_tokens. The newest turn
+    is always kept, cut down to the budget if it is too long on its own.
+    """
+    parts = []
+    remaining = budget_tokens
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+        remaining -= estimate_tokens(parts[0])
+
+    kept = []
+    for pair in reversed(turns):
+        text = format_turn(pair)
+        cost = estimate_tokens(text)
+        if cost > remaining:
+            if not kept:
+                kept.append(text[:max(remaining, 0) * 2])
+            break
+        kept.append(text)
+        remaining -= cost
+
+    parts.extend(reversed(kept))
+    return "\n\n".join(parts) if parts else "No prior conversation."
+
+
+def needs_fold(turn_count: int, summarized_through: int) -> bool:
+    return turn_count - summarized_through >= MEMORY_VERBATIM_TURNS + MEMORY_FOLD_BATCH
+
+
+MEMORY_SUMMARY_MAX_WORDS = int(os.getenv("MEMORY_SUMMARY_MAX_WORDS", "200"))
+SUMMARY_SYSTEM_INSTRUCTION = (
+    "You maintain a running summary of a tutoring conversation between a student and an AI tutor. "
+    "Write it in the language the conversation uses."
+)
+
+
+def build_summary_prompt(summary: str, turns: list) -> tuple[str, str]:
+    """Prompt that folds turns into the existing running summary."""
+    # Long markdown answers only need their gist for the summary
+    transcript = "\n\n".join(
+        f"User: {pair['question']}\nAssistant: {str(pair['answer'])[:1500]}" for pair in turns
+    )
+    prompt = f"""Current summary:
+{summary or "(none yet)"}
+
+New conversation turns:
+{transcript}
+
+Rewrite the summary so it also covers the new turns. Keep what the student asked, what was explained and
+anything they found difficult. Use at most {MEMORY_SUMMARY_MAX_WORDS} words and reply with the summary only."""
+    return prompt, SUMMARY_SYSTEM_INSTRUCTION
@@ -0,0 +1,49 @@
+"""
+Drop the semantic cache's answers (semantic_cache.py) for a subtopic, a
+topic, a subject or everything, e.g. after a bad answer was cached. Bumps
+Explain.semantic_cache_version; every server worker purges the subtopic on
+its next lookup.
+
+    python purge_semantic_cache.py [subject [topic [subtopic]]]
+"""
+import sys
+
+from sqlalchemy import select, update
+from database.session import SessionLocal
+from database.models import Explain, Subject, Topic, Subtopic
+
+
+def purge_semantic_cache(subject: str = None, topic: str = None, subtopic: str = None) -> int:
+    """Bump the semantic cache version of the matching subtopics; returns how many were bumped."""
+    db = SessionLocal()
+    try:
+        subtopic_ids = (
+            select(Subtopic.id)
+            .join(Topic, Topic.id == Subtopic.topic_id)
+            .join(Subject, Subject.id == Topic.subject_id)
+        )
+        if subject:
+            subtopic_ids = subtopic_ids.filter(Subject.name == subject)
+        if topic:
+            subtopic_ids = subtopic_ids.filter(Topic.name == topic)
+        if subtopic:
+            subtopic_ids = subtopic_ids.filter(Subtopic.name == subtopic)
+
+        result = db.execute(
+            update(Explain)
+            .where(Explain.subtopic_id.in_(subtopic_ids))
+            .values(semantic_cache_version=Explain.semantic_cache_version + 1)
+        )
+        db.commit()
+        print(f"Purged the semantic cache of {result.rowcount} subtopics")
+        return result.rowcount
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    purge_semantic_cache(*sys.argv[1:4])
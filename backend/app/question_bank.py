@@ -0,0 +1,256 @@
+"""
+Version-stamped, in-memory index of the MCQ bank, and per-attempt decks.
+
+quiz, practise and Quiz1 serve a random question at the current hardness
+level, never repeating one within an attempt while others are left. Instead
+of an ORDER BY random() sort per click, each attempt is dealt a deck when it
+starts: for every hardness level, a shuffled list of candidate MCQ ids with a
+cursor, stored on the attempt row (the "deck" JSONB column). Serving a
+question just advances the cursor of its level, so the work per click does
+not depend on how many questions the attempt has seen. Since an MCQ has one
+hardness level, everything served so far lies behind some cursor.
+
+Decks are dealt from the subtopic's MCQ ids, loaded once per worker and
+bucketed by hardness level. MCQs only change when
+insert_quiz2_quiz3_question.py runs, and it bumps
+Subtopic.question_bank_version for every subtopic it adds questions to; the
+endpoints already read the Subtopic row, so they pass the version in and a new
+version reloads the subtopic on the next new attempt. Quiz1 decks span a whole
+subject through a PlacementIndex (placement_index.py) stamped with the
+subject's topic/subtopic layout and versions. Served questions are cached by
+id and version (the subtopic's question_bank_version, or for Quiz1 the
+subject's placement_version()), so a warm deck needs no MCQ query at all.
+Everything runs on the event loop, so no lock is needed.
+
+The version is the only invalidation: the script runs in its own process, so
+there is nothing to call in the server. It bumps the version for edited
+questions too, and any other change to the MCQ table must bump it as well.
+
+For prefetching, reserve_next() also deals the question to serve after the
+current one for either answer and keeps the pair in the deck; the answer then
+takes its branch with take_reserved() and the other question goes back into
+the deck.
+"""
+import os
+import random
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from cachetools import LRUCache
+from prometheus_client import Counter
+from sqlalchemy import select
+
+from .database.models import MCQ, Subtopic, Topic
+from .placement_index import PlacementIndex
+from .schemas.quizzes import MCQResponse
+
+QUESTION_BANK_MAX_SUBTOPICS = int(os.getenv("QUESTION_BANK_MAX_SUBTOPICS", "2048"))
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "50000"))
+
+QUESTION_BANK_LOOKUPS = Counter(
+    "question_bank_lookups_total",
+    "MCQ bank lookups by what had to be read from the database",
+    ["result"]  # hit, row_miss (question row read), bank_miss (id index rebuilt), placement_miss
+)
+
+
+class _SubtopicBank:
+    def __init__(self, version: int, rows: Iterable):
+        self.version = version
+        self.buckets = defaultdict(list)  # hardness_level -> [mcq id]
+        for mcq_id, hardness_level in rows:
+            if hardness_level is not None:
+                self.buckets[hardness_level].append(mcq_id)
+
+
+# subtopic_id -> _SubtopicBank
+_banks = LRUCache(maxsize=QUESTION_BANK_MAX_SUBTOPICS)
+# subject_id -> (signature, PlacementIndex)
+_placements = {}
+# (mcq id, version) -> MCQResponse
+_questions = LRUCache(maxsize=QUESTION_CACHE_SIZE)
+
+
+async def _get_bank(db, subtopic_id: int, version: int) -> _SubtopicBank:
+    bank = _banks.get(subtopic_id)
+    if bank is not None and bank.version == version:
+        return bank
+    QUESTION_BANK_LOOKUPS.labels(result="bank_miss").inc()
+    result = await db.execute(select(MCQ.id, MCQ.hardness_level).filter(MCQ.subtopic_id == subtopic_id))
+    rows = result.all()
+    bank = _SubtopicBank(version, rows)
+    _banks[subtopic_id] = bank
+    return bank
+
+
+async def placement_version(db, subject_id: int) -> tuple:
+    """The subject's topic/subtopic layout and question bank versions, the version of its Quiz1 questions."""
+    result = await db.execute(
+        select(Topic.id, Subtopic.id, Subtopic.question_bank_version)
+        .join(Subtopic, Subtopic.topic_id == Topic.id)
+        .filter(Topic.subject_id == subject_id)
+        .order_by(Topic.id, Subtopic.id)
+    )
+    return tuple(tuple(row) for row in result.all())
+
+
+async def _get_placement_index(db, subject_id: int) -> PlacementIndex:
+    signature = await placement_version(db, subject_id)
+    entry = _placements.get(subject_id)
+    if entry is None or entry[0] != signature:
+        QUESTION_BANK_LOOKUPS.labels(result="placement_miss").inc()
+        result = await db.execute(
+            select(Topic.id, Subtopic.id, MCQ.id, MCQ.hardness_level)
+            .join(Subtopic, Subtopic.topic_id == Topic.id)
+            .outerjoin(MCQ, MCQ.subtopic_id == Subtopic.id)
+            .filter(Topic.subject_id == subject_id)
+        )
+        entry = (signature, PlacementIndex(result.all()))
+        _placements[subject_id] = entry
+    return entry[1]
+
+
+async def build_deck(db, subtopic_id: int, version: int, size: int) -> dict:
+    """
+    A fresh deck for an attempt of at most size questions in one subtopic:
+    {"levels": {level: [mcq id, ...]}, "cursor": {level: next position}},
+    plus "level", the hardness of the last question served, once one is.
+    """
+    bank = await _get_bank(db, subtopic_id, version or 0)
+    return {
+        "levels": {str(level): random.sample(ids, min(size, len(ids))) for level, ids in bank.buckets.items()},
+        "cursor": {},
+    }
+
+
+async def build_placement_deck(db, subject_id: int, size: int) -> dict:
+    """A fresh Quiz1 deck across the subject, weighted as in PlacementIndex.deck()."""
+    index = await _get_placement_index(db, subject_id)
+    return {
+        "levels": {str(level): index.deck(level, size) for level in index.by_hardness},
+        "cursor": {},
+    }
+
+
+async def _get_question(db, mcq_id: int, version) -> Optional[MCQResponse]:
+    question = _questions.get((mcq_id, version))
+    if question is not None:
+        QUESTION_BANK_LOOKUPS.labels(result="hit").inc()
+        return question
+
+    QUESTION_BANK_LOOKUPS.labels(result="row_miss").inc()
+    row = await db.get(MCQ, mcq_id)
+    if row is None:
+        return None
+    question = MCQResponse.from_orm(row)
+    _questions[(mcq_id, version)] = question
+    return question
+
+
+async def get_questions(db, mcq_ids: Iterable[int], version) -> list:
+    """The questions with these ids, in order, reading the uncached ones in one query."""
+    mcq_ids = list(mcq_ids)
+    missing = [mcq_id for mcq_id in mcq_ids if (mcq_id, version) not in _questions]
+    QUESTION_BANK_LOOKUPS.labels(result="hit").inc(len(mcq_ids) - len(missing))
+    if missing:
+        QUESTION_BANK_LOOKUPS.labels(result="row_miss").inc(len(missing))
+        result = await db.execute(select(MCQ).filter(MCQ.id.in_(missing)))
+        for row in result.scalars().all():
+            _questions[(row.id, version)] = MCQResponse.from_orm(row)
+    return [_questions[(mcq_id, version)] for mcq_id in mcq_ids if (mcq_id, version) in _questions]
+
+
+async def deal_question(db, deck: dict, hardness_level: int, version, reuse: bool = False) -> tuple:
+    """
+    Serve the next question at hardness_level from deck, as of version.
+
+    Returns (question or None, updated deck); assign the deck back to the
+    attempt so the cursor move is saved. Once the level is used up, reuse=True
+    serves a random question of the level again instead of None.
+    """
+    level = str(hardness_level)
+    ids = deck["levels"].get(level, [])
+    position = deck["cursor"].get(level, 0)
+    while position < len(ids):
+        question = await _get_question(db, ids[position], version)
+        position += 1
+        if question is not None:
+            return question, {**deck, "cursor": {**deck["cursor"], level: position}, "level": hardness_level}
+    if reuse and ids:
+        return await _get_question(db, random.choice(ids), version), {**deck, "level": hardness_level}
+    return None, deck
+
+
+def _put_back(deck: dict, level: str, mcq_id: int) -> dict:
+    """Undeal mcq_id: swap it to the end of the dealt part of its level and step the cursor back."""
+    ids = list(deck["levels"].get(level, []))
+    position = deck["cursor"].get(level, 0)
+    if mcq_id not in ids[:position]:
+        return deck
+    index = ids.index(mcq_id)
+    ids[index], ids[position - 1] = ids[position - 1], ids[index]
+    return {
+        **deck,
+        "levels": {**deck["levels"], level: ids},
+        "cursor": {**deck["cursor"], level: position - 1},
+    }
+
+
+async def reserve_next(db, deck: dict, question_id: int, branches: dict, version, reuse: bool = False) -> tuple:
+    """
+    Deal the question to serve after question_id for each outcome in
+    branches ({"correct": hardness_level, "incorrect": hardness_level}).
+
+    Returns ({outcome: (hardness_level, question or None)}, updated deck). The
+    deck keeps the reservation until take_reserved() or release_reserved().
+    """
+    deck = release_reserved(deck)
+    served_level = deck.get("level")
+    reserved = {"for": question_id}
+    dealt = {}
+    for outcome, hardness_level in branches.items():
+        level = str(hardness_level)
+        position = deck["cursor"].get(level, 0)
+        question, deck = await deal_question(db, deck, hardness_level, version, reuse)
+        # Only questions dealt from the cursor go back into the deck if unused
+        fresh = deck["cursor"].get(level, 0) != position
+        reserved[outcome] = [hardness_level, question.id if question else None, fresh]
+        dealt[outcome] = (hardness_level, question)
+    return dealt, {**deck, "level": served_level, "reserved": reserved}
+
+
+def release_reserved(deck: dict) -> dict:
+    """Drop the deck's reservation, putting its questions back."""
+    reserved = deck.get("reserved")
+    if not reserved:
+        return deck
+    deck = {key: value for key, value in deck.items() if key != "reserved"}
+    for outcome in ("correct", "incorrect"):
+        hardness_level, mcq_id, fresh = reserved[outcome]
+        if fresh and mcq_id is not None:
+            deck = _put_back(deck, str(hardness_level), mcq_id)
+    return deck
+
+
+async def take_reserved(db, deck: dict, question_id: int, is_correct: bool, hardness_level: int, version) -> tuple:
+    """
+    The question reserved for this answer to question_id, if the reservation
+    matches it and was made for hardness_level; the other one goes back into
+    the deck. Returns (question or None, updated deck); on None, deal as usual.
+    """
+    reserved = deck.get("reserved")
+    if not reserved or reserved["for"] != question_id:
+        return None, release_reserved(deck)
+    level, mcq_id, _ = reserved["correct" if is_correct else "incorrect"]
+    if level != hardness_level or mcq_id is None:
+        return None, release_reserved(deck)
+    question = await _get_question(db, mcq_id, version)
+    if question is None:
+        return None, release_reserved(deck)
+
+    deck = {key: value for key, value in deck.items() if key != "reserved"}
+    other_level, other_id, fresh = reserved["incorrect" if is_correct else "correct"]
+    if fresh and other_id is not None:
+        deck = _put_back(deck, str(other_level), other_id)
+    return question, {**deck, "level": hardness_level}
+
@@ -0,0 +1,105 @@
+"""
+Shared cache for Gemini answers to context-free explain prompts.
+
+A "refresh", or any turn with empty chat memory, sends every student the same
+chunk, system instruction and "No prior conversation." memory. Those answers
+are stored in the shared_responses table under a content address: a SHA-256
+of the whitespace-normalized prompt and system instruction, the model, the
+temperature and the attached image. A bounded in-process TTL cache sits in
+front of Postgres.
+
+Each key holds SHARED_RESPONSE_VARIANTS answers and a student reads variant
+(user_id + turn_count) % SHARED_RESPONSE_VARIANTS: classmates get different
+text, and since every turn advances turn_count, a student who refreshes gets
+the next variant instead of the text they just asked to replace. Entries
+expire after SHARED_RESPONSE_TTL_SECONDS and are only served for the
+Explain.content_version they were generated from, so editing a subtopic's
+chunks invalidates them.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from cachetools import TTLCache
+from prometheus_client import Counter
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .database.models import SharedResponse
+
+SHARED_RESPONSE_TTL_SECONDS = int(os.getenv("SHARED_RESPONSE_TTL_SECONDS", str(7 * 24 * 3600)))
+SHARED_RESPONSE_VARIANTS = int(os.getenv("SHARED_RESPONSE_VARIANTS", "3"))
+SHARED_RESPONSE_MEMORY_SIZE = int(os.getenv("SHARED_RESPONSE_MEMORY_SIZE", "2048"))
+SHARED_RESPONSE_MEMORY_TTL_SECONDS = int(os.getenv("SHARED_RESPONSE_MEMORY_TTL_SECONDS", "600"))
+
+SHARED_RESPONSE_LOOKUPS = Counter(
+    "shared_response_cache_lookups_total",
+    "Context-free explain lookups by where they were answered from",
+    ["result"]  # memory, database, miss
+)
+
+# (cache_key, variant, content_version) -> response
+_memory = TTLCache(maxsize=SHARED_RESPONSE_MEMORY_SIZE, ttl=SHARED_RESPONSE_MEMORY_TTL_SECONDS)
+
+
+def response_cache_key(prompt: str, system_instruction: str, model: str, temperature: float,
+                       image_ref: Optional[str] = None) -> str:
+    """Content address of a Gemini request (image_ref already names the image by hash)."""
+    digest = hashlib.sha256()
+    for part in (" ".join(prompt.split()), " ".join(system_instruction.split()), model, f"{temperature:.3f}"):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    if image_ref:
+        digest.update(image_ref.encode("ascii"))
+    return digest.hexdigest()
+
+
+def response_variant(user_id: int, turn_count: int) -> int:
+    return (user_id + turn_count) % SHARED_RESPONSE_VARIANTS
+
+
+async def get_shared_response(db, cache_key: str, variant: int, content_version: str) -> Optional[str]:
+    memory_key = (cache_key, variant, content_version)
+    response = _memory.get(memory_key)
+    if response is not None:
+        SHARED_RESPONSE_LOOKUPS.labels(result="memory").inc()
+        return response
+
+    result = await db.execute(
+        select(SharedResponse.response).filter(
+            SharedResponse.cache_key == cache_key,
+            SharedResponse.variant == variant,
+            SharedResponse.content_version == content_version,
+            SharedResponse.expires_at > datetime.now(timezone.utc)
+        )
+    )
+    response = result.scalar_one_or_none()
+    if response is None:
+        SHARED_RESPONSE_LOOKUPS.labels(result="miss").inc()
+        return None
+
+    _memory[memory_key] = response
+    SHARED_RESPONSE_LOOKUPS.labels(result="database").inc()
+    return response
+
+
+async def store_shared_response(db, cache_key: str, variant: int, subtopic_id: int, content_version: str,
+                                response: str):
+    """Insert or replace one variant. Commits."""
+    values = dict(
+        cache_key=cache_key,
+        variant=variant,
+        subtopic_id=subtopic_id,
+        content_version=content_version,
+        response=response,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=SHARED_RESPONSE_TTL_SECONDS),
+    )
+    stmt = pg_insert(SharedResponse).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_shared_responses_key_variant",
+        set_={key: stmt.excluded[key] for key in ("subtopic_id", "content_version", "response", "expires_at")}
+    )
+    await db.execute(stmt)
+    await db.commit()
+    _memory[(cache_key, variant, content_version)] = response
@@ -0,0 +1,81 @@
+import re
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..image_store import get_asset
+from .explain import get_async_db
+
+router = APIRouter(
+    tags=["assets"]
+)
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+# The URL changes whenever the bytes do, so a copy never has to be revalidated
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def parse_range(range_header: str, size: int) -> Optional[tuple]:
+    """
+    (start, end) inclusive for a single "bytes=" range, or None when the header
+    cannot be honoured and the whole body should be sent instead.
+    Raises 416 when the range lies outside the content.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+@router.get("/assets/{sha256}")
+async def get_asset_content(
+    sha256: str,
+    db: AsyncSession = Depends(get_async_db),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None)
+):
+    """
+    Image bytes addressed by their SHA-256, with a strong ETag, immutable
+    caching and single byte-range support.
+    """
+    if not SHA256_PATTERN.match(sha256):
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    content = await get_asset(db, sha256)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, len(content))
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+            return Response(content=content[start:end + 1], status_code=206, media_type="image/png", headers=headers)
+
+    return Response(content=content, media_type="image/png", headers=headers)
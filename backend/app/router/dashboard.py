@@ -1,30 +1,14 @@
-# Add these imports at the top of router/dashboard.py if not already present
-from fastapi import Request, status,APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Header
 from pydantic import BaseModel
-from ..database.models import QuizAttempt, QuizScore
-from typing import List,Optional
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from sqlalchemy.orm import Session
-from typing import Optional
-from datetime import datetime
-from ..database.session import SessionLocal
-from ..database.models import Subject, Topic, Subtopic, User, MCQ, QuizAttempt, QuizAnswer, QuizScore, Quiz1Attempt, Quiz1, Quiz1Score, PractiseAnswer, PractiseAttempt, FacialExpression
-from ..schemas.quizzes import QuizAnswerSubmission, QuizQuestionResponse, PracticeQuizAnswerSubmission, PracticeQuizQuestionResponse, MCQResponse
-from sqlalchemy.sql import func
-import base64
-import random
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..database.models import Subject, Topic, Subtopic, User, QuizAttempt, UserSubtopicMastery
 
-# BEFORE - Add these imports
-from ..jwt_utils import create_access_token, get_user_from_token
+from ..jwt_utils import get_user_from_token
+from .explain import get_async_db
 
-
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 # NEW DASHBOARD ENDPOINTS
 # Pydantic model for DashboardData
 class SubtopicData(BaseModel):
@@ -42,12 +26,39 @@ router = APIRouter(
     tags=["dashboard"]
 )
 
+
+async def update_mastery(db: AsyncSession, attempt: QuizAttempt, total_correct: int):
+    """
+    Record a completed quiz attempt as the user's latest result for its
+    subtopic, in the caller's transaction. An older completion never
+    replaces a newer one.
+    """
+    total_questions = 10  # As per your quiz logic
+    overall_score = (total_correct / total_questions) * 100
+    completion_percentage = 100 if overall_score >= 75 else overall_score
+
+    stmt = pg_insert(UserSubtopicMastery).values(
+        user_id=attempt.user_id,
+        subtopic_id=attempt.subtopic_id,
+        attempt_id=attempt.id,
+        total_correct=total_correct,
+        completion_percentage=completion_percentage,
+        completed_at=attempt.completed_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_user_subtopic_mastery",
+        set_={key: stmt.excluded[key] for key in ("attempt_id", "total_correct", "completion_percentage", "completed_at")},
+        where=UserSubtopicMastery.completed_at <= stmt.excluded.completed_at
+    )
+    await db.execute(stmt)
+
+
 @router.get("/dashboard/{subject}/{topic}/", response_model=DashboardData)
 async def get_dashboard_data(
     subject: str,
     topic: str,
     user_id: int = Header(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
       authorization: Optional[str] = Header(None)
 ):
     try:
@@ -58,69 +69,38 @@ async def get_dashboard_data(
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing token")
     
     # Validate user
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User ID {user_id} not found")
 
-    # Validate subject and topic
-    subject_obj = db.query(Subject).filter(Subject.name == subject).first()
-    if not subject_obj:
+    # Subject, topic, its subtopics and the user's latest result for each, in one read:
+    # no rows means no such subject, a NULL topic id no such topic in it
+    rows = (await db.execute(
+        select(Topic.id, Subtopic.name, UserSubtopicMastery.completion_percentage)
+        .select_from(Subject)
+        .outerjoin(Topic, and_(Topic.subject_id == Subject.id, Topic.name == topic))
+        .outerjoin(Subtopic, Subtopic.topic_id == Topic.id)
+        .outerjoin(UserSubtopicMastery, and_(
+            UserSubtopicMastery.user_id == user_id,
+            UserSubtopicMastery.subtopic_id == Subtopic.id
+        ))
+        .filter(Subject.name == subject)
+        .order_by(Subtopic.id)
+    )).all()
+    if not rows:
         raise HTTPException(status_code=404, detail=f"Subject {subject} not found")
-    
-    topic_obj = db.query(Topic).filter(
-        Topic.name == topic,
-        Topic.subject_id == subject_obj.id
-    ).first()
-    if not topic_obj:
+    if rows[0][0] is None:
         raise HTTPException(status_code=404, detail=f"Topic {topic} not found in subject {subject}")
 
-    # Get all subtopics for this topic
-    subtopics = db.query(Subtopic).filter(Subtopic.topic_id == topic_obj.id).all()
-    
-    subtopics_data = []
-    for subtopic in subtopics:
-        # Check if user has taken quiz for this subtopic
-        quiz_attempts = db.query(QuizAttempt).filter(
-            QuizAttempt.user_id == user_id,
-            QuizAttempt.subject_id == subject_obj.id,
-            QuizAttempt.topic_id == topic_obj.id,
-            QuizAttempt.subtopic_id == subtopic.id,
-            QuizAttempt.completed_at.isnot(None)
-        ).all()
-        
-        if not quiz_attempts:
-            # No quiz taken for this subtopic
-            subtopics_data.append({
-                "name": subtopic.name,
-                "completion_percentage": 0,
-                "quiz_taken": False
-            })
-        else:
-            # Get the latest completed quiz attempt
-            latest_attempt = max(quiz_attempts, key=lambda x: x.completed_at)
-            
-            # Get quiz score for this attempt
-            quiz_score = db.query(QuizScore).filter(
-                QuizScore.attempt_id == latest_attempt.id
-            ).first()
-            
-            if quiz_score:
-                # Calculate overall score percentage
-                total_questions = 10  # As per your quiz logic
-                overall_score = (quiz_score.total_correct / total_questions) * 100
-                completion_percentage = 100 if overall_score >= 75 else overall_score
-                
-                subtopics_data.append({
-                    "name": subtopic.name,
-                    "completion_percentage": completion_percentage,
-                    "quiz_taken": True
-                })
-            else:
-                subtopics_data.append({
-                    "name": subtopic.name,
-                    "completion_percentage": 0,
-                    "quiz_taken": False
-                })
+    subtopics_data = [
+        {
+            "name": subtopic_name,
+            "completion_percentage": completion_percentage or 0,
+            "quiz_taken": completion_percentage is not None
+        }
+        for _, subtopic_name, completion_percentage in rows
+        if subtopic_name is not None
+    ]
     
     return DashboardData(
         subject=subject,
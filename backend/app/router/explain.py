@@ -1,44 +1,54 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Header, Request,BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, defer
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy import select, update
+from sqlalchemy import select, update, delete, and_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from ..database.session import SessionLocal
-from ..database.models import Subject, Topic, Subtopic, User, Explain, UserProgress, Diagram
+from ..database.models import Subject, Topic, Subtopic, User, Explain, UserProgress, Diagram, PregeneratedResponse
 from ..schemas.explains import ExplainQuery, ExplainResponse
 from sqlalchemy.sql import func
-import base64
+import json
 import os
-from sentence_transformers import SentenceTransformer
-import faiss
-from google import genai
-from google.genai import types
+from ..embedding_backend import LazyEmbeddingModel
+from ..embedding_index import EMBEDDING_MODEL_NAME, index_cache, chunks_version, encode_chunks, unpack_embeddings, build_index
+from ..embedding_batcher import EmbeddingBatcher
+from ..gemini_client import MODEL, generate_gemini_response, stream_gemini_response
+from ..llm_scheduler import SPECULATIVE, JobDropped
+from ..pregeneration_queue import enqueue_pregeneration, continue_timing, lookahead_depth, PREGEN_CACHE_LOOKUPS
+from ..semantic_cache import semantic_cache
+from ..prompt_budget import (PROMPT_TOKENS, MEMORY_TOKENS, MEMORY_VERBATIM_TURNS, estimate_tokens, prompt_token_budget,
+                             build_memory_text, needs_fold, build_summary_prompt)
+from ..chat_turns import CHAT_MEMORY_TURNS, load_turns, append_turn, clear_turns
+from ..db_metrics import instrument_engine, track_db_usage
+from ..chunk_store import get_chunks
+from ..chunk_diagrams import chunk_diagram_description
+from ..image_store import get_diagram_ref, get_asset_for_ref
+from ..response_cache import response_cache_key, response_variant, get_shared_response, store_shared_response
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
-import re
 
 # Import JWT utils
 from ..jwt_utils import get_user_from_token
 
 
-# Preload SentenceTransformer globally to avoid repeated loading
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Shared embedding model, loaded on first use or by the startup warmup in main.py
+model = LazyEmbeddingModel(EMBEDDING_MODEL_NAME)
 
 # Get CPU count and set workers accordingly
 cpu_count = os.cpu_count() or 4
-# Use 1.5x CPU cores for mixed I/O and CPU tasks, max 8 to prevent overload
+# Threads only serve CPU-bound embedding work; Gemini calls run on the async client.
+# Use 1.5x CPU cores, max 8 to prevent overload
 # For Cloud Run with 1 CPU, override to use more workers
 max_workers = 8 if cpu_count <= 2 else min(int(cpu_count * 1.5), 8)
 executor = ThreadPoolExecutor(max_workers=max_workers)
 
-
-# Setup Gemini API globally
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise RuntimeError("Gemini API key not configured")
+# Concurrent query encodes are batched into one forward pass on the executor
+embedder = EmbeddingBatcher(model, executor)
 
 
 # ADD THIS: Async database engine - loads from env and converts to async
@@ -63,6 +73,7 @@ async_engine = create_async_engine(
     pool_recycle=3600,
     echo=False
 )
+instrument_engine(async_engine.sync_engine)
 
 AsyncSessionLocal = async_sessionmaker(
     async_engine,
@@ -77,62 +88,6 @@ async def get_async_db():
             yield session
         finally:
             await session.close()
-# Create client
-client = genai.Client(api_key=api_key)
-MODEL="gemini-2.5-flash"
-
-def generate_gemini_response(prompt: str,system_instruction:str="", temperature: float = 0.2,image_base64: Optional[str] = None) -> str:
-    """
-    Generate response using Gemini API
-    
-    Args:
-        prompt: The prompt to send to Gemini
-        temperature: Temperature setting for generation (default 0.2)
-    
-    Returns:
-        Generated text response
-    """
-    # Build contents list
-    contents = []
-    
-    # Add image if provided
-    if image_base64:
-        image_bytes = base64.b64decode(image_base64)
-        image_part = types.Part.from_bytes(
-            data=image_bytes, 
-            mime_type="image/jpeg"  # Adjust if you have different image types
-        )
-        contents.append(image_part)
-    # else:
-    #     contents.append("no image exists")
-    #  response = client.models.generate_content(
-    #         model=MODEL,
-    #         contents=contents,
-    #         config=types.GenerateContentConfig(
-    #             thinking_config=types.ThinkingConfig(thinking_budget=-1),
-    #             system_instruction="explain image if it exist or  write no image here ",  # Move this OUTSIDE config
-    #             temperature=temperature
-    #         )
-            
-    #     )
-    # Add text prompt
-    contents.append(prompt)
-   
-    response = client.models.generate_content(
-            model=MODEL,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=-1),
-                system_instruction=system_instruction,  # Move this OUTSIDE config
-                temperature=temperature
-            )
-            
-        )
-   
-    # response=r"$$\text{পরিসর} = (90 - 35) + 1 = 55 + 1 = 56 $$"
-    
-    return response.text.strip()
-
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -143,145 +98,148 @@ def get_db():
 
 
 
-async def pre_generate_continue_response(user_id: int, subtopic_id: int, chunks: list, subject: str):
+async def pre_generate_continue_response(user_id: int, subtopic_id: int, chunk_index: int, subject: str):
     """
-    Pre-generate the next continue response and store it in the database
+    Pre-generate the continue response for chunk_index and store it in
+    pregenerated_responses, then extend the lookahead by one chunk. Runs on the
+    pre-generation queue workers; raising makes the queue retry the job.
     """
-    try:
-        async with AsyncSessionLocal() as db:
-            # Get current progress
-            result = await db.execute(
-                select(UserProgress).filter(
-                    UserProgress.user_id == user_id,
-                    UserProgress.subtopic_id == subtopic_id
-                )
+    async with AsyncSessionLocal() as db:
+        # Get current progress
+        result = await db.execute(
+            select(UserProgress).filter(
+                UserProgress.user_id == user_id,
+                UserProgress.subtopic_id == subtopic_id
             )
-            progress = result.scalar_one_or_none()
-            
-            if not progress:
-                print("❌ UserProgress not found in background task")
-                return
-            
-            next_chunk_index = progress.chunk_index + 1
-            
-            # Don't pre-generate beyond last chunk
-            if next_chunk_index >= len(chunks):
-                # Clear any existing pre-generated response since we're at the end
-                await db.execute(
-                    update(UserProgress)
-                    .filter(
-                        UserProgress.user_id == user_id,
-                        UserProgress.subtopic_id == subtopic_id
-                    )
-                    .values(
-                        next_continue_response=None,
-                        next_continue_image=None,
-                        next_response_chunk_index=None
-                    )
-                )
-                await db.commit()
+        )
+        progress = result.scalar_one_or_none()
+        
+        if not progress:
+            print("❌ UserProgress not found for pre-generation job")
+            return
+
+        # Outside the lookahead window: already read, or too far ahead for this student's pace
+        base = progress.chunk_index
+        depth = lookahead_depth(progress, datetime.now(timezone.utc))
+        if chunk_index <= base or chunk_index > base + depth:
+            return
+
+        result = await db.execute(
+            select(Explain.content_version, Explain.chunk_diagrams).filter(Explain.subtopic_id == subtopic_id)
+        )
+        explain_row = result.first()
+        if not explain_row:
+            return
+        chunks = await get_chunks(db, subtopic_id, explain_row.content_version)
+
+        # Don't pre-generate beyond last chunk
+        if chunk_index >= len(chunks):
+            return
+
+        result = await db.execute(
+            select(PregeneratedResponse)
+            .filter(
+                PregeneratedResponse.user_id == user_id,
+                PregeneratedResponse.subtopic_id == subtopic_id,
+                PregeneratedResponse.chunk_index > base,
+                PregeneratedResponse.chunk_index <= chunk_index
+            )
+            .order_by(PregeneratedResponse.chunk_index)
+        )
+        ahead = result.scalars().all()
+        ready = [row.chunk_index for row in ahead]
+
+        if ready != list(range(base + 1, chunk_index + 1)):
+            # The chunks in between must exist first; their job queues this one when done
+            if ready != list(range(base + 1, chunk_index)):
                 return
-                
-            # Get the next chunk and its image
-            next_chunk = chunks[next_chunk_index]
-            next_image_data = await get_image_data_from_chunk(next_chunk, progress.subtopic_id, db)
+
+            # Get the chunk and its image
+            next_chunk = chunks[chunk_index]
+            next_image_data = await get_chunk_image(explain_row.chunk_diagrams, chunks, chunk_index, subtopic_id, db)
             
             if next_image_data:
                 print("\n image exist")
             else:
                 print("\n image no exist ")        
                 
-            # Build prompt for the next chunk
+            # Build prompt as if the student had already continued through the chunks in between
             continue_query = ""
-            prompt, system_instruction = build_prompt(continue_query, progress.chat_memory, None, next_chunk, subject)
+            chat_memory = await load_turns(db, user_id, subtopic_id, after_seq=progress.summarized_through)
+            chat_memory = chat_memory + [{"question": "continue", "answer": row.response} for row in ahead]
+            prompt, system_instruction = build_prompt(continue_query, chat_memory, None, next_chunk, subject,
+                                                      progress.memory_summary)
             
-            # Generate AI response using thread pool (keep this sync call in executor)
-            loop = asyncio.get_event_loop()
-            generated_answer = await loop.run_in_executor(executor, generate_gemini_response, prompt, system_instruction, 0.3,next_image_data)
+            # Generate AI response on the async Gemini client, behind interactive requests.
+            # JobDropped propagates so the queue defers the job instead of losing it.
+            next_image = await get_asset_for_ref(db, next_image_data)
+            generated_answer = await generate_gemini_response(prompt, system_instruction, 0.3, next_image,
+                                                              priority=SPECULATIVE)
             
-            # Store pre-generated response in database using async update
-            await db.execute(
-                update(UserProgress)
+            # Store it only if the conversation has not diverged while we were generating
+            result = await db.execute(
+                select(UserProgress.chunk_index, UserProgress.lookahead_epoch)
                 .filter(
                     UserProgress.user_id == user_id,
                     UserProgress.subtopic_id == subtopic_id
                 )
+                .with_for_update()
+            )
+            current = result.one_or_none()
+            if not current or current.lookahead_epoch != progress.lookahead_epoch or current.chunk_index >= chunk_index:
+                await db.commit()
+                return
+
+            await db.execute(
+                pg_insert(PregeneratedResponse)
                 .values(
-                    next_continue_response=generated_answer,
-                    next_continue_image=next_image_data,
-                    next_response_chunk_index=next_chunk_index
+                    user_id=user_id,
+                    subtopic_id=subtopic_id,
+                    chunk_index=chunk_index,
+                    response=generated_answer,
+                    image=next_image_data
                 )
+                .on_conflict_do_nothing(constraint="uq_pregenerated_responses_target")
             )
             await db.commit()
             
-            print(f"✅ Pre-generated continue response for chunk {next_chunk_index}")
-                
-    except Exception as e:
-        print(f"❌ Pre-generation failed: {e}")
-        # Clear pre-generated data on failure if possible
-        try:
-            async with AsyncSessionLocal() as db:
-                await db.execute(
-                    update(UserProgress)
-                    .filter(
-                        UserProgress.user_id == user_id,
-                        UserProgress.subtopic_id == subtopic_id
-                    )
-                    .values(
-                        next_continue_response=None,
-                        next_continue_image=None,
-                        next_response_chunk_index=None
-                    )
-                )
-                await db.commit()
-        except:
-            pass  # If this fails too, just log and continue
+            print(f"✅ Pre-generated continue response for chunk {chunk_index}")
 
-async def get_image_data_from_chunk(chunk: str, subtopic_id: int,db: AsyncSession) -> Optional[str]:
-    """
-    Fetches and encodes image data from the Diagram table if the chunk contains 'image description'.
-    Uses the raw first line of the chunk, cleans LaTeX commands (\section, \subsection, \textbf),
-    and performs a substring search against Diagram.description.
-    
-    Args:
-        chunk (str): The chunk text to search for image description.
-        subtopic_id (int): The ID of the subtopic to query diagrams for.
-        db (Session): SQLAlchemy session for database operations.
-    
-    Returns:
-        Optional[str]: Base64-encoded image data, or None if no image is found.
+        # Extend the lookahead one chunk at a time
+        if chunk_index + 1 <= base + depth and chunk_index + 1 < len(chunks):
+            await enqueue_pregeneration(db, user_id, subtopic_id, chunk_index + 1, subject)
+
+
+async def schedule_pregeneration(db: AsyncSession, user_id: int, subtopic_id: int, chunk_index: int,
+                                 chunks: list, subject: str, restart: bool = False):
+    """Queue pre-generation of the chunk after chunk_index, if there is one."""
+    if chunk_index + 1 < len(chunks):
+        await enqueue_pregeneration(db, user_id, subtopic_id, chunk_index + 1, subject, restart=restart)
+
+async def get_chunk_image(chunk_diagrams: Optional[dict], chunks, chunk_index: int, subtopic_id: int,
+                          db: AsyncSession) -> Optional[str]:
     """
-    image_data = None
-    if isinstance(chunk, str) and "image description".lower() in chunk.lower():
-        # Split the chunk into lines and get the first line
-        lines = chunk.split('\n')
-        if not lines:
-            return None  # No lines in the chunk
-
-        first_line = lines[0].strip()  # e.g., "\subsection*{Union of Sets}" or "\section*{Introduction}" or "\textbf{Key Concepts}"
-        match = re.match(r'\\(section|subsection|textbf)\*?\{([^}]*)\}', first_line)
-        # Clean the first line by removing LaTeX commands (\section, \subsection, \textbf) and braces
-
-        # # Remove braces and any remaining LaTeX markup
-        if match:
-            description = match.group(2).strip()  # e.g., "সম্পাদ্য ১ ধাপ ১" or "Introduction"
-        else:
-            # Fallback: Remove braces and keep the line as is
-            description = first_line.replace("{", "").replace("}", "").strip()
+    Asset reference ("/assets/{sha256}") of the diagram for chunks[chunk_index],
+    or None.
 
+    Uses the chunk -> diagram map stored on Explain.chunk_diagrams at ingestion
+    and the image store. Explain rows ingested before the map existed
+    fall back to matching the chunk heading against Diagram.description.
+    """
+    if chunk_diagrams is not None:
+        diagram_id = chunk_diagrams.get(str(chunk_index))
+    else:
+        diagram_id = None
+        description = chunk_diagram_description(chunks[chunk_index])
         if description:
-            # Query the Diagram table for an image where the description contains the cleaned first line (case-insensitive)
             result = await db.execute(
-                select(Diagram).filter(
+                select(Diagram.id).filter(
                     Diagram.subtopic_id == subtopic_id,
                     func.lower(Diagram.description) == func.lower(description)
-                )
+                ).limit(1)
             )
-            diagram = result.scalar_one_or_none()
-            if diagram and diagram.image_content:
-                # Encode the image content as base64 for the frontend
-                image_data = base64.b64encode(diagram.image_content).decode('utf-8')
-    return image_data
+            diagram_id = result.scalar_one_or_none()
+    return await get_diagram_ref(db, diagram_id)
 
 # NEW: Modified /explains/ endpoint to use UserProgress table instead of session
 
@@ -290,20 +248,13 @@ router = APIRouter(
     tags=["explains"]
 )
 
-async def authenticate_and_validate_user(authorization: Optional[str], user_id: int, db: AsyncSession) -> User:
+def authenticate_user_token(authorization: Optional[str], user_id: int):
     try:
         user_data = get_user_from_token(authorization)
         if user_data.get("id") != user_id:
             raise HTTPException(status_code=401, detail="Unauthorized: Invalid token")
     except:
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing token")
-    
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User ID {user_id} not found")
-    
-    return user
 
 async def validate_subject_topic_subtopic(db: AsyncSession, subject: str, topic: str, subtopic: str) -> tuple:
     result = await db.execute(
@@ -339,8 +290,125 @@ async def validate_subject_topic_subtopic(db: AsyncSession, subject: str, topic:
     return row
 
 
+async def load_explain_context(db: AsyncSession, user_id: int, subject: str, topic: str, subtopic: str):
+    """
+    Resolve the user, the subject/topic/subtopic path, the Explain row, the
+    student's progress and the pre-generated response for their next chunk
+    in a single query.
+
+    Returns a row with user_id, subtopic_id, Explain (chunks deferred, see
+    chunk_store), UserProgress and PregeneratedResponse (the last three may
+    be None).
+    """
+    result = await db.execute(
+        select(User.id.label("user_id"), Subtopic.id.label("subtopic_id"), Explain, UserProgress, PregeneratedResponse)
+        .select_from(Subject)
+        .join(Topic, Subject.id == Topic.subject_id)
+        .join(Subtopic, Topic.id == Subtopic.topic_id)
+        .outerjoin(User, User.id == user_id)
+        .outerjoin(Explain, Explain.subtopic_id == Subtopic.id)
+        .outerjoin(UserProgress, and_(UserProgress.user_id == user_id, UserProgress.subtopic_id == Subtopic.id))
+        .outerjoin(PregeneratedResponse, and_(
+            PregeneratedResponse.user_id == user_id,
+            PregeneratedResponse.subtopic_id == Subtopic.id,
+            PregeneratedResponse.chunk_index == UserProgress.chunk_index + 1
+        ))
+        .options(defer(Explain.chunks))  # served from the chunk store by content_version
+        .filter(
+            Subject.name == subject,
+            Topic.name == topic,
+            Subtopic.name == subtopic
+        )
+    )
+    row = result.first()
+    if not row:
+        # Raises the specific 404
+        await validate_subject_topic_subtopic(db, subject, topic, subtopic)
+    if row.user_id is None:
+        raise HTTPException(status_code=404, detail=f"User ID {user_id} not found")
+    return row
+
+
+# Takes the pre-generated response, advances progress to it and records the turn
+CONSUME_PREGENERATED_SQL = text("""
+WITH consumed AS (
+    DELETE FROM pregenerated_responses
+    WHERE user_id = :user_id AND subtopic_id = :subtopic_id AND chunk_index <= :chunk_index
+    RETURNING chunk_index, response
+), advanced AS (
+    UPDATE user_progress
+    SET chunk_index = :chunk_index,
+        turn_count = turn_count + 1,
+        last_updated = now(),
+        last_continue_at = :last_continue_at,
+        continue_interval_seconds = :continue_interval_seconds
+    WHERE user_id = :user_id AND subtopic_id = :subtopic_id AND chunk_index = :chunk_index - 1
+      AND EXISTS (SELECT 1 FROM consumed WHERE chunk_index = :chunk_index)
+    RETURNING turn_count
+)
+INSERT INTO chat_turns (user_id, subtopic_id, seq, question, answer)
+SELECT :user_id, :subtopic_id, advanced.turn_count, :question, consumed.response
+FROM advanced, consumed
+WHERE consumed.chunk_index = :chunk_index
+RETURNING seq
+""")
+
+async def consume_pregenerated_response(db: AsyncSession, user_id: int, subtopic_id: int, chunk_index: int,
+                                        question: str, progress_values: dict) -> Optional[int]:
+    """
+    Atomically use the pre-generated response for chunk_index (dropping any
+    older ones) and record it as the student's next turn. Returns the turn's
+    seq, or None if a concurrent request already consumed it. Commits.
+    """
+    result = await db.execute(CONSUME_PREGENERATED_SQL, {
+        "user_id": user_id,
+        "subtopic_id": subtopic_id,
+        "chunk_index": chunk_index,
+        "question": question,
+        **progress_values
+    })
+    seq = result.scalar_one_or_none()
+    await db.commit()
+    return seq
+
+
+async def get_chunk_index(explain: Explain, chunks: list, db: AsyncSession):
+    """
+    Return the FAISS index over this subtopic's chunks, from the in-process cache
+    when possible. On a miss the embeddings stored at ingestion are loaded; rows
+    ingested before embeddings were persisted, or by a different embedding backend
+    than the one encoding queries here, fall back to encoding the chunks once.
+    """
+    version = explain.content_version or chunks_version(chunks)
+    index = index_cache.get(explain.subtopic_id, version)
+    if index is not None:
+        return index
+
+    blob = None
+    if explain.content_version:
+        result = await db.execute(select(Explain.chunk_embeddings).filter(Explain.id == explain.id))
+        blob = result.scalar_one_or_none()
+
+    def _build():
+        embeddings = None
+        if blob and explain.content_version == chunks_version(chunks, model.embedding_space):
+            embeddings = unpack_embeddings(blob)
+        if embeddings is None or embeddings.shape[0] != len(chunks):
+            embeddings = encode_chunks(model, chunks)
+        return index_cache.put(explain.subtopic_id, version, build_index(embeddings))
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, _build)
+
+
+def semantic_cache_scope(explain: Explain, chunks: list) -> str:
+    """Version the semantic cache entries of a subtopic are stamped with: its chunks and purges."""
+    return f"{explain.content_version or chunks_version(chunks)}:{explain.semantic_cache_version or 0}"
+
+
 async def process_query_logic(query: str, subject: str, chunks: list, chunk_index: int, 
-                       chat_memory: list, explain_query: ExplainQuery, progress: UserProgress,  user_id: int, subtopic_id: int, db: AsyncSession):
+                       explain_query: ExplainQuery, progress: UserProgress,  user_id: int, subtopic_id: int, db: AsyncSession,
+                       explain: Explain = None):
       # Handle query
     query = query.lower()
     context = None
@@ -367,20 +435,7 @@ async def process_query_logic(query: str, subject: str, chunks: list, chunk_inde
     elif query == "refresh":
       #  print("\n\n i am here inside refresh screen \n\n")
         chunk_index = 0 # Start from chunk_index = 1
-         # Use async update instead of object modification
-        await db.execute(
-            update(UserProgress)
-            .filter(
-                UserProgress.user_id == user_id,
-                UserProgress.subtopic_id == subtopic_id
-            )
-            .values(
-                chunk_index=0,
-                chat_memory=[]
-            )
-        )
-        await db.commit()
-        
+        # Progress and chat memory are reset when the answer is recorded (record_explain_turn)
       
         query =  "Explain the context easy fun way"
         context = None
@@ -396,25 +451,23 @@ async def process_query_logic(query: str, subject: str, chunks: list, chunk_inde
         
 
         # Only allow custom queries for English subject - but check relevance
-        # Custom query with FAISS
-        # model = SentenceTransformer('all-MiniLM-L6-v2')
-        def _faiss_search():
-            embeddings = model.encode(chunks, convert_to_numpy=True)
-            dimension = embeddings.shape[1]
-            index = faiss.IndexFlatL2(dimension)
-            index.add(embeddings)
-            query_embedding = model.encode([query], convert_to_numpy=True)
-            top_k = 3
-            distances, indices = index.search(query_embedding, top_k)
-            return distances, indices
-        loop = asyncio.get_event_loop()
-        distances, indices = await loop.run_in_executor(executor, _faiss_search)   
+        # Custom query with FAISS over the cached per-subtopic index
+        index = await get_chunk_index(explain, chunks, db)
+        query_embedding = await embedder.encode(query)
+        top_k = 3
+        # A flat search over one subtopic's chunks is microseconds, no need for the executor
+        distances, indices = index.search(query_embedding.reshape(1, -1), top_k)
          # Check relevance - if the closest match has too high distance, it's irrelevant
         min_distance = distances[0][0]  # Get the smallest distance (closest match)
         RELEVANCE_THRESHOLD = 1.5  # Adjust this threshold as needed
         if min_distance > RELEVANCE_THRESHOLD:
             # Query is not relevant to the content
             return "IRRELEVANT_ENGLISH_QUERY", None, None, chunk_index
+
+        # A near-identical question already answered in this subtopic needs no Gemini call
+        cached_answer = semantic_cache.lookup(subtopic_id, semantic_cache_scope(explain, chunks), query_embedding)
+        if cached_answer is not None:
+            return "SEMANTIC_CACHE_HIT", cached_answer, None, chunk_index
         context = [chunks[idx] for idx in indices[0]]
         selected_chunk=None
     return query, context, selected_chunk, chunk_index
@@ -422,14 +475,12 @@ async def process_query_logic(query: str, subject: str, chunks: list, chunk_inde
 
 
 
-def build_prompt(query: str, chat_memory: list, context, chunks, subject: str) ->  tuple[str, str]:
-      # NEW: Prepare memory_text from UserProgress.chat_memory
-    memory_text = "\n\n".join([
-        f"User: {pair['question']}\nAssistant: {pair['answer']}"
-        for pair in chat_memory[-30:]
-    ]) if chat_memory else "No prior conversation."
-    
-    
+def build_prompt(query: str, chat_memory: list, context, chunks, subject: str,
+                 memory_summary: Optional[str] = None) ->  tuple[str, str]:
+    """
+    chat_memory holds the turns not yet folded into memory_summary; as many
+    of them as fit the subject's token budget are sent verbatim.
+    """
   #  print(f"gemini api will get this \n the chatmemory:{chat_memory}\n\n chunk is {chunks}")
     if subject =='গণিত' or subject == "উচ্চতর গণিত":
         system_instruction =r"""
@@ -491,6 +542,10 @@ Your teaching approach:
 """
     else:
         system_instruction="Explain in easy and fun way"
+
+    # Whatever the fixed parts leave of the token budget goes to chat memory
+    fixed_tokens = estimate_tokens(system_instruction) + estimate_tokens(query) + estimate_tokens(str(context if context else chunks))
+    memory_text = build_memory_text(chat_memory, memory_summary, prompt_token_budget(subject) - fixed_tokens - 200)
         
         
     if subject == 'গণিত' or subject == "উচ্চতর গণিত":
@@ -517,85 +572,200 @@ Your teaching approach:
 
     Relevant Text:
     {context if context else chunks}"""
-    
+
+    MEMORY_TOKENS.labels(subject=subject).observe(estimate_tokens(memory_text))
+    PROMPT_TOKENS.labels(subject=subject).observe(estimate_tokens(system_instruction) + estimate_tokens(prompt))
     return prompt, system_instruction
    
    
 
 
+async def record_explain_turn(question: str, answer: str, chunk_index: int,
+                              user_id: int, subtopic_id: int, db: AsyncSession,
+                              progress_values: Optional[dict] = None, reset: bool = False):
+    """
+    Append a question/answer pair to chat_turns and advance chunk_index.
+    With reset (a refresh), the conversation starts over with this turn: the
+    earlier turns and the memory summary are dropped in the same transaction.
 
-
-async def generate_ai_response_and_update_progress(prompt: str,system_instruction:str, query: str, answer_text: str, 
-                                           progress: UserProgress, chunk_index: int, 
-                                           explain_query: ExplainQuery,user_id: int, subtopic_id: int,db: AsyncSession, image_data: Optional[str] = None) -> str:
-
-    
-    # Generate response
-    # Run Gemini API call in threadpool
-    loop = asyncio.get_event_loop()
-    answer = await loop.run_in_executor(executor, generate_gemini_response, prompt,system_instruction, 0.3,image_data)
-    
-
- 
-    # NEW: Update UserProgress with new chunk_index and chat_memory
- 
-
-    # When updating:
-    new_pair = {"question": explain_query.query, "answer": answer}
-    chat_memory_updated = progress.chat_memory + [new_pair] 
-    
-    if len(chat_memory_updated) > 30:
-        chat_memory_updated = chat_memory_updated[-30:]  # Keep only last 30
-
-   
-    # Use async update instead of object modification
-    await db.execute(
+    A turn recorded here was answered live, so the conversation no longer
+    matches the pre-generated lookahead: it is dropped and lookahead_epoch is
+    bumped so in-flight jobs discard their results.
+    """
+    progress_values = dict(progress_values or {})
+    if reset:
+        await clear_turns(db, user_id, subtopic_id)
+        progress_values.update(memory_summary=None, summarized_through=UserProgress.turn_count)
+    # Use async update instead of object modification; the new turn_count is the turn's seq
+    result = await db.execute(
         update(UserProgress)
         .filter(
             UserProgress.user_id == user_id,
             UserProgress.subtopic_id == subtopic_id
         )
         .values(
-            chat_memory=chat_memory_updated,
             chunk_index=chunk_index,
-            last_updated=datetime.utcnow()
+            last_updated=datetime.utcnow(),
+            turn_count=UserProgress.turn_count + 1,
+            lookahead_epoch=UserProgress.lookahead_epoch + 1,
+            **progress_values
+        )
+        .returning(UserProgress.turn_count, UserProgress.summarized_through)
+    )
+    counts = result.one_or_none()
+    if counts:
+        await append_turn(db, user_id, subtopic_id, counts.turn_count, question, answer)
+    await db.execute(
+        delete(PregeneratedResponse).filter(
+            PregeneratedResponse.user_id == user_id,
+            PregeneratedResponse.subtopic_id == subtopic_id
         )
     )
     await db.commit()
+    if counts:
+        schedule_memory_fold(user_id, subtopic_id, *counts)
 
-    return answer
 
+# Folds running on this instance, so a burst of turns starts only one per conversation
+_memory_folds = set()
+_memory_fold_tasks = set()
 
+def schedule_memory_fold(user_id: int, subtopic_id: int, turn_count: int, summarized_through: int):
+    """Fold older turns into the running summary in the background, when enough are pending."""
+    key = (user_id, subtopic_id)
+    if key in _memory_folds or not needs_fold(turn_count, summarized_through):
+        return
+    _memory_folds.add(key)
+    task = asyncio.get_running_loop().create_task(fold_chat_memory(user_id, subtopic_id))
+    _memory_fold_tasks.add(task)
 
-# AFTER
-@router.post("/{subject}/{topic}/{subtopic}/explains/", response_model=ExplainResponse)
-async def post_explain(
+    def _done(task):
+        _memory_fold_tasks.discard(task)
+        _memory_folds.discard(key)
+    task.add_done_callback(_done)
+
+
+async def fold_chat_memory(user_id: int, subtopic_id: int):
+    """
+    Fold every unsummarized turn except the last MEMORY_VERBATIM_TURNS into
+    UserProgress.memory_summary, at most CHAT_MEMORY_TURNS at a time (oldest
+    first), so a backlog left by shed folds drains over the next turns. A
+    failed or shed fold is simply retried after the next turn.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(UserProgress).filter(
+                    UserProgress.user_id == user_id,
+                    UserProgress.subtopic_id == subtopic_id
+                )
+            )
+            progress = result.scalar_one_or_none()
+            if not progress:
+                return
+
+            # Turn seqs are consecutive, so this range holds at most CHAT_MEMORY_TURNS turns
+            # and load_turns returns all of them
+            fold_through = min(progress.turn_count - MEMORY_VERBATIM_TURNS,
+                               progress.summarized_through + CHAT_MEMORY_TURNS)
+            to_fold = await load_turns(db, user_id, subtopic_id, after_seq=progress.summarized_through,
+                                       through_seq=fold_through)
+            if not to_fold:
+                return
+
+            prompt, system_instruction = build_summary_prompt(progress.memory_summary, to_fold)
+            summary = await generate_gemini_response(prompt, system_instruction, 0.2, priority=SPECULATIVE)
+
+            # Skip the write if a refresh or another fold moved the summary on meanwhile
+            await db.execute(
+                update(UserProgress)
+                .filter(
+                    UserProgress.user_id == user_id,
+                    UserProgress.subtopic_id == subtopic_id,
+                    UserProgress.summarized_through == progress.summarized_through
+                )
+                .values(
+                    memory_summary=summary,
+                    summarized_through=fold_through,
+                    last_updated=UserProgress.last_updated
+                )
+            )
+            await db.commit()
+    except JobDropped:
+        pass
+    except Exception as e:
+        print(f"❌ Chat memory fold failed: {e}")
+
+
+# How often a waiting request checks whether its client has gone away
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1.0"))
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    Await coro, cancelling it if the HTTP client disconnects first so an
+    abandoned request does not keep its Gemini call running.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def generate_ai_response_and_update_progress(prompt: str,system_instruction:str, query: str, answer_text: str, 
+                                           chunk_index: int, 
+                                           explain_query: ExplainQuery,user_id: int, subtopic_id: int,db: AsyncSession, image: Optional[bytes] = None,
+                                           request: Optional[Request] = None, progress_values: Optional[dict] = None,
+                                           reset: bool = False) -> str:
+
+    
+    # Generate response on the async Gemini client, abandoning it if the client leaves
+    generation = generate_gemini_response(prompt, system_instruction, 0.3, image)
+    try:
+        answer = await (cancel_on_disconnect(request, generation) if request else generation)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="The AI tutor took too long to respond. Please try again.")
+    
+    # NEW: Update UserProgress with new chunk_index and record the turn
+    await record_explain_turn(explain_query.query, answer, chunk_index, user_id, subtopic_id, db,
+                              progress_values, reset)
+
+    return answer
+
+
+async def prepare_explain(
     subject: str,
     topic: str,
     subtopic: str,
     explain_query: ExplainQuery,
-    background_tasks: BackgroundTasks,
-    user_id: int = Header(...),
-    db: AsyncSession = Depends(get_async_db),
-    authorization: Optional[str] = Header(None)
+    user_id: int,
+    db: AsyncSession,
+    authorization: Optional[str]
 ):
-    # Keep these as sync calls - they're fast database queries
-    user = await authenticate_and_validate_user(authorization, user_id, db)
-    subject_obj, topic_obj, subtopic_obj = await validate_subject_topic_subtopic(db, subject, topic, subtopic)
-  
-    # Fetch explain record
-    result = await db.execute(select(Explain).filter(Explain.subtopic_id == subtopic_obj.id))
-    explain = result.scalar_one_or_none()
-    
-    result = await db.execute(
-        select(UserProgress).filter(
-            UserProgress.user_id == user_id,
-            UserProgress.subtopic_id == subtopic_obj.id
-        )
-    )
-    temp_progress = result.scalar_one_or_none()
-    # Load chunks
-    chunks = explain.chunks
+    """
+    Shared front half of the explain endpoints.
+
+    Returns a finished ExplainResponse for early exits and pre-generated
+    continue hits, otherwise a dict with everything needed to call Gemini and
+    record the turn.
+    """
+    authenticate_user_token(authorization, user_id)
+
+    # User, taxonomy, chunk version, progress and any pre-generated next response in one round trip
+    context_row = await load_explain_context(db, user_id, subject, topic, subtopic)
+    subtopic_id = context_row.subtopic_id
+    explain = context_row.Explain
+    temp_progress = context_row.UserProgress
+
+    # Load chunks (shared, immutable, cached per content version)
+    chunks = await get_chunks(db, subtopic_id, explain.content_version) if explain else None
     if not chunks:
         raise HTTPException(status_code=404, detail="No chunks available for this subtopic") 
 
@@ -621,10 +791,12 @@ async def post_explain(
     if (explain_query.query.lower() == "explain" and 
         explain_query.is_initial and 
         temp_progress and 
-        temp_progress.chat_memory):
-        # Early return - no need for full progress setup
-        previous_answers = [str(pair['answer']) for pair in temp_progress.chat_memory]
-        return ExplainResponse(answer="", image=None, initial_response=previous_answers)
+        temp_progress.turn_count):
+        previous_turns = await load_turns(db, user_id, subtopic_id)
+        if previous_turns:
+            # Early return - no need for full progress setup
+            previous_answers = [str(pair['answer']) for pair in previous_turns]
+            return ExplainResponse(answer="", image=None, initial_response=previous_answers)
 
     # Early check for continue completion
     if (explain_query.query.lower() == "continue" and 
@@ -637,9 +809,8 @@ async def post_explain(
     if not progress:
         progress = UserProgress(
             user_id=user_id,
-            subtopic_id=subtopic_obj.id,
-            chunk_index=0,
-            chat_memory=[]
+            subtopic_id=subtopic_id,
+            chunk_index=0
         )
         db.add(progress)
         await db.commit()
@@ -648,57 +819,25 @@ async def post_explain(
     
        
        # 🚀 CHECK FOR PRE-GENERATED CONTINUE RESPONSE
-    if (explain_query.query.lower() == "continue" and 
-        progress.next_continue_response and 
-        progress.next_response_chunk_index == progress.chunk_index + 1):
-        
+    progress_values = {}
+    if explain_query.query.lower() == "continue":
+        progress_values = continue_timing(progress, datetime.now(timezone.utc))
+        pregenerated = context_row.PregeneratedResponse
+        PREGEN_CACHE_LOOKUPS.labels(result="hit" if pregenerated else "miss").inc()
+    else:
+        pregenerated = None
+
+    # Consume it, advance progress and record the turn in one statement;
+    # if a concurrent request beat us to it, fall through and answer live
+    if pregenerated and await consume_pregenerated_response(db, user_id, subtopic_id, pregenerated.chunk_index,
+                                                            explain_query.query, progress_values) is not None:
         # Use pre-generated response
-        answer = progress.next_continue_response
-        image = progress.next_continue_image
-        
-        # Update progress
-        new_pair = {"question": explain_query.query, "answer": answer}
-        chat_memory_updated = progress.chat_memory + [new_pair]
-        if len(chat_memory_updated) > 30:
-            chat_memory_updated = chat_memory_updated[-30:]
+        answer = pregenerated.response
+        image = pregenerated.image
+        schedule_memory_fold(user_id, subtopic_id, progress.turn_count + 1, progress.summarized_through)
         
-        await db.execute(
-            update(UserProgress)
-            .filter(
-                UserProgress.user_id == user_id,
-                UserProgress.subtopic_id == subtopic_obj.id
-            )
-            .values(
-                chat_memory=chat_memory_updated,
-                chunk_index=progress.next_response_chunk_index, 
-                last_updated=datetime.utcnow()
-            )
-         )
-        await db.commit()
-        
-        # Clear used response with async update
-        await db.execute(
-            update(UserProgress)
-            .filter(
-                UserProgress.user_id == user_id,
-                UserProgress.subtopic_id == subtopic_obj.id
-            )
-            .values(
-                next_continue_response=None,
-                next_continue_image=None,
-                next_response_chunk_index=None
-            )
-        )
-        await db.commit()
-        
-        # Start background generation for next response
-        background_tasks.add_task(
-    pre_generate_continue_response,
-    user_id,
-    subtopic_obj.id,
-    chunks,
-    subject
-)
+        # Queue generation of the next response
+        await schedule_pregeneration(db, user_id, subtopic_id, pregenerated.chunk_index, chunks, subject)
         current_dir = os.getcwd()
         filename = os.path.join(current_dir, "explain_raw_text.txt")
         with open(filename, 'w', encoding='utf-8') as file:
@@ -707,14 +846,15 @@ async def post_explain(
 
     chunk_index = progress.chunk_index
    
-    chat_memory = progress.chat_memory
+    memory_summary = progress.memory_summary
 
    
     result = await process_query_logic(explain_query.query, subject, chunks, chunk_index, 
-                                   chat_memory, explain_query, progress, user_id, subtopic_obj.id, db)
-    # ✅ Clear local chat_memory for refresh
-    if explain_query.query.lower() == "refresh":
-        chat_memory = []
+                                   explain_query, progress, user_id, subtopic_id, db, explain)
+    # ✅ Refresh starts the conversation over (written with the answer, see record_explain_turn)
+    reset = explain_query.query.lower() == "refresh"
+    if reset:
+        memory_summary = None
 
         # Handle early return cases
     if isinstance(result, ExplainResponse):
@@ -726,11 +866,19 @@ async def post_explain(
         print("🚫 RETURNING IRRELEVANT ENGLISH QUERY MESSAGE")
         english_message = "I'm sorry, but your question seems to be out of context for the current English topic we're studying. Please ask questions related to the English subject matter we're covering."
         return ExplainResponse(answer=english_message, image=None)
+    if query == "SEMANTIC_CACHE_HIT":
+        answer = context
+        await record_explain_turn(explain_query.query, answer, chunk_index, user_id, subtopic_id, db,
+                                  progress_values)
+        await schedule_pregeneration(db, user_id, subtopic_id, chunk_index, chunks, subject, restart=True)
+        return ExplainResponse(answer=answer, image=None)
 
    # print(f"\n\nGemini API get -------this   {chunk_index}")
 
-    # Fetch image data using the new function
-    image_data = await get_image_data_from_chunk(selected_chunk, subtopic_obj.id, db)
+    # Diagram for the chunk being explained (custom questions have none)
+    image_data = None
+    if selected_chunk is not None:
+        image_data = await get_chunk_image(explain.chunk_diagrams, chunks, chunk_index, subtopic_id, db)
     
     if image_data:
         print("\nimage exist\n")
@@ -739,18 +887,147 @@ async def post_explain(
 
 
     
-    prompt, system_instruction =  build_prompt(query, chat_memory, context, selected_chunk, subject)
-    answer =await generate_ai_response_and_update_progress(prompt,system_instruction, query, explain_query.query, 
-                                                                progress, chunk_index, explain_query, user_id, subtopic_obj.id,db,image_data)
+    # Turns not yet folded into the summary (none on a refresh)
+    recent_turns = [] if reset else await load_turns(db, user_id, subtopic_id, after_seq=progress.summarized_through)
+    prompt, system_instruction =  build_prompt(query, recent_turns, context, selected_chunk, subject, memory_summary)
+
+    # Without chat memory the prompt is the same for every student: try the shared cache
+    shared_response = None
+    if not recent_turns and not memory_summary:
+        shared_response = {
+            "cache_key": response_cache_key(prompt, system_instruction, MODEL, 0.3, image_data),
+            "variant": response_variant(user_id, progress.turn_count),
+            "content_version": explain.content_version or chunks_version(chunks),
+        }
+        answer = await get_shared_response(db, **shared_response)
+        if answer is not None:
+            await record_explain_turn(explain_query.query, answer, chunk_index, user_id, subtopic_id, db,
+                                      progress_values, reset)
+            await schedule_pregeneration(db, user_id, subtopic_id, chunk_index, chunks, subject, restart=True)
+            return ExplainResponse(answer=answer, image=image_data)
+
+    # Custom questions are remembered for the semantic cache once answered
+    semantic_entry = None
+    if context is not None:
+        semantic_entry = {
+            "subtopic_id": subtopic_id,
+            "version": semantic_cache_scope(explain, chunks),
+            "embedding": await embedder.encode(query),  # already in the embedder's LRU
+            "question": query,
+        }
+
+    return {
+        "prompt": prompt,
+        "system_instruction": system_instruction,
+        "query": query,
+        "image_data": image_data,
+        "image_bytes": await get_asset_for_ref(db, image_data),
+        "chunk_index": chunk_index,
+        "subtopic_id": subtopic_id,
+        "chunks": chunks,
+        "progress_values": progress_values,
+        "reset": reset,
+        "shared_response": shared_response,
+        "semantic_entry": semantic_entry,
+    }
+
+
+# AFTER
+@router.post("/{subject}/{topic}/{subtopic}/explains/", response_model=ExplainResponse)
+async def post_explain(
+    subject: str,
+    topic: str,
+    subtopic: str,
+    explain_query: ExplainQuery,
+    request: Request,
+    user_id: int = Header(...),
+    db: AsyncSession = Depends(get_async_db),
+    authorization: Optional[str] = Header(None)
+):
+    # Database statements and time for the whole request
+    with track_db_usage("explains"):
+        plan = await prepare_explain(subject, topic, subtopic, explain_query, user_id, db, authorization)
+        if isinstance(plan, ExplainResponse):
+            return plan
+
+        answer =await generate_ai_response_and_update_progress(plan["prompt"], plan["system_instruction"], plan["query"], explain_query.query, 
+                                                                    plan["chunk_index"], explain_query, user_id, plan["subtopic_id"], db, plan["image_bytes"],
+                                                                    request, plan["progress_values"], plan["reset"])
+        if plan["shared_response"]:
+            await store_shared_response(db, subtopic_id=plan["subtopic_id"], response=answer, **plan["shared_response"])
+        if plan["semantic_entry"]:
+            semantic_cache.add(answer=answer, **plan["semantic_entry"])
     
 
-    # Start background generation for next continue
-    background_tasks.add_task(
-    pre_generate_continue_response,
-    user_id,
-    subtopic_obj.id,
-    chunks,
-    subject
-)
+        # Queue generation of the next continue, restarting any job that used the old conversation
+        await schedule_pregeneration(db, user_id, plan["subtopic_id"], plan["chunk_index"], plan["chunks"], subject,
+                                     restart=True)
     
-    return ExplainResponse(answer=answer,image=image_data)
\ No newline at end of file
+        return ExplainResponse(answer=answer,image=plan["image_data"])
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/{subject}/{topic}/{subtopic}/explains/stream/")
+async def post_explain_stream(
+    subject: str,
+    topic: str,
+    subtopic: str,
+    explain_query: ExplainQuery,
+    user_id: int = Header(...),
+    db: AsyncSession = Depends(get_async_db),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Streaming variant of /explains/ using server-sent events.
+
+    Events: "meta" ({"image"}) first, then "delta" ({"text"}) markdown pieces,
+    then "done" with the full ExplainResponse. Early exits and pre-generated
+    continue hits (and shared cache hits) are sent as a single "done" event.
+    Progress and chat memory (including a refresh's reset) are written once,
+    only after the whole answer has streamed; a disconnect or error before that
+    leaves progress untouched and queues no pre-generation.
+    """
+    # Database statements and time up to the first byte (the turn is recorded on a separate session)
+    with track_db_usage("explains_stream"):
+        plan = await prepare_explain(subject, topic, subtopic, explain_query, user_id, db, authorization)
+
+    async def event_stream():
+        if isinstance(plan, ExplainResponse):
+            yield sse_event("done", plan.model_dump())
+            return
+
+        yield sse_event("meta", {"image": plan["image_data"]})
+        parts = []
+        try:
+            async for delta in stream_gemini_response(plan["prompt"], plan["system_instruction"], 0.3, plan["image_bytes"]):
+                parts.append(delta)
+                yield sse_event("delta", {"text": delta})
+        except Exception as e:
+            print(f"❌ Explain stream failed: {e}")
+            yield sse_event("error", {"detail": "Failed to generate explanation"})
+            return
+
+        answer = "".join(parts).strip()
+        # The request-scoped session is already released once streaming starts
+        async with AsyncSessionLocal() as stream_db:
+            await record_explain_turn(explain_query.query, answer, plan["chunk_index"],
+                                      user_id, plan["subtopic_id"], stream_db, plan["progress_values"],
+                                      plan["reset"])
+            if plan["shared_response"]:
+                await store_shared_response(stream_db, subtopic_id=plan["subtopic_id"], response=answer,
+                                            **plan["shared_response"])
+            await schedule_pregeneration(stream_db, user_id, plan["subtopic_id"], plan["chunk_index"], plan["chunks"], subject,
+                                         restart=True)
+        if plan["semantic_entry"]:
+            semantic_cache.add(answer=answer, **plan["semantic_entry"])
+        yield sse_event("done", ExplainResponse(answer=answer, image=plan["image_data"]).model_dump())
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -15,77 +15,138 @@
 #     print(data)
 #     return AddResponse(result=data.a + data.b)
 
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, insert, case, cast, true, or_
 from typing import Optional
-from datetime import datetime
-from ..database.session import SessionLocal
-from ..database.models import Subject, Topic, Subtopic, User, MCQ, QuizAttempt, QuizAnswer, QuizScore, Quiz1Attempt, Quiz1, Quiz1Score, PractiseAnswer, PractiseAttempt, FacialExpression
-from ..schemas.quizzes import QuizAnswerSubmission, QuizQuestionResponse, PracticeQuizAnswerSubmission, PracticeQuizQuestionResponse, MCQResponse
-from sqlalchemy.sql import func
-import base64
+from datetime import datetime, timedelta
+from collections import Counter
+import os
+from ..database.models import Subject, Topic, Subtopic, User, MCQ, QuizAttempt, QuizAnswer, QuizScore, Quiz1Attempt, Quiz1, Quiz1Score, PractiseAnswer, PractiseAttempt
+from ..schemas.quizzes import QuizAnswerSubmission, QuizQuestionResponse, PracticeQuizAnswerSubmission, PracticeQuizQuestionResponse, NextQuestions, PrefetchedQuestion, PractisePackResponse, PractisePackSubmission
 import random
+from ..image_store import random_expression
+from ..question_bank import build_deck, build_placement_deck, placement_version, deal_question, reserve_next, take_reserved, release_reserved, get_questions
+from .explain import get_async_db
+from .dashboard import update_mastery
 # BEFORE - Add these imports
-from ..jwt_utils import create_access_token, get_user_from_token
+from ..jwt_utils import create_access_token, get_user_from_token, verify_token
 
 router = APIRouter(
-  
+
     tags=["quizzes"]
 )
 
+PRACTISE_PACK_EXPIRE_HOURS = int(os.getenv("PRACTISE_PACK_EXPIRE_HOURS", "72"))
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-        
-        
-
-# Update the fetch_random_images function to return Base64-encoded strings
-def fetch_random_images(db: Session):
-    import random
-    
+
+# Pick one random expression from each group; images are returned as /assets/ references
+# from the pool loaded at startup (see image_store.load_expression_pool)
+def fetch_random_images():
     group1_expressions = ["relieved", "happy", "dreamy"]
     group2_expressions = ["surprised", "question"]
-    
+
     send_images = random.choice([True, False])
     if not send_images:
         return None, None
-    
-    image1 = (
-        db.query(FacialExpression)
-        .filter(FacialExpression.facial_expression.in_(group1_expressions))
-        .order_by(func.random())
-        .first()
+
+    image1_data = random_expression(group1_expressions)
+    image2_data = random_expression(group2_expressions)
+
+    return image1_data, image2_data
+
+
+async def get_student_level(db: AsyncSession, user_id: int) -> int:
+    """student_level of the user's latest Quiz1 attempt, or 5 if it has no score."""
+    result = await db.execute(
+        select(Quiz1Score.student_level)
+        .filter(Quiz1Score.attempt_id == (
+            select(Quiz1Attempt.id)
+            .filter(Quiz1Attempt.user_id == user_id)
+            .order_by(Quiz1Attempt.started_at.desc())
+            .limit(1)
+            .scalar_subquery()
+        ))
+        .limit(1)
     )
-    
-    image2 = (
-        db.query(FacialExpression)
-        .filter(FacialExpression.facial_expression.in_(group2_expressions))
-        .order_by(func.random())
-        .first()
+    level = result.scalar_one_or_none()
+    return level if level is not None else 5
+
+
+def adjust_hardness(hardness_level: int, is_correct: bool) -> int:
+    return min(hardness_level + 1, 10) if is_correct else max(hardness_level - 1, 1)
+
+
+async def prefetch_next(db: AsyncSession, deck: dict, question, hardness_level: int, version, reuse: bool) -> tuple:
+    """
+    Reserve the question to serve after question for both answers, so the
+    client can show it without waiting for the answer to be submitted.
+    Returns (NextQuestions, updated deck).
+    """
+    branches = {
+        "correct": adjust_hardness(hardness_level, True),
+        "incorrect": adjust_hardness(hardness_level, False),
+    }
+    dealt, deck = await reserve_next(db, deck, question.id, branches, version, reuse=reuse)
+    next_questions = NextQuestions(**{
+        outcome: PrefetchedQuestion(question=next_question, hardness_level=level)
+        for outcome, (level, next_question) in dealt.items()
+        if next_question is not None
+    })
+    return next_questions, deck
+
+
+async def record_answer(db: AsyncSession, attempt_model, attempt_criteria, counters: dict, answer_model, answer: dict):
+    """
+    Insert an answer row and bump its attempt's running counters in one
+    statement: the attempt UPDATE ... RETURNING feeds the answer INSERT, so
+    each answer sees the counters including itself. Values in answer may be
+    callables taking the updated counter columns (e.g. to derive quiz_type).
+    Returns the updated counters, or None if no attempt matched.
+    """
+    attempts = attempt_model.__table__
+    bumped = (
+        update(attempts)
+        .where(*attempt_criteria)
+        .values(**counters)
+        .returning(attempts.c.id, *(attempts.c[name] for name in counters))
+        .cte("bumped")
     )
-    
-    # Convert images to Base64 strings if they exist
-    image1_data = base64.b64encode(image1.image).decode('utf-8') if image1 else None
-    image2_data = base64.b64encode(image2.image).decode('utf-8') if image2 else None
-    
-    return image1_data, image2_data
+    columns = answer_model.__table__.c
+    values = [
+        value(bumped.c) if callable(value) else cast(value, columns[name].type)
+        for name, value in answer.items()
+    ]
+    inserted = (
+        insert(answer_model.__table__)
+        .from_select(list(answer), select(*values).select_from(bumped))
+        .returning(columns.id)
+        .cte("inserted")
+    )
+    result = await db.execute(select(bumped).select_from(bumped.join(inserted, true())))
+    return result.first()
 
 
+async def validate_subject_topic_subtopic(db: AsyncSession, subject: str, topic: str, subtopic: str):
+    subject_obj = (await db.execute(select(Subject).filter(Subject.name == subject))).scalars().first()
+    if not subject_obj:
+        raise HTTPException(status_code=404, detail=f"Subject {subject} not found")
 
+    topic_obj = (await db.execute(
+        select(Topic).filter(Topic.name == topic, Topic.subject_id == subject_obj.id)
+    )).scalars().first()
+    if not topic_obj:
+        raise HTTPException(status_code=404, detail=f"Topic {topic} not found in subject {subject}")
 
+    subtopic_obj = (await db.execute(
+        select(Subtopic).filter(Subtopic.name == subtopic, Subtopic.topic_id == topic_obj.id)
+    )).scalars().first()
+    if not subtopic_obj:
+        raise HTTPException(status_code=404, detail=f"Subtopic {subtopic} not found in topic {topic}")
+    return subject_obj, topic_obj, subtopic_obj
 
-@router.post("/quiz1/", response_model=QuizQuestionResponse)
-async def quiz1(
-    submission: Optional[QuizAnswerSubmission] = None,
-    user_id: int = Header(...),
-    db: Session = Depends(get_db),
-     authorization: Optional[str] = Header(None)
-):
+
+async def authenticate_quiz_user(db: AsyncSession, user_id: int, authorization: Optional[str]):
     try:
         user_data = get_user_from_token(authorization)
         if user_data.get("id") != user_id:
@@ -93,37 +154,65 @@ async def quiz1(
     except:
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing token")
     # Validate user
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User ID {user_id} not found")
-    image1, image2 = fetch_random_images(db)
+
+
+@router.post("/quiz1/", response_model=QuizQuestionResponse)
+async def quiz1(
+    submission: Optional[QuizAnswerSubmission] = None,
+    user_id: int = Header(...),
+    db: AsyncSession = Depends(get_async_db),
+     authorization: Optional[str] = Header(None)
+):
+    await authenticate_quiz_user(db, user_id, authorization)
+    image1, image2 = fetch_random_images()
     hardness_level = 1
     attempt_id = None
 
+    # Select only the "quiz1" subject
+    subject = (await db.execute(select(Subject).filter(Subject.name == "quiz1"))).scalars().first()
+    if not subject:
+        raise HTTPException(status_code=404, detail="Subject 'quiz1' not found")
+
     if submission:
         # Validate question and attempt
-        question = db.query(MCQ).filter(MCQ.id == submission.question_id).first()
+        question = await db.get(MCQ, submission.question_id)
         if not question:
             raise HTTPException(status_code=404, detail=f"Question ID {submission.question_id} not found")
 
-        attempt = db.query(Quiz1Attempt).filter(Quiz1Attempt.id == submission.attempt_id, Quiz1Attempt.user_id == user_id).first()
+        attempt = (await db.execute(
+            select(Quiz1Attempt)
+            .filter(Quiz1Attempt.id == submission.attempt_id, Quiz1Attempt.user_id == user_id)
+            .with_for_update()
+        )).scalars().first()
         if not attempt:
             raise HTTPException(status_code=404, detail=f"Attempt ID {submission.attempt_id} not found")
         attempt_id = submission.attempt_id
 
         # Record quiz answer
-        quiz_answer = Quiz1(
-            user_id=user_id,
-            attempt_id=submission.attempt_id,
-            question_id=submission.question_id,
-            hardness_level=submission.current_hardness_level,
-            is_correct=submission.is_correct,
-            user_answer=question.correct_option if submission.is_correct else "incorrect",
-            correct_answer=question.correct_option,
-            response_time=submission.response_time
+        counters = await record_answer(
+            db, Quiz1Attempt, [Quiz1Attempt.id == submission.attempt_id],
+            dict(
+                questions_tried=Quiz1Attempt.questions_tried + 1,
+                total_correct=Quiz1Attempt.total_correct + int(submission.is_correct),
+                last_hardness_level=submission.current_hardness_level,
+                last_is_correct=submission.is_correct,
+                total_response_time=Quiz1Attempt.total_response_time + (submission.response_time or 0)
+            ),
+            Quiz1,
+            dict(
+                user_id=user_id,
+                attempt_id=submission.attempt_id,
+                question_id=submission.question_id,
+                hardness_level=submission.current_hardness_level,
+                is_correct=submission.is_correct,
+                user_answer=question.correct_option if submission.is_correct else "incorrect",
+                correct_answer=question.correct_option,
+                response_time=submission.response_time
+            )
         )
-        db.add(quiz_answer)
-        db.commit()
 
         # Adjust hardness level
         hardness_level = submission.current_hardness_level
@@ -133,11 +222,10 @@ async def quiz1(
             hardness_level = max(hardness_level - 1, 1)
 
         # Check if quiz is complete (10 questions)
-        question_number = submission.questions_tried
+        question_number = counters.questions_tried
         if question_number >= 10:
-            answers = db.query(Quiz1).filter(Quiz1.attempt_id == submission.attempt_id).all()
-            total_correct = sum(1 for ans in answers if ans.is_correct)
-            total_questions = len(answers)
+            total_correct = counters.total_correct
+            total_questions = counters.questions_tried
             score_percentage = (total_correct / total_questions) * 100 if total_questions > 0 else 0
 
             quiz_score = Quiz1Score(
@@ -149,66 +237,35 @@ async def quiz1(
             )
             db.add(quiz_score)
             attempt.completed_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
 
             return QuizQuestionResponse(
                 hardness_level=hardness_level,
                 message="You have completed the Quiz1! Check your scores.",
                 attempt_id=submission.attempt_id
             )
-        
+
         attempt_id = submission.attempt_id
+        if attempt.deck is None:
+            # Attempt started before decks existed
+            attempt.deck = await build_placement_deck(db, subject.id, 10)
     else:
-        # Create new quiz attempt
-        quiz_attempt = Quiz1Attempt(
-            user_id=user_id
+        # Create new quiz attempt with its deck of placement questions
+        attempt = Quiz1Attempt(
+            user_id=user_id,
+            deck=await build_placement_deck(db, subject.id, 10)
         )
-        db.add(quiz_attempt)
-        db.commit()
-        db.refresh(quiz_attempt)
-        attempt_id = quiz_attempt.id
-
-    # Get answered question IDs for this attempt
-    answered_question_ids = db.query(Quiz1.question_id).filter(Quiz1.attempt_id == attempt_id).all()
-    answered_question_ids = [qid for (qid,) in answered_question_ids]
+        db.add(attempt)
+        await db.commit()
+        await db.refresh(attempt)
+        attempt_id = attempt.id
 
-    # Try to find a question by randomly selecting subject, topic, and subtopic
-    next_question = None
-    max_attempts = 1000  # Prevent infinite loop
-    attempt_count = 0
-
-    while not next_question and attempt_count < max_attempts:
-        # Select only the "quiz1" subject
-        subject = db.query(Subject).filter(Subject.name == "quiz1").first()
-        if not subject:
-            raise HTTPException(status_code=404, detail="Subject 'quiz1' not found")
-
-        # Randomly select topic under the subject
-        topic = db.query(Topic).filter(Topic.subject_id == subject.id).order_by(func.random()).first()
-        if not topic:
-            attempt_count += 1
-            continue
-
-        # Randomly select subtopic under the topic
-        subtopic = db.query(Subtopic).filter(Subtopic.topic_id == topic.id).order_by(func.random()).first()
-        if not subtopic:
-            attempt_count += 1
-            continue
-
-        # Try to find a question at the current hardness level
-        next_question = (
-            db.query(MCQ)
-            .filter(
-                MCQ.subtopic_id == subtopic.id,
-                MCQ.hardness_level == hardness_level,
-                ~MCQ.id.in_(answered_question_ids)
-            )
-            .order_by(func.random())
-            .first()
-        )
-        attempt_count += 1
+    # Next question at this level from the attempt's deck (weighted over the subject's subtopics)
+    next_question, attempt.deck = await deal_question(db, attempt.deck, hardness_level,
+                                                      await placement_version(db, subject.id))
+    await db.commit()
 
-    # If no question found after max attempts
+    # If no question is left at this level
     if not next_question:
         return QuizQuestionResponse(
             hardness_level=hardness_level,
@@ -219,7 +276,7 @@ async def quiz1(
         )
 
     return QuizQuestionResponse(
-        question=MCQResponse.from_orm(next_question),
+        question=next_question,
         hardness_level=hardness_level,
         attempt_id=attempt_id,
         image1=image1,
@@ -234,65 +291,59 @@ async def quiz(
     topic: str,
     subtopic: str,
     submission: Optional[QuizAnswerSubmission] = None,
+    prefetch: bool = False,
     user_id: int = Header(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
      authorization: Optional[str] = Header(None)
 ):
-    try:
-        user_data = get_user_from_token(authorization)
-        if user_data.get("id") != user_id:
-            raise HTTPException(status_code=401, detail="Unauthorized: Invalid token")
-    except:
-        raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing token")
-    # Validate user
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User ID {user_id} not found")
-    image1, image2 = fetch_random_images(db)
+    await authenticate_quiz_user(db, user_id, authorization)
+    image1, image2 = fetch_random_images()
     # Validate subject, topic, subtopic
-    subject_obj = db.query(Subject).filter(Subject.name == subject).first()
-    if not subject_obj:
-        raise HTTPException(status_code=404, detail=f"Subject {subject} not found")
-    
-    topic_obj = db.query(Topic).filter(Topic.name == topic, Topic.subject_id == subject_obj.id).first()
-    if not topic_obj:
-        raise HTTPException(status_code=404, detail=f"Topic {topic} not found in subject {subject}")
-    
-    subtopic_obj = db.query(Subtopic).filter(Subtopic.name == subtopic, Subtopic.topic_id == topic_obj.id).first()
-    if not subtopic_obj:
-        raise HTTPException(status_code=404, detail=f"Subtopic {subtopic} not found in topic {topic}")
+    subject_obj, topic_obj, subtopic_obj = await validate_subject_topic_subtopic(db, subject, topic, subtopic)
 
-    latest_quiz1_attempt = db.query(Quiz1Attempt).filter(Quiz1Attempt.user_id == user_id).order_by(Quiz1Attempt.started_at.desc()).first()
-    hardness_level = db.query(Quiz1Score).filter(Quiz1Score.attempt_id == latest_quiz1_attempt.id).first().student_level if latest_quiz1_attempt and db.query(Quiz1Score).filter(Quiz1Score.attempt_id == latest_quiz1_attempt.id).first() else 5
+    hardness_level = await get_student_level(db, user_id)
     attempt_id = None
     questions_tried=None
     correct_answers= None
     if submission:
         # Validate question and attempt
-        question = db.query(MCQ).filter(MCQ.id == submission.question_id).first()
+        question = await db.get(MCQ, submission.question_id)
         if not question:
             raise HTTPException(status_code=404, detail=f"Question ID {submission.question_id} not found")
 
-        attempt = db.query(QuizAttempt).filter(QuizAttempt.id == submission.attempt_id, QuizAttempt.user_id == user_id).first()
+        attempt = (await db.execute(
+            select(QuizAttempt)
+            .filter(QuizAttempt.id == submission.attempt_id, QuizAttempt.user_id == user_id)
+            .with_for_update()
+        )).scalars().first()
         if not attempt:
             raise HTTPException(status_code=404, detail=f"Attempt ID {submission.attempt_id} not found")
         attempt_id = submission.attempt_id
 
-        # Record quiz answer
-        question_number = db.query(QuizAnswer).filter(QuizAnswer.attempt_id == submission.attempt_id).count() + 1
-        quiz_type = "quiz2" if question_number <= 5 else "quiz3"
-
-        quiz_answer = QuizAnswer(
-            attempt_id=submission.attempt_id,
-            quiz_type=quiz_type,
-            question_id=submission.question_id,
-            user_answer=question.correct_option if submission.is_correct else "incorrect",
-            correct_answer=question.correct_option,
-            is_correct=submission.is_correct,
-            response_time=submission.response_time
+        # Record quiz answer; the first 5 answers are quiz2, the rest quiz3
+        in_quiz2 = QuizAttempt.questions_tried < 5
+        counters = await record_answer(
+            db, QuizAttempt, [QuizAttempt.id == submission.attempt_id],
+            dict(
+                questions_tried=QuizAttempt.questions_tried + 1,
+                quiz2_correct=QuizAttempt.quiz2_correct + case((in_quiz2, int(submission.is_correct)), else_=0),
+                quiz3_correct=QuizAttempt.quiz3_correct + case((in_quiz2, 0), else_=int(submission.is_correct)),
+                last_hardness_level=submission.current_hardness_level,
+                last_is_correct=submission.is_correct,
+                total_response_time=QuizAttempt.total_response_time + (submission.response_time or 0)
+            ),
+            QuizAnswer,
+            dict(
+                attempt_id=submission.attempt_id,
+                quiz_type=lambda bumped: case((bumped.questions_tried <= 5, "quiz2"), else_="quiz3"),
+                question_id=submission.question_id,
+                user_answer=question.correct_option if submission.is_correct else "incorrect",
+                correct_answer=question.correct_option,
+                is_correct=submission.is_correct,
+                response_time=submission.response_time
+            )
         )
-        db.add(quiz_answer)
-        db.commit()
+        question_number = counters.questions_tried
 
         # Adjust hardness level
         hardness_level = submission.current_hardness_level
@@ -303,12 +354,10 @@ async def quiz(
 
         # Check if quiz is complete (10 questions)
         if question_number >= 10:
-            quiz2_answers = db.query(QuizAnswer).filter(QuizAnswer.attempt_id == submission.attempt_id, QuizAnswer.quiz_type == "quiz2").all()
-            quiz3_answers = db.query(QuizAnswer).filter(QuizAnswer.attempt_id == submission.attempt_id, QuizAnswer.quiz_type == "quiz3").all()
-            quiz2_correct = sum(1 for ans in quiz2_answers if ans.is_correct)
-            quiz3_correct = sum(1 for ans in quiz3_answers if ans.is_correct)
-            quiz2_score = (quiz2_correct / 5) * 100 if quiz2_answers else 0
-            quiz3_score = (quiz3_correct / 5) * 100 if quiz3_answers else 0
+            quiz2_correct = counters.quiz2_correct
+            quiz3_correct = counters.quiz3_correct
+            quiz2_score = (quiz2_correct / 5) * 100
+            quiz3_score = (quiz3_correct / 5) * 100
 
             quiz_score = QuizScore(
                 attempt_id=submission.attempt_id,
@@ -320,19 +369,20 @@ async def quiz(
             )
             db.add(quiz_score)
             attempt.completed_at = datetime.utcnow()
-            db.commit()
+            await update_mastery(db, attempt, quiz2_correct + quiz3_correct)
+            await db.commit()
 
             return QuizQuestionResponse(
                 hardness_level=hardness_level,
                 message="You have completed the quiz! Check your scores.",
                 attempt_id=submission.attempt_id
             )
-        
+
         attempt_id = submission.attempt_id
     else:
         # Check for latest incomplete quiz attempt
-        latest_attempt = (
-            db.query(QuizAttempt)
+        latest_attempt = (await db.execute(
+            select(QuizAttempt)
             .filter(
                 QuizAttempt.user_id == user_id,
                 QuizAttempt.subject_id == subject_obj.id,
@@ -341,74 +391,65 @@ async def quiz(
                 QuizAttempt.completed_at.is_(None)
             )
             .order_by(QuizAttempt.started_at.desc())
-            .first()
-        )
+            .limit(1)
+        )).scalars().first()
 
         questions_tried = 0
         correct_answers = 0
-        if latest_attempt and db.query(QuizAnswer).filter(QuizAnswer.attempt_id == latest_attempt.id).count() < 10:
+        if latest_attempt and latest_attempt.questions_tried < 10:
             # Reuse existing attempt
-            
+            attempt = latest_attempt
             attempt_id = latest_attempt.id
-            # Calculate questions tried and correct answers
-            quiz_answers = db.query(QuizAnswer).filter(QuizAnswer.attempt_id == attempt_id).all()
-            questions_tried = len(quiz_answers)
-            correct_answers = sum(1 for ans in quiz_answers if ans.is_correct)
-            # Get the last question's hardness level and correctness
-            last_answer = (
-                db.query(QuizAnswer)
-                .filter(QuizAnswer.attempt_id == attempt_id)
-                .join(MCQ, QuizAnswer.question_id == MCQ.id)
-                .order_by(QuizAnswer.id.desc())
-                .first()
-            )
-            if last_answer:
-                hardness_level = last_answer.question.hardness_level
-                if last_answer.is_correct:
-                    hardness_level = min(hardness_level + 1, 10)
-                else:
-                    hardness_level = max(hardness_level - 1, 1)
+            # Questions tried and correct answers from the attempt's counters
+            questions_tried = attempt.questions_tried
+            correct_answers = attempt.quiz2_correct + attempt.quiz3_correct
+            if attempt.deck and "level" in attempt.deck:
+                # Serve again at the level of the question left open
+                hardness_level = attempt.deck["level"]
+            elif attempt.last_hardness_level is not None:
+                # Go a level up or down from the last answer, as after a submission
+                hardness_level = adjust_hardness(attempt.last_hardness_level, bool(attempt.last_is_correct))
         else:
-            
-            # Create new quiz attempt
-            quiz_attempt = QuizAttempt(
+
+            # Create new quiz attempt with its question deck
+            attempt = QuizAttempt(
                 user_id=user_id,
                 subject_id=subject_obj.id,
                 topic_id=topic_obj.id,
-                subtopic_id=subtopic_obj.id
+                subtopic_id=subtopic_obj.id,
+                deck=await build_deck(db, subtopic_obj.id, subtopic_obj.question_bank_version, 10)
             )
-            db.add(quiz_attempt)
-            db.commit()
-            db.refresh(quiz_attempt)
-            attempt_id = quiz_attempt.id
-    # Get answered question IDs
-    answered_question_ids = db.query(QuizAnswer.question_id).filter(QuizAnswer.attempt_id == attempt_id).all()
-    answered_question_ids = [qid for (qid,) in answered_question_ids]
-
-    # Try to find a question at the current hardness level
-    next_question = (
-        db.query(MCQ)
-        .filter(
-            MCQ.subtopic_id == subtopic_obj.id,
-            MCQ.hardness_level == hardness_level,
-            ~MCQ.id.in_(answered_question_ids)
-        )
-        .order_by(func.random())
-        .first()
-    )
+            db.add(attempt)
+            await db.commit()
+            await db.refresh(attempt)
+            attempt_id = attempt.id
+    if attempt.deck is None:
+        # Attempt started before decks existed
+        attempt.deck = await build_deck(db, subtopic_obj.id, subtopic_obj.question_bank_version, 10)
 
-   # If no question found, try random search at same level (ignoring answered questions)
+    next_question = None
+    if submission:
+        # The question reserved for this answer, if it was prefetched
+        next_question, attempt.deck = await take_reserved(db, attempt.deck, submission.question_id,
+                                                          submission.is_correct, hardness_level,
+                                                          subtopic_obj.question_bank_version)
+        questions_answered = question_number
+    else:
+        attempt.deck = release_reserved(attempt.deck)
+        questions_answered = questions_tried
     if not next_question:
-        next_question = (
-            db.query(MCQ)
-            .filter(
-                MCQ.subtopic_id == subtopic_obj.id,
-                MCQ.hardness_level == hardness_level
-            )
-            .order_by(func.random())
-            .first()
-        )
-  
+        # Next question at the current hardness level from the attempt's deck; once the level is
+        # used up, reuse a question of the same level
+        next_question, attempt.deck = await deal_question(db, attempt.deck, hardness_level,
+                                                          subtopic_obj.question_bank_version, reuse=True)
+
+    # No prefetch for the last question, whose answer completes the quiz
+    next_questions = None
+    if prefetch and next_question and questions_answered + 1 < 10:
+        next_questions, attempt.deck = await prefetch_next(db, attempt.deck, next_question, hardness_level,
+                                                           subtopic_obj.question_bank_version, reuse=True)
+    await db.commit()
+
     # If still no question found, quiz is complete
     if not next_question:
         return QuizQuestionResponse(
@@ -423,17 +464,18 @@ async def quiz(
 
     print("question tried is ",questions_tried)
     return QuizQuestionResponse(
-        question=MCQResponse.from_orm(next_question),
+        question=next_question,
         hardness_level=hardness_level,
         attempt_id=attempt_id,
         questions_tried=questions_tried,
         correct_answers= correct_answers,
         image1=image1,
-        image2=image2
+        image2=image2,
+        next_questions=next_questions
     )
-    
-    
-    
+
+
+
 
 # Practice quiz endpoint
 @router.post("/{subject}/{topic}/{subtopic}/practise/", response_model=PracticeQuizQuestionResponse)
@@ -442,142 +484,91 @@ async def practice_quiz(
     topic: str,
     subtopic: str,
     submission: Optional[PracticeQuizAnswerSubmission] = None,
+    prefetch: bool = False,
     user_id: int = Header(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     authorization: Optional[str] = Header(None)
 ):
-    try:
-        user_data = get_user_from_token(authorization)
-        if user_data.get("id") != user_id:
-            raise HTTPException(status_code=401, detail="Unauthorized: Invalid token")
-    except:
-        raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing token")
-    # Validate user
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User ID {user_id} not found")
-    
-    image1, image2 = fetch_random_images(db)
+    await authenticate_quiz_user(db, user_id, authorization)
+
+    image1, image2 = fetch_random_images()
     # Validate subject, topic, and subtopic
-    subject_obj = db.query(Subject).filter(Subject.name == subject).first()
-    if not subject_obj:
-        raise HTTPException(status_code=404, detail=f"Subject {subject} not found")
-    
-    topic_obj = db.query(Topic).filter(
-        Topic.name == topic,
-        Topic.subject_id == subject_obj.id
-    ).first()
-    if not topic_obj:
-        raise HTTPException(status_code=404, detail=f"Topic {topic} not found in subject {subject}")
-    
-    subtopic_obj = db.query(Subtopic).filter(
-        Subtopic.name == subtopic,
-        Subtopic.topic_id == topic_obj.id
-    ).first()
-    if not subtopic_obj:
-        raise HTTPException(status_code=404, detail=f"Subtopic {subtopic} not found in topic {topic}")
+    subject_obj, topic_obj, subtopic_obj = await validate_subject_topic_subtopic(db, subject, topic, subtopic)
 
     # Determine hardness level and questions tried
-    latest_quiz1_attempt = db.query(Quiz1Attempt).filter(Quiz1Attempt.user_id == user_id).order_by(Quiz1Attempt.started_at.desc()).first()
-    hardness_level = db.query(Quiz1Score).filter(Quiz1Score.attempt_id == latest_quiz1_attempt.id).first().student_level if latest_quiz1_attempt and db.query(Quiz1Score).filter(Quiz1Score.attempt_id == latest_quiz1_attempt.id).first() else 5
+    hardness_level = await get_student_level(db, user_id)
     # Create or retrieve PractiseAttempt
     practise_attempt = None
     questions_tried = 0
     number_correct = 0
-    if not submission:
-        # Check for the latest PractiseAttempt for the user and subtopic
-        practise_attempt = (
-            db.query(PractiseAttempt)
-            .filter(
-                PractiseAttempt.user_id == user_id,
-                PractiseAttempt.subtopic_id == subtopic_obj.id
-            )
-            .order_by(PractiseAttempt.started_at.desc())
-            .first()
+    # Latest PractiseAttempt for the user and subtopic (offline packs are only answered through practise/sync/)
+    latest_practise_attempt = (
+        select(PractiseAttempt)
+        .filter(
+            PractiseAttempt.user_id == user_id,
+            PractiseAttempt.subtopic_id == subtopic_obj.id,
+            or_(PractiseAttempt.deck.is_(None), ~PractiseAttempt.deck.has_key("offline"))
         )
+        .order_by(PractiseAttempt.started_at.desc())
+        .limit(1)
+    )
+    if submission:
+        latest_practise_attempt = latest_practise_attempt.with_for_update()
+    practise_attempt = (await db.execute(latest_practise_attempt)).scalars().first()
+    if not submission:
         if practise_attempt:
-            # Calculate questions tried and correct answers
-            questions_tried = (
-                db.query(PractiseAnswer)
-                .filter(PractiseAnswer.attempt_id == practise_attempt.id)
-                .count()
-            )
-            number_correct = (
-                db.query(PractiseAnswer)
-                .filter(
-                    PractiseAnswer.attempt_id == practise_attempt.id,
-                    PractiseAnswer.is_correct == True
-                )
-                .count()
-            )
-            # Get the last question's difficulty and correctness
-            last_answer = (
-                db.query(PractiseAnswer)
-                .filter(PractiseAnswer.attempt_id == practise_attempt.id)
-                .join(MCQ, PractiseAnswer.question_id == MCQ.id)
-                .order_by(PractiseAnswer.id.desc())
-                .first()
-            )
-            if last_answer:
-                hardness_level = last_answer.question.hardness_level
-                # Adjust hardness level based on last question's correctness
-                if last_answer.is_correct:
-                    hardness_level = min(hardness_level + 1, 10)  # Increase, max 10
-                else:
-                    hardness_level = max(hardness_level - 1, 1)   # Decrease, min 1
+            # Questions tried and correct answers from the attempt's counters
+            questions_tried = practise_attempt.questions_tried
+            number_correct = practise_attempt.total_correct
+            if practise_attempt.deck and "level" in practise_attempt.deck:
+                # Serve again at the level of the question left open
+                hardness_level = practise_attempt.deck["level"]
+            elif practise_attempt.last_hardness_level is not None:
+                # Go a level up or down from the last answer, as after a submission
+                hardness_level = adjust_hardness(practise_attempt.last_hardness_level,
+                                                 bool(practise_attempt.last_is_correct))
         if not practise_attempt or questions_tried >= 20:
             # Create a new PractiseAttempt if none exists or latest has >= 20 answers
             practise_attempt = PractiseAttempt(
                 user_id=user_id,
                 subject_id=subject_obj.id,
                 topic_id=topic_obj.id,
-                subtopic_id=subtopic_obj.id
+                subtopic_id=subtopic_obj.id,
+                deck=await build_deck(db, subtopic_obj.id, subtopic_obj.question_bank_version, 20)
             )
             db.add(practise_attempt)
-            db.commit()
-            db.refresh(practise_attempt)
+            await db.commit()
+            await db.refresh(practise_attempt)
             questions_tried = 0
             number_correct = 0
             # Determine hardness level and questions tried
-            latest_quiz1_attempt = db.query(Quiz1Attempt).filter(Quiz1Attempt.user_id == user_id).order_by(Quiz1Attempt.started_at.desc()).first()
-            hardness_level = db.query(Quiz1Score).filter(Quiz1Score.attempt_id == latest_quiz1_attempt.id).first().student_level if latest_quiz1_attempt and db.query(Quiz1Score).filter(Quiz1Score.attempt_id == latest_quiz1_attempt.id).first() else 5
-   
+            hardness_level = await get_student_level(db, user_id)
+
     else:
-        # Retrieve the most recent PractiseAttempt for the user and subtopic
-        practise_attempt = (
-            db.query(PractiseAttempt)
-            .filter(
-                PractiseAttempt.user_id == user_id,
-                PractiseAttempt.subtopic_id == subtopic_obj.id
-            )
-            .order_by(PractiseAttempt.started_at.desc())
-            .first()
-        )
+        # The most recent PractiseAttempt for the user and subtopic
         if not practise_attempt:
             raise HTTPException(status_code=400, detail="No active practice attempt found")
-        # Save the user's answer to PractiseAnswer
-        practise_answer = PractiseAnswer(
-            attempt_id=practise_attempt.id,
-            question_id=submission.question_id,
-            is_correct=submission.is_correct,
-            response_time=submission.response_time
-        )
-        db.add(practise_answer)
-        db.commit()
-        # Update questions tried and correct count
-        questions_tried = (
-            db.query(PractiseAnswer)
-            .filter(PractiseAnswer.attempt_id == practise_attempt.id)
-            .count()
-        )
-        number_correct = (
-            db.query(PractiseAnswer)
-            .filter(
-                PractiseAnswer.attempt_id == practise_attempt.id,
-                PractiseAnswer.is_correct == True
+        # Save the user's answer to PractiseAnswer and update questions tried and correct count
+        counters = await record_answer(
+            db, PractiseAttempt, [PractiseAttempt.id == practise_attempt.id],
+            dict(
+                questions_tried=PractiseAttempt.questions_tried + 1,
+                total_correct=PractiseAttempt.total_correct + int(submission.is_correct),
+                last_hardness_level=submission.current_hardness_level,
+                last_is_correct=submission.is_correct,
+                total_response_time=PractiseAttempt.total_response_time + (submission.response_time or 0)
+            ),
+            PractiseAnswer,
+            dict(
+                attempt_id=practise_attempt.id,
+                question_id=submission.question_id,
+                is_correct=submission.is_correct,
+                response_time=submission.response_time
             )
-            .count()
         )
+        await db.commit()
+        questions_tried = counters.questions_tried
+        number_correct = counters.total_correct
         # Update hardness level based on submission
         hardness_level = submission.current_hardness_level
         if submission.is_correct:
@@ -596,16 +587,30 @@ async def practice_quiz(
             image2=image2
         )
 
-    # Fetch next question (allow reuse of questions)
-    next_question = (
-        db.query(MCQ)
-        .filter(
-            MCQ.subtopic_id == subtopic_obj.id,
-            MCQ.hardness_level == hardness_level
-        )
-        .order_by(func.random())
-        .first()
-    )
+    if practise_attempt.deck is None:
+        # Attempt started before decks existed
+        practise_attempt.deck = await build_deck(db, subtopic_obj.id, subtopic_obj.question_bank_version, 20)
+
+    next_question = None
+    if submission:
+        # The question reserved for this answer, if it was prefetched
+        next_question, practise_attempt.deck = await take_reserved(db, practise_attempt.deck, submission.question_id,
+                                                                   submission.is_correct, hardness_level,
+                                                                   subtopic_obj.question_bank_version)
+    else:
+        practise_attempt.deck = release_reserved(practise_attempt.deck)
+    if not next_question:
+        # Fetch next question from the attempt's deck (allow reuse of questions)
+        next_question, practise_attempt.deck = await deal_question(db, practise_attempt.deck, hardness_level,
+                                                                   subtopic_obj.question_bank_version, reuse=True)
+
+    # No prefetch for the last question, whose answer completes the practice
+    next_questions = None
+    if prefetch and next_question and questions_tried + 1 < 20:
+        next_questions, practise_attempt.deck = await prefetch_next(db, practise_attempt.deck, next_question,
+                                                                    hardness_level, subtopic_obj.question_bank_version,
+                                                                    reuse=True)
+    await db.commit()
 
     # If no questions are available at this hardness level, end the quiz
     if not next_question:
@@ -619,10 +624,161 @@ async def practice_quiz(
         )
 
     return PracticeQuizQuestionResponse(
-        question=MCQResponse.from_orm(next_question),
+        question=next_question,
         hardness_level=hardness_level,
         questions_tried=questions_tried,
         number_correct=number_correct,
         image1=image1,
-        image2=image2
-    )
\ No newline at end of file
+        image2=image2,
+        next_questions=next_questions
+    )
+
+
+# Offline practice: the whole set in one request, the answers in another
+@router.post("/{subject}/{topic}/{subtopic}/practise/pack/", response_model=PractisePackResponse)
+async def practise_pack(
+    subject: str,
+    topic: str,
+    subtopic: str,
+    user_id: int = Header(...),
+    db: AsyncSession = Depends(get_async_db),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Start a practice attempt to run offline and send its deck whole. The
+    client serves it the way practice_quiz does: start at hardness_level,
+    serve the next unused question id of the current level (starting the
+    level over once it is used up), go a level up after a correct answer and
+    down after an incorrect one, for questions_per_pack questions.
+    """
+    await authenticate_quiz_user(db, user_id, authorization)
+    subject_obj, topic_obj, subtopic_obj = await validate_subject_topic_subtopic(db, subject, topic, subtopic)
+
+    hardness_level = await get_student_level(db, user_id)
+    deck = await build_deck(db, subtopic_obj.id, subtopic_obj.question_bank_version, 20)
+    practise_attempt = PractiseAttempt(
+        user_id=user_id,
+        subject_id=subject_obj.id,
+        topic_id=topic_obj.id,
+        subtopic_id=subtopic_obj.id,
+        deck={**deck, "level": hardness_level, "start_level": hardness_level, "offline": True}
+    )
+    db.add(practise_attempt)
+    await db.commit()
+    await db.refresh(practise_attempt)
+
+    questions = await get_questions(db, {mcq_id for ids in deck["levels"].values() for mcq_id in ids},
+                                    subtopic_obj.question_bank_version)
+    pack_token = create_access_token(
+        {"type": "practise_pack", "user_id": user_id, "attempt_id": practise_attempt.id, "subtopic_id": subtopic_obj.id},
+        expires_delta=timedelta(hours=PRACTISE_PACK_EXPIRE_HOURS)
+    )
+    return PractisePackResponse(
+        pack_token=pack_token,
+        hardness_level=hardness_level,
+        levels=deck["levels"],
+        questions=questions,
+        questions_per_pack=20
+    )
+
+
+@router.post("/{subject}/{topic}/{subtopic}/practise/sync/", response_model=PracticeQuizQuestionResponse)
+async def practise_sync(
+    subject: str,
+    topic: str,
+    subtopic: str,
+    submission: PractisePackSubmission,
+    user_id: int = Header(...),
+    db: AsyncSession = Depends(get_async_db),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Record the answers of an offline practice set in one transaction. Send
+    every answer of the pack so far, in order: answers already recorded are
+    skipped, so a sync cut off by the network can simply be sent again. Pack
+    attempts are only answered here; practice_quiz never resumes them.
+    """
+    await authenticate_quiz_user(db, user_id, authorization)
+    subject_obj, topic_obj, subtopic_obj = await validate_subject_topic_subtopic(db, subject, topic, subtopic)
+
+    pack = verify_token(submission.pack_token)
+    if pack.get("type") != "practise_pack" or pack.get("user_id") != user_id or pack.get("subtopic_id") != subtopic_obj.id:
+        raise HTTPException(status_code=401, detail="Unauthorized: Invalid practice pack")
+
+    practise_attempt = (await db.execute(
+        select(PractiseAttempt)
+        .filter(PractiseAttempt.id == pack.get("attempt_id"), PractiseAttempt.user_id == user_id)
+        .with_for_update()
+    )).scalars().first()
+    if not practise_attempt:
+        raise HTTPException(status_code=404, detail=f"Attempt ID {pack.get('attempt_id')} not found")
+
+    if len(submission.answers) > 20:
+        raise HTTPException(status_code=400, detail="A practice pack has at most 20 questions")
+    deck = practise_attempt.deck
+    if not deck or not deck.get("offline"):
+        raise HTTPException(status_code=400, detail="This practice attempt is not an offline pack")
+    answers = submission.answers
+    # Replay the pack the way the client serves it, so the levels come from
+    # the deck rather than from the client
+    hardness_level = deck.get("start_level", deck.get("level", 5))
+    served = Counter()
+    for position, answer in enumerate(answers):
+        level = str(hardness_level)
+        ids = deck["levels"].get(level, [])
+        expected_id = ids[served[level] % len(ids)] if ids else None
+        if answer.question_id != expected_id:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Answer {position + 1} is for question {answer.question_id}, "
+                       f"but this practice pack serves {expected_id} there"
+            )
+        served[level] += 1
+        hardness_level = adjust_hardness(hardness_level, answer.is_correct)
+
+    # Answers already recorded must be the ones sent again
+    recorded = (await db.execute(
+        select(PractiseAnswer.question_id, PractiseAnswer.is_correct)
+        .filter(PractiseAnswer.attempt_id == practise_attempt.id)
+        .order_by(PractiseAnswer.id)
+    )).all()
+    sent = [(answer.question_id, answer.is_correct) for answer in answers]
+    if sent[:len(recorded)] != [tuple(row) for row in recorded][:len(sent)]:
+        raise HTTPException(status_code=400, detail="The answers do not match the ones already recorded for this pack")
+
+    new_answers = answers[len(recorded):]
+    if new_answers:
+        db.add_all([
+            PractiseAnswer(
+                attempt_id=practise_attempt.id,
+                question_id=answer.question_id,
+                is_correct=answer.is_correct,
+                response_time=answer.response_time
+            )
+            for answer in new_answers
+        ])
+        # The attempt row is locked, so the counters can be updated in place
+        practise_attempt.questions_tried += len(new_answers)
+        practise_attempt.total_correct += sum(1 for answer in new_answers if answer.is_correct)
+        practise_attempt.total_response_time += sum(answer.response_time or 0 for answer in new_answers)
+        practise_attempt.last_hardness_level = int(level)
+        practise_attempt.last_is_correct = answers[-1].is_correct
+        # Move the cursors past the served questions
+        practise_attempt.deck = {
+            **deck,
+            "cursor": {level: min(count, len(deck["levels"].get(level, []))) for level, count in served.items()},
+            "level": hardness_level
+        }
+    else:
+        # Nothing new (a sync sent again): report the state as recorded
+        hardness_level = deck.get("level", hardness_level)
+    await db.commit()
+
+    questions_tried = practise_attempt.questions_tried
+    number_correct = practise_attempt.total_correct
+    return PracticeQuizQuestionResponse(
+        hardness_level=hardness_level,
+        message="You have completed 20 practice questions!" if questions_tried >= 20 else None,
+        questions_tried=questions_tried,
+        number_correct=number_correct
+    )
@@ -1,20 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 from typing import Optional
-from datetime import datetime
 import random
 from pydantic import BaseModel
-from ..database.models import Subject, Topic, Subtopic, User, MCQ, QuizAttempt, QuizAnswer, QuizScore, Quiz1Attempt, Quiz1, Quiz1Score, PractiseAnswer, PractiseAttempt, FacialExpression
-from ..schemas.quizzes import QuizAnswerSubmission, QuizQuestionResponse, PracticeQuizAnswerSubmission, PracticeQuizQuestionResponse, MCQResponse
+from ..schemas.quizzes import MCQResponse
 
 # Import your database models and utilities
-from ..database.session import SessionLocal
 from ..database.models import (
     Subject, Topic, Subtopic, User, MCQ, 
     QuizAttempt, QuizAnswer, PractiseAnswer, PractiseAttempt,
     ReviseSession, ReviseShownQuestion
 )
 from ..jwt_utils import get_user_from_token
+from .explain import get_async_db
 from sqlalchemy.sql import func
 
 # Create router
@@ -23,15 +22,6 @@ router = APIRouter(
     tags=["revise"]
 )
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class ReviseQuestionResponse(BaseModel):
     question: Optional[MCQResponse] = None
     message: Optional[str] = None
@@ -59,7 +49,7 @@ class ReviseRequest(BaseModel):
     submission: Optional[ReviseAnswerSubmission] = None
 
 # Helper function to get failed questions
-def get_failed_questions(db: Session, user_id: int, subject: str = None, topic: str = None, subtopic: str = None):
+async def get_failed_questions(db: AsyncSession, user_id: int, subject: str = None, topic: str = None, subtopic: str = None):
     """Get questions that user failed in last 5 practice and quiz attempts"""
     
     failed_question_ids = set()
@@ -67,26 +57,26 @@ def get_failed_questions(db: Session, user_id: int, subject: str = None, topic:
     # Get subject, topic, subtopic IDs if provided
     subject_id = topic_id = subtopic_id = None
     if subject:
-        subject_obj = db.query(Subject).filter(Subject.name == subject).first()
+        subject_obj = (await db.execute(select(Subject).filter(Subject.name == subject))).scalars().first()
         if subject_obj:
             subject_id = subject_obj.id
             if topic:
-                topic_obj = db.query(Topic).filter(
+                topic_obj = (await db.execute(select(Topic).filter(
                     Topic.name == topic,
                     Topic.subject_id == subject_id
-                ).first()
+                ))).scalars().first()
                 if topic_obj:
                     topic_id = topic_obj.id
                     if subtopic:
-                        subtopic_obj = db.query(Subtopic).filter(
+                        subtopic_obj = (await db.execute(select(Subtopic).filter(
                             Subtopic.name == subtopic,
                             Subtopic.topic_id == topic_id
-                        ).first()
+                        ))).scalars().first()
                         if subtopic_obj:
                             subtopic_id = subtopic_obj.id
     
     # Get last 5 practice attempts
-    practice_attempts_query = db.query(PractiseAttempt).filter(
+    practice_attempts_query = select(PractiseAttempt.id).filter(
         PractiseAttempt.user_id == user_id
     )
     if subtopic_id:
@@ -102,20 +92,20 @@ def get_failed_questions(db: Session, user_id: int, subject: str = None, topic:
             PractiseAttempt.subject_id == subject_id
         )
     
-    practice_attempts = practice_attempts_query.order_by(
+    practice_attempt_ids = (await db.execute(practice_attempts_query.order_by(
         PractiseAttempt.started_at.desc()
-    ).limit(5).all()
+    ).limit(5))).scalars().all()
     
     # Get failed questions from practice attempts
-    for attempt in practice_attempts:
-        failed_answers = db.query(PractiseAnswer).filter(
-            PractiseAnswer.attempt_id == attempt.id,
+    if practice_attempt_ids:
+        failed_answers = (await db.execute(select(PractiseAnswer.question_id).filter(
+            PractiseAnswer.attempt_id.in_(practice_attempt_ids),
             PractiseAnswer.is_correct == False
-        ).all()
-        failed_question_ids.update([ans.question_id for ans in failed_answers])
+        ))).scalars().all()
+        failed_question_ids.update(failed_answers)
     
     # Get last 5 quiz attempts
-    quiz_attempts_query = db.query(QuizAttempt).filter(
+    quiz_attempts_query = select(QuizAttempt.id).filter(
         QuizAttempt.user_id == user_id
     )
     if subtopic_id:
@@ -131,21 +121,21 @@ def get_failed_questions(db: Session, user_id: int, subject: str = None, topic:
             QuizAttempt.subject_id == subject_id
         )
     
-    quiz_attempts = quiz_attempts_query.order_by(
+    quiz_attempt_ids = (await db.execute(quiz_attempts_query.order_by(
         QuizAttempt.started_at.desc()
-    ).limit(5).all()
+    ).limit(5))).scalars().all()
     
     # Get failed questions from quiz attempts
-    for attempt in quiz_attempts:
-        failed_answers = db.query(QuizAnswer).filter(
-            QuizAnswer.attempt_id == attempt.id,
+    if quiz_attempt_ids:
+        failed_answers = (await db.execute(select(QuizAnswer.question_id).filter(
+            QuizAnswer.attempt_id.in_(quiz_attempt_ids),
             QuizAnswer.is_correct == False
-        ).all()
-        failed_question_ids.update([ans.question_id for ans in failed_answers])
+        ))).scalars().all()
+        failed_question_ids.update(failed_answers)
     
     # Return MCQ objects for failed questions
     if failed_question_ids:
-        return db.query(MCQ).filter(MCQ.id.in_(failed_question_ids)).all()
+        return (await db.execute(select(MCQ).filter(MCQ.id.in_(failed_question_ids)))).scalars().all()
     return []
 
 # Main revise endpoint
@@ -153,7 +143,7 @@ def get_failed_questions(db: Session, user_id: int, subject: str = None, topic:
 async def revise(
     body: Optional[ReviseRequest] = None,  # Changed from separate params
     user_id: int = Header(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     authorization: Optional[str] = Header(None)
 ):
     # Authentication
@@ -165,7 +155,7 @@ async def revise(
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing token")
     
     # Validate user
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User ID {user_id} not found")
     # Extract request and submission from body
@@ -174,10 +164,10 @@ async def revise(
     # Handle initial request or mode change
     if request:
         # Deactivate any existing active sessions for this user
-        db.query(ReviseSession).filter(
+        await db.execute(update(ReviseSession).filter(
             ReviseSession.user_id == user_id,
             ReviseSession.is_active == True
-        ).update({"is_active": False})
+        ).values(is_active=False))
         
         # Create new session
         new_session = ReviseSession(
@@ -188,11 +178,11 @@ async def revise(
             subtopic=request.subtopic
         )
         db.add(new_session)
-        db.commit()
-        db.refresh(new_session)
+        await db.commit()
+        await db.refresh(new_session)
         
         # Get failed questions based on mode
-        failed_questions = get_failed_questions(
+        failed_questions = await get_failed_questions(
             db, user_id, 
             subject=request.subject if request.mode == "subject" else None,
             topic=request.topic if request.mode == "subject" else None,
@@ -208,8 +198,7 @@ async def revise(
             )
         
         # Get first question
-        next_question_id = random.choice([q.id for q in failed_questions])
-        question = db.query(MCQ).filter(MCQ.id == next_question_id).first()
+        question = random.choice(failed_questions)
         
         return ReviseQuestionResponse(
             question=MCQResponse.from_orm(question),
@@ -219,10 +208,10 @@ async def revise(
         )
     
     # Get active session
-    active_session = db.query(ReviseSession).filter(
+    active_session = (await db.execute(select(ReviseSession).filter(
         ReviseSession.user_id == user_id,
         ReviseSession.is_active == True
-    ).first()
+    ))).scalars().first()
     
     if not active_session:
         # No active session - return a message to prompt mode selection
@@ -236,10 +225,10 @@ async def revise(
     # Handle answer submission
     if submission and not submission.retry:
         # Check if question already shown
-        existing = db.query(ReviseShownQuestion).filter(
+        existing = (await db.execute(select(ReviseShownQuestion).filter(
             ReviseShownQuestion.session_id == active_session.id,
             ReviseShownQuestion.question_id == submission.question_id
-        ).first()
+        ))).scalars().first()
         
         if not existing:
             # Mark question as shown
@@ -248,10 +237,10 @@ async def revise(
                 question_id=submission.question_id
             )
             db.add(shown_question)
-            db.commit()
+            await db.commit()
     
     # Get failed questions for this session
-    failed_questions = get_failed_questions(
+    failed_questions = await get_failed_questions(
         db, user_id,
         subject=active_session.subject,
         topic=active_session.topic,
@@ -259,10 +248,9 @@ async def revise(
     )
     
     # Get shown questions
-    shown_question_ids = db.query(ReviseShownQuestion.question_id).filter(
+    shown_question_ids = (await db.execute(select(ReviseShownQuestion.question_id).filter(
         ReviseShownQuestion.session_id == active_session.id
-    ).all()
-    shown_question_ids = [qid for (qid,) in shown_question_ids]
+    ))).scalars().all()
     
     # Get remaining questions
     failed_question_ids = [q.id for q in failed_questions]
@@ -274,7 +262,7 @@ async def revise(
     if not remaining_questions:
         # All questions shown - deactivate session
         active_session.is_active = False
-        db.commit()
+        await db.commit()
         
         return ReviseQuestionResponse(
             message="You have reviewed all failed questions! Click 'Restart Revise' to go through them again.",
@@ -289,7 +277,7 @@ async def revise(
     else:
         next_question_id = random.choice(remaining_questions)
     
-    question = db.query(MCQ).filter(MCQ.id == next_question_id).first()
+    question = await db.get(MCQ, next_question_id)
     
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
@@ -305,7 +293,7 @@ async def revise(
 @router.get("/stats")
 async def get_revision_stats(
     user_id: int = Header(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     authorization: Optional[str] = Header(None)
 ):
     # Authentication
@@ -317,20 +305,17 @@ async def get_revision_stats(
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing token")
     
     # Get revision statistics
-    total_sessions = db.query(ReviseSession).filter(
-        ReviseSession.user_id == user_id
-    ).count()
-    
-    completed_sessions = db.query(ReviseSession).filter(
-        ReviseSession.user_id == user_id,
-        ReviseSession.is_active == False
-    ).count()
+    counts = (await db.execute(
+        select(
+            func.count(ReviseSession.id),
+            func.count(ReviseSession.id).filter(ReviseSession.is_active == False),
+            func.count(ReviseSession.id).filter(ReviseSession.is_active == True)
+        ).filter(ReviseSession.user_id == user_id)
+    )).one()
+    total_sessions, completed_sessions, active_sessions = counts
     
     return {
         "total_sessions": total_sessions,
         "completed_sessions": completed_sessions,
-        "active_session": db.query(ReviseSession).filter(
-            ReviseSession.user_id == user_id,
-            ReviseSession.is_active == True
-        ).first() is not None
+        "active_session": active_sessions > 0
     }
\ No newline at end of file
@@ -15,7 +15,7 @@ class ExplainQuery(BaseModel):
 # Response model for explain (only answer)
 class ExplainResponse(BaseModel):
     answer: str
-    image: Optional[str] = None  # Base64-encoded image string (or None if no image)
+    image: Optional[str] = None  # Image reference, "/assets/{sha256}" (or None if no image)
     total:Optional[int]=None
     current:Optional[int]=None
     initial_response: Optional[List[str]] = None
\ No newline at end of file
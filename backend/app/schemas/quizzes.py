@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 
@@ -45,6 +45,17 @@ class MCQResponse(BaseModel):
         from_attributes = True
 
 
+# Question reserved for one outcome of the current question (prefetch=true)
+class PrefetchedQuestion(BaseModel):
+    question: MCQResponse
+    hardness_level: int
+
+
+class NextQuestions(BaseModel):
+    correct: Optional[PrefetchedQuestion] = None    # Served next if the current question is answered correctly
+    incorrect: Optional[PrefetchedQuestion] = None  # Served next otherwise
+
+
 # Response model for practice quiz question
 class PracticeQuizQuestionResponse(BaseModel):
     question: Optional[MCQResponse] = None
@@ -53,8 +64,9 @@ class PracticeQuizQuestionResponse(BaseModel):
     questions_tried: Optional[int] = None  # Number of questions tried in the attempt
     number_correct: Optional[int] = None   # Number of correct answers in the attempt
    # last_question_correct: Optional[bool] = None  # Whether the last question was correct
-    image1: Optional[str] = None  # Base64-encoded string for the first image
-    image2: Optional[str] = None  # Base64-encoded string for the second image
+    image1: Optional[str] = None  # "/assets/{sha256}" reference for the first image
+    image2: Optional[str] = None  # "/assets/{sha256}" reference for the second image
+    next_questions: Optional[NextQuestions] = None  # Only with prefetch=true
 
 
     class Config:
@@ -71,6 +83,28 @@ class PracticeQuizAnswerSubmission(BaseModel):
 
 
 
+# Offline practice set (practise/pack/), answered without the server
+class PractisePackResponse(BaseModel):
+    pack_token: str  # Signed; send it back with the answers to practise/sync/
+    hardness_level: int  # Level of the first question
+    levels: Dict[str, List[int]]  # Hardness level -> question ids, in serving order
+    questions: List[MCQResponse]
+    questions_per_pack: int
+
+# One answer of an offline practice set
+class PractisePackAnswer(BaseModel):
+    question_id: int
+    is_correct: bool
+    response_time: Optional[float] = None
+
+# Request model for syncing an offline practice set: every answer so far, in order
+class PractisePackSubmission(BaseModel):
+    pack_token: str
+    answers: List[PractisePackAnswer]
+
+
+
+
 # New QuizQuestionResponse schema
 class QuizQuestionResponse(BaseModel):
     question: Optional[MCQResponse] = None
@@ -79,8 +113,9 @@ class QuizQuestionResponse(BaseModel):
     attempt_id: Optional[int] = None
     questions_tried: Optional[int] = None  # New field
     correct_answers: Optional[int] = None  # New field
-    image1: Optional[str] = None  # Base64-encoded string for the first image
-    image2: Optional[str] = None  # Base64-encoded string for the second image
+    image1: Optional[str] = None  # "/assets/{sha256}" reference for the first image
+    image2: Optional[str] = None  # "/assets/{sha256}" reference for the second image
+    next_questions: Optional[NextQuestions] = None  # Only with prefetch=true
 
 
     class Config:
@@ -0,0 +1,151 @@
+"""
+Per-subtopic semantic cache for English custom questions.
+
+Students in the same subtopic ask near-identical questions ("what is a
+noun?"). Answered questions are kept with their query embeddings; a new
+question whose cosine similarity to a cached one reaches
+SEMANTIC_CACHE_THRESHOLD is answered from the cache without calling Gemini.
+
+Entries are scoped to a version of the subtopic (Explain.content_version and
+Explain.semantic_cache_version, see semantic_cache_scope() in
+router/explain.py), and a lookup with a newer one purges the subtopic. So
+editing a subtopic's chunks drops its answers, and so does
+purge_semantic_cache.py, which bumps semantic_cache_version; it runs in its own
+process, so every worker of every instance purges on its next lookup. The
+cache is bounded per subtopic and in the number of subtopics, and entries
+expire after SEMANTIC_CACHE_TTL_SECONDS. It is only touched from the event
+loop, so it needs no lock.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from prometheus_client import Counter, Gauge, Histogram
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_PER_SUBTOPIC = int(os.getenv("SEMANTIC_CACHE_MAX_PER_SUBTOPIC", "256"))
+SEMANTIC_CACHE_MAX_SUBTOPICS = int(os.getenv("SEMANTIC_CACHE_MAX_SUBTOPICS", "512"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "semantic_cache_lookups_total",
+    "English custom questions answered from the semantic cache (hit) or by Gemini (miss)",
+    ["result"]
+)
+SEMANTIC_CACHE_ENTRIES = Gauge(
+    "semantic_cache_entries",
+    "Questions held in the semantic cache"
+)
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    "semantic_cache_best_similarity",
+    "Cosine similarity of the closest cached question at lookup time",
+    buckets=[0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 1.0]
+)
+
+
+def _normalize(embedding: np.ndarray) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _SubtopicEntries:
+    def __init__(self, version: str):
+        self.version = version
+        self.vectors = []    # unit-length query embeddings
+        self.questions = []
+        self.answers = []
+        self.created = []    # time.monotonic() at insert
+
+    def __len__(self):
+        return len(self.answers)
+
+    def remove(self, position: int):
+        for column in (self.vectors, self.questions, self.answers, self.created):
+            del column[position]
+
+    def best_match(self, vector: np.ndarray):
+        """(position, similarity) of the closest cached question."""
+        similarities = np.stack(self.vectors) @ vector
+        position = int(np.argmax(similarities))
+        return position, float(similarities[position])
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_per_subtopic: int = SEMANTIC_CACHE_MAX_PER_SUBTOPIC,
+                 max_subtopics: int = SEMANTIC_CACHE_MAX_SUBTOPICS,
+                 ttl_seconds: int = SEMANTIC_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_per_subtopic = max_per_subtopic
+        self.max_subtopics = max_subtopics
+        self.ttl_seconds = ttl_seconds
+        self._subtopics = OrderedDict()  # subtopic_id -> _SubtopicEntries, least recently used first
+        self._size = 0
+
+    def _entries(self, subtopic_id: int, version: str) -> Optional[_SubtopicEntries]:
+        entries = self._subtopics.get(subtopic_id)
+        if entries is None:
+            return None
+        if entries.version != version:
+            self.purge(subtopic_id)
+            return None
+        self._subtopics.move_to_end(subtopic_id)
+
+        # Drop expired entries (they are in insertion order)
+        cutoff = time.monotonic() - self.ttl_seconds
+        while len(entries) and entries.created[0] < cutoff:
+            entries.remove(0)
+            self._size -= 1
+        SEMANTIC_CACHE_ENTRIES.set(self._size)
+        return entries
+
+    def lookup(self, subtopic_id: int, version: str, embedding: np.ndarray) -> Optional[str]:
+        """Cached answer to a question close enough to this one, if any."""
+        entries = self._entries(subtopic_id, version)
+        if entries:
+            position, similarity = entries.best_match(_normalize(embedding))
+            SEMANTIC_CACHE_SIMILARITY.observe(similarity)
+            if similarity >= self.threshold:
+                SEMANTIC_CACHE_LOOKUPS.labels(result="hit").inc()
+                return entries.answers[position]
+        SEMANTIC_CACHE_LOOKUPS.labels(result="miss").inc()
+        return None
+
+    def add(self, subtopic_id: int, version: str, embedding: np.ndarray, question: str, answer: str):
+        vector = _normalize(embedding)
+        entries = self._entries(subtopic_id, version)
+        if entries is None:
+            entries = self._subtopics[subtopic_id] = _SubtopicEntries(version)
+            while len(self._subtopics) > self.max_subtopics:
+                _, evicted = self._subtopics.popitem(last=False)
+                self._size -= len(evicted)
+        elif entries and entries.best_match(vector)[1] >= self.threshold:
+            # An equivalent question is already cached
+            return
+
+        entries.vectors.append(vector)
+        entries.questions.append(question)
+        entries.answers.append(answer)
+        entries.created.append(time.monotonic())
+        self._size += 1
+        if len(entries) > self.max_per_subtopic:
+            entries.remove(0)
+            self._size -= 1
+        SEMANTIC_CACHE_ENTRIES.set(self._size)
+
+    def purge(self, subtopic_id: Optional[int] = None):
+        """Forget one subtopic's cached answers, or all of them."""
+        if subtopic_id is None:
+            self._subtopics.clear()
+            self._size = 0
+        else:
+            entries = self._subtopics.pop(subtopic_id, None)
+            if entries is not None:
+                self._size -= len(entries)
+        SEMANTIC_CACHE_ENTRIES.set(self._size)
+
+
+semantic_cache = SemanticAnswerCache()
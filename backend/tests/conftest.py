@@ -0,0 +1,88 @@
+"""
+Fixtures for the router tests.
+
+The routers rely on Postgres (JSONB, ON CONFLICT, row locks), so the tests run
+against a real, disposable database given by TEST_DATABASE_URL, e.g.
+postgresql+psycopg2://postgres@localhost/tutor_test. Its tables are recreated
+once per run and truncated before every test; without TEST_DATABASE_URL the
+tests are skipped.
+"""
+import os
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+# The app reads these at import time; the engines only connect on first use.
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql+psycopg2://unused@localhost/unused"
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import chunk_store, question_bank, response_cache
+from app.database.session import Base, engine as sync_engine
+import app.database.models  # noqa: F401
+from app.jwt_utils import create_access_token
+from app.router.dashboard import router as dashboard_router
+from app.router.explain import router as explains_router
+from app.router.quizzes import router as quizzes_router
+from app.router.revise import router as revise_router
+from app.semantic_cache import semantic_cache
+
+
+def auth_headers(user_id: int, token_user: int = None) -> dict:
+    token = create_access_token({"id": token_user or user_id})
+    return {"user-id": str(user_id), "authorization": f"Bearer {token}"}
+
+
+def _clear_caches():
+    question_bank._banks.clear()
+    question_bank._placements.clear()
+    question_bank._questions.clear()
+    response_cache._memory.clear()
+    chunk_store._store.clear()
+    semantic_cache.purge()
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    Base.metadata.drop_all(bind=sync_engine)
+    Base.metadata.create_all(bind=sync_engine)
+    return sync_engine
+
+
+@pytest.fixture(scope="session")
+def reset_database(engine):
+    """Empty every table and the per-worker caches. TRUNCATE keeps the schema, so the
+    async pool's prepared statements stay valid across tests."""
+    tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+
+    def reset():
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+        _clear_caches()
+
+    return reset
+
+
+@pytest.fixture(scope="session")
+def client(engine):
+    # One TestClient (and so one event loop) for the whole run: the async engine's
+    # pooled connections belong to the loop they were opened on.
+    api = FastAPI()
+    api.include_router(quizzes_router)
+    api.include_router(dashboard_router)
+    api.include_router(revise_router)
+    api.include_router(explains_router)
+    with TestClient(api) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db(engine, reset_database):
+    """A freshly emptied database; yields the sync engine for seeding and checks."""
+    reset_database()
+    return engine
@@ -0,0 +1,81 @@
+"""Database statements per /explains/ request, as counted by track_db_usage (db_metrics.py)."""
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+import app.router.explain as explain
+from conftest import auth_headers
+
+URL = "/English/Grammar/Nouns/explains/"
+CHUNKS = '["Chunk zero.", "Chunk one.", "Chunk two.", "Chunk three."]'
+
+
+@pytest.fixture
+def explain_db(db, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # pre-generated answers are also written to ./explain_raw_text.txt
+    with db.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES (1, 'one@example.com')"))
+        conn.execute(text("INSERT INTO subjects (id, name) VALUES (1, 'English')"))
+        conn.execute(text("INSERT INTO topics (id, name, subject_id) VALUES (1, 'Grammar', 1)"))
+        conn.execute(text("INSERT INTO subtopics (id, name, topic_id) VALUES (1, 'Nouns', 1)"))
+        conn.execute(text("INSERT INTO explains (subtopic_id, chunks, content_version, chunk_diagrams) "
+                          "VALUES (1, CAST(:chunks AS jsonb), 'v1', '{}'::jsonb)"), {"chunks": CHUNKS})
+
+    async def fake_generate(prompt, system_instruction="", temperature=0.2, image=None, **kwargs):
+        return "generated answer"
+
+    monkeypatch.setattr(explain, "generate_gemini_response", fake_generate)
+    return db
+
+
+def statements(client, query):
+    """POST one explain query; returns (response, statements the request executed)."""
+    labels = {"endpoint": "explains"}
+    before = REGISTRY.get_sample_value("db_queries_per_request_sum", labels) or 0
+    response = client.post(URL, headers=auth_headers(1), json={"query": query, "is_initial": False})
+    return response, REGISTRY.get_sample_value("db_queries_per_request_sum", labels) - before
+
+
+def test_continue_with_pregenerated_response(client, explain_db):
+    with explain_db.begin() as conn:
+        conn.execute(text("INSERT INTO user_progress (user_id, subtopic_id, chunk_index) VALUES (1, 1, 0)"))
+        conn.execute(text("INSERT INTO pregenerated_responses (user_id, subtopic_id, chunk_index, response) "
+                          "VALUES (1, 1, 1, 'pregenerated answer')"))
+
+    response, count = statements(client, "continue")
+    assert response.status_code == 200
+    assert response.json()["answer"] == "pregenerated answer"
+    # load_explain_context, chunk store miss, the consume CTE, enqueue_pregeneration
+    assert count == 4
+
+    with explain_db.begin() as conn:
+        conn.execute(text("INSERT INTO pregenerated_responses (user_id, subtopic_id, chunk_index, response) "
+                          "VALUES (1, 1, 2, 'second answer')"))
+    response, count = statements(client, "continue")
+    assert response.json()["answer"] == "second answer"
+    # The chunks are now served from the chunk store
+    assert count == 3
+
+    with explain_db.connect() as conn:
+        assert conn.execute(text("SELECT chunk_index, turn_count FROM user_progress")).one() == (2, 2)
+        assert conn.execute(text("SELECT count(*) FROM chat_turns")).scalar() == 2
+
+
+def test_refresh(client, explain_db):
+    with explain_db.begin() as conn:
+        conn.execute(text("INSERT INTO user_progress (user_id, subtopic_id, chunk_index, turn_count) "
+                          "VALUES (1, 1, 2, 2)"))
+        conn.execute(text("INSERT INTO chat_turns (user_id, subtopic_id, seq, question, answer) "
+                          "VALUES (1, 1, 1, 'continue', 'a'), (1, 1, 2, 'continue', 'b')"))
+
+    response, count = statements(client, "refresh")
+    assert response.status_code == 200
+    assert response.json()["answer"] == "generated answer"
+    # load_explain_context, chunk store miss, shared response lookup, record_explain_turn
+    # (clear_turns, progress update, turn insert, pre-generation delete), store_shared_response,
+    # enqueue_pregeneration
+    assert count == 9
+
+    with explain_db.connect() as conn:
+        assert conn.execute(text("SELECT chunk_index, turn_count FROM user_progress")).one() == (0, 3)
+        assert conn.execute(text("SELECT seq, answer FROM chat_turns")).all() == [(3, "generated answer")]
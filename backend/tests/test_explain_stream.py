@@ -0,0 +1,67 @@
+"""The streaming explain endpoint writes progress only once the answer has streamed."""
+import json
+
+import pytest
+from sqlalchemy import text
+
+import app.router.explain as explain
+from conftest import auth_headers
+
+URL = "/English/Grammar/Nouns/explains/stream/"
+
+
+@pytest.fixture
+def progress_db(db):
+    with db.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES (1, 'one@example.com')"))
+        conn.execute(text("INSERT INTO subjects (id, name) VALUES (1, 'English')"))
+        conn.execute(text("INSERT INTO topics (id, name, subject_id) VALUES (1, 'Grammar', 1)"))
+        conn.execute(text("INSERT INTO subtopics (id, name, topic_id) VALUES (1, 'Nouns', 1)"))
+        conn.execute(text("INSERT INTO explains (subtopic_id, chunks, content_version, chunk_diagrams) "
+                          "VALUES (1, '[\"Chunk zero.\", \"Chunk one.\", \"Chunk two.\"]'::jsonb, 'v1', '{}'::jsonb)"))
+        conn.execute(text("INSERT INTO user_progress (user_id, subtopic_id, chunk_index, turn_count, memory_summary) "
+                          "VALUES (1, 1, 2, 2, 'summary')"))
+        conn.execute(text("INSERT INTO chat_turns (user_id, subtopic_id, seq, question, answer) "
+                          "VALUES (1, 1, 1, 'continue', 'a'), (1, 1, 2, 'continue', 'b')"))
+    return db
+
+
+def events(response):
+    """(event, data) pairs of a server-sent event stream."""
+    parsed = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+def progress(db):
+    with db.connect() as conn:
+        row = conn.execute(text("SELECT chunk_index, turn_count, memory_summary FROM user_progress")).one()
+        turns = conn.execute(text("SELECT seq, answer FROM chat_turns ORDER BY seq")).all()
+    return tuple(row), [tuple(turn) for turn in turns]
+
+
+def test_refresh_is_written_after_the_stream(client, progress_db, monkeypatch):
+    async def fake_stream(prompt, system_instruction="", temperature=0.2, image=None):
+        # Nothing is written while the answer streams
+        assert progress(progress_db) == ((2, 2, "summary"), [(1, "a"), (2, "b")])
+        yield "Fresh "
+        yield "start."
+
+    monkeypatch.setattr(explain, "stream_gemini_response", fake_stream)
+    response = client.post(URL, headers=auth_headers(1), json={"query": "refresh", "is_initial": False})
+    assert [event for event, _ in events(response)] == ["meta", "delta", "delta", "done"]
+    assert events(response)[-1][1]["answer"] == "Fresh start."
+    assert progress(progress_db) == ((0, 3, None), [(3, "Fresh start.")])
+
+
+def test_failed_refresh_stream_leaves_progress(client, progress_db, monkeypatch):
+    async def failing_stream(prompt, system_instruction="", temperature=0.2, image=None):
+        yield "Fresh "
+        raise RuntimeError("Gemini went away")
+
+    monkeypatch.setattr(explain, "stream_gemini_response", failing_stream)
+    response = client.post(URL, headers=auth_headers(1), json={"query": "refresh", "is_initial": False})
+    assert [event for event, _ in events(response)] == ["meta", "delta", "error"]
+    assert progress(progress_db) == ((2, 2, "summary"), [(1, "a"), (2, "b")])
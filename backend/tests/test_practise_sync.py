@@ -0,0 +1,94 @@
+"""Offline practice packs: practise/pack/ and practise/sync/."""
+from collections import Counter
+
+import pytest
+from sqlalchemy import text
+
+from app.router.quizzes import adjust_hardness
+from conftest import auth_headers
+
+PACK_URL = "/Math/Algebra/Linear/practise/pack/"
+SYNC_URL = "/Math/Algebra/Linear/practise/sync/"
+PRACTISE_URL = "/Math/Algebra/Linear/practise/"
+
+PATTERN = [True, True, False, True, True, True, False, True, False, True,
+           True, False, False, True, True, True, False, True, True, True]
+
+
+@pytest.fixture
+def pack(db, client):
+    with db.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES (1, 'one@example.com')"))
+        conn.execute(text("INSERT INTO subjects (id, name) VALUES (1, 'Math')"))
+        conn.execute(text("INSERT INTO topics (id, name, subject_id) VALUES (1, 'Algebra', 1)"))
+        conn.execute(text("INSERT INTO subtopics (id, name, topic_id) VALUES (1, 'Linear', 1)"))
+        for level in range(1, 11):
+            for _ in range(2):
+                conn.execute(text(
+                    "INSERT INTO mcqs (question, option_a, option_b, option_c, option_d, correct_option, "
+                    "explanation, hardness_level, subtopic_id) VALUES ('q', 'a', 'b', 'c', 'd', 'a', 'e', :level, 1)"
+                ), {"level": level})
+    response = client.post(PACK_URL, headers=auth_headers(1))
+    assert response.status_code == 200
+    return response.json()
+
+
+def answer_pack(pack, pattern):
+    """Answer the pack the way the client serves it."""
+    answers = []
+    level = pack["hardness_level"]
+    served = Counter()
+    for is_correct in pattern:
+        ids = pack["levels"][str(level)]
+        answers.append({"question_id": ids[served[level] % len(ids)], "is_correct": is_correct, "response_time": 1.0})
+        served[level] += 1
+        level = adjust_hardness(level, is_correct)
+    return answers
+
+
+def sync(client, pack, answers):
+    return client.post(SYNC_URL, headers=auth_headers(1), json={"pack_token": pack["pack_token"], "answers": answers})
+
+
+def test_sync_records_pack_and_is_idempotent(client, pack):
+    answers = answer_pack(pack, PATTERN)
+    first = sync(client, pack, answers[:12])
+    assert first.status_code == 200
+    assert first.json()["questions_tried"] == 12
+
+    complete = sync(client, pack, answers)
+    assert complete.status_code == 200
+    assert complete.json()["questions_tried"] == 20
+    assert complete.json()["number_correct"] == sum(PATTERN)
+
+    again = sync(client, pack, answers)
+    assert again.json() == complete.json()
+
+
+def test_sync_rejects_more_than_a_pack(client, pack):
+    answers = answer_pack(pack, PATTERN)
+    response = sync(client, pack, answers + answers[:1])
+    assert response.status_code == 400
+    assert sync(client, pack, answers).json()["questions_tried"] == 20
+
+
+def test_sync_rejects_answers_that_differ_from_recorded(client, pack):
+    answers = answer_pack(pack, PATTERN[:3])
+    assert sync(client, pack, answers).status_code == 200
+
+    # Same questions, but the last recorded answer changed
+    changed = answer_pack(pack, PATTERN[:2] + [not PATTERN[2]])
+    response = sync(client, pack, changed)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "The answers do not match the ones already recorded for this pack"
+
+
+def test_practise_does_not_resume_pack(db, client, pack):
+    assert sync(client, pack, answer_pack(pack, PATTERN[:5])).status_code == 200
+
+    response = client.post(PRACTISE_URL, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert response.json()["questions_tried"] == 0
+    with db.connect() as conn:
+        attempts = conn.execute(text("SELECT questions_tried FROM practise_attempts ORDER BY id")).scalars().all()
+    assert attempts == [5, 0]
@@ -0,0 +1,106 @@
+"""Semantic answer cache for English custom questions, and purging it."""
+import json
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+import app.router.explain as explain
+from app.embedding_index import chunks_version, pack_embeddings
+from app.semantic_cache import SemanticAnswerCache
+from conftest import auth_headers
+
+URL = "/English/Grammar/Nouns/explains/"
+CHUNKS = ["A noun names a thing.", "Proper nouns.", "Plurals.", "Possessives."]
+CHUNK_EMBEDDINGS = np.eye(4, 8, dtype=np.float32)
+
+
+class FakeEmbedder:
+    """Embeds every question as the first chunk's embedding."""
+
+    async def encode(self, query):
+        return CHUNK_EMBEDDINGS[0]
+
+
+class FakeModel:
+    """The encoder behind get_chunk_index; counts chunk re-encodes."""
+    embedding_space = "fake:model"
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, sentences, convert_to_numpy=True):
+        self.encoded += 1
+        return CHUNK_EMBEDDINGS[:len(sentences)]
+
+
+@pytest.fixture
+def gemini_calls(db, monkeypatch):
+    with db.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES (1, 'one@example.com'), (2, 'two@example.com')"))
+        conn.execute(text("INSERT INTO subjects (id, name) VALUES (1, 'English')"))
+        conn.execute(text("INSERT INTO topics (id, name, subject_id) VALUES (1, 'Grammar', 1)"))
+        conn.execute(text("INSERT INTO subtopics (id, name, topic_id) VALUES (1, 'Nouns', 1)"))
+        conn.execute(text(
+            "INSERT INTO explains (subtopic_id, chunks, content_version, chunk_embeddings, chunk_diagrams) "
+            "VALUES (1, CAST(:chunks AS jsonb), :version, :embeddings, '{}'::jsonb)"
+        ), {"chunks": json.dumps(CHUNKS), "version": chunks_version(CHUNKS, FakeModel.embedding_space),
+            "embeddings": pack_embeddings(CHUNK_EMBEDDINGS)})
+
+    calls = []
+
+    async def fake_generate(prompt, system_instruction="", temperature=0.2, image=None, **kwargs):
+        calls.append(prompt)
+        return f"answer {len(calls)}"
+
+    monkeypatch.setattr(explain, "generate_gemini_response", fake_generate)
+    monkeypatch.setattr(explain, "embedder", FakeEmbedder())
+    monkeypatch.setattr(explain, "model", FakeModel())
+    return calls
+
+
+def ask(client, user_id, question):
+    response = client.post(URL, headers=auth_headers(user_id), json={"query": question, "is_initial": False})
+    assert response.status_code == 200
+    return response.json()["answer"]
+
+
+def test_purge_script_drops_cached_answers(client, gemini_calls, monkeypatch):
+    assert ask(client, 1, "What is a noun?") == "answer 1"
+    assert ask(client, 2, "what's a noun") == "answer 1"
+    assert len(gemini_calls) == 1
+
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(__file__), "..", "app"))
+    from purge_semantic_cache import purge_semantic_cache
+    assert purge_semantic_cache("English", "Grammar", "Other") == 0
+    assert purge_semantic_cache("English", "Grammar", "Nouns") == 1
+
+    assert ask(client, 2, "what's a noun") == "answer 2"
+    assert ask(client, 1, "What is a noun?") == "answer 2"
+    assert len(gemini_calls) == 2
+
+
+def test_embeddings_from_another_backend_are_not_searched(client, gemini_calls, db):
+    ask(client, 1, "What is a noun?")
+    assert explain.model.encoded == 0
+
+    # Re-ingested by another embedding backend than the one encoding queries here
+    with db.begin() as conn:
+        conn.execute(text("UPDATE explains SET content_version = :version"),
+                     {"version": chunks_version(CHUNKS, "other:model")})
+    ask(client, 1, "What is a noun?")
+    assert explain.model.encoded == 1
+
+
+def test_purge_one_subtopic():
+    cache = SemanticAnswerCache(threshold=0.9)
+    vector = np.ones(8, dtype=np.float32)
+    cache.add(1, "v1", vector, "q", "answer one")
+    cache.add(2, "v1", vector, "q", "answer two")
+
+    cache.purge(1)
+    assert cache.lookup(1, "v1", vector) is None
+    assert cache.lookup(2, "v1", vector) == "answer two"
+    cache.purge()
+    assert cache.lookup(2, "v1", vector) is None
@@ -1,7 +1,6 @@
 import React, { useEffect, useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import ReactMarkdown from 'react-markdown';
-import axios from 'axios';
 import AudioPlayer from '../AudioPlayer/AudioPlayer';
 import LoadingScreen from '../LoadingScreen/LoadingScreen';
 import { processExplanation, preprocessMath, postprocessMath } from '../ProcessText/ProcessExplain';
@@ -11,6 +10,7 @@ import rehypeKatex from 'rehype-katex';
 import remarkGfm from 'remark-gfm';
 import 'katex/dist/katex.min.css';
 import { trackInteraction, INTERACTION_TYPES } from '../../utils/trackInteractions';
+import { streamExplain } from '../../utils/explainStream';
 
 const Explains = ({
   selectedSubject,
@@ -90,6 +90,7 @@ const stopAllAudio = () => {
       });
     }, 100); // Small delay to ensure loading component is rendered
   }
+    let streamed = false;
     try  {
     const token = localStorage.getItem('access_token');
 
@@ -99,37 +100,63 @@ const stopAllAudio = () => {
       const encodedTopic = encodeURIComponent(selectedTopic);
       const encodedSubtopic = encodeURIComponent(selectedSubtopic);
 
-    const response = await axios.post(
-        `${API_BASE_URL}/${encodedSubject}/${encodedTopic}/${encodedSubtopic}/explains/`,
+    // Stream the answer: an entry is added on the first event and grows with every delta
+    const appendToNewest = (text) => {
+      setExplanationHistory((prev) => {
+        const newest = prev[prev.length - 1];
+        return [...prev.slice(0, -1), { ...newest, text: newest.text + text }];
+      });
+    };
+    const data = await streamExplain(
+        `${API_BASE_URL}/${encodedSubject}/${encodedTopic}/${encodedSubtopic}/explains/stream/`,
       { query, is_initial: isInitial },
       {
-        headers: { 
-          'user-id': user.user_id,
-          'Authorization': `Bearer ${token}`
-        }
+        'user-id': String(user.user_id),
+        'Authorization': `Bearer ${token}`
+      },
+      {
+        onMeta: (meta) => {
+          streamed = true;
+          setIsExplainLoading(false);
+          setExplanationHistory((prev) => {
+            const newHistory = [...prev, { text: '', image: meta.image }];
+            if (isExplainAgain) {
+              setExplainAgainIndices(new Set([newHistory.length - 1]));
+              setNewlyAddedIndices(new Set());
+            } else {
+              setNewlyAddedIndices(new Set([newHistory.length - 1]));
+              setExplainAgainIndices(new Set());
+            }
+            return newHistory;
+          });
+        },
+        onDelta: appendToNewest
       }
     );
-      
-      if (response.data.answer === "Congratulations, you have mastered the topic!") {
+
+      if (streamed) {
+        // The full answer as recorded, in place of the concatenated deltas
+        setExplanationHistory((prev) => [...prev.slice(0, -1), { text: data.answer, image: data.image }]);
+      } else if (data.answer === "Congratulations, you have mastered the topic!") {
         setExplainFinished(true);
         setExplanationHistory((prev) => {
-  const newHistory = [...prev, { text: response.data.answer, image: response.data.image }];
+  const newHistory = [...prev, { text: data.answer, image: data.image }];
   if (!isExplainAgain) { // CHANGED - only mark as newest if not "explain again"
     setNewlyAddedIndices(new Set([newHistory.length - 1]));
   }
   return newHistory;
 });
           
-      } else if (response.data.initial_response && isInitial) {
+      } else if (data.initial_response && isInitial) {
         // Handle initial response with previous answers from chat_memory
-        const answers = response.data.initial_response.map(answer => ({
+        const answers = data.initial_response.map(answer => ({
           text: answer,
           image: null
         }));
         setExplanationHistory((prev) => [...prev, ...answers]);
       } else {
   setExplanationHistory((prev) => {
-    const newHistory = [...prev, { text: response.data.answer, image: response.data.image}];
+    const newHistory = [...prev, { text: data.answer, image: data.image}];
     if (isExplainAgain) {
       setExplainAgainIndices(new Set([newHistory.length - 1]));
       setNewlyAddedIndices(new Set()); // Clear previous newest entries
@@ -142,6 +169,10 @@ const stopAllAudio = () => {
 }
     } catch (error) {
       console.error('Error fetching explanation:', error);
+      if (streamed) {
+        // Nothing was recorded: drop the partial answer
+        setExplanationHistory((prev) => prev.slice(0, -1));
+      }
       alert('Error fetching explanation. Please try again.');
     } finally {
       setIsExplainLoading(false);
@@ -287,7 +318,7 @@ const stopAllAudio = () => {
             {entry.image && (
               <div className="explanation-image-component">
                 <img
-                  src={`data:image/png;base64,${entry.image}`}
+                  src={`${API_BASE_URL}${entry.image}`}
                   alt="Explanation diagram"
                   style={{ maxWidth: '100%', marginTop: '20px' }}
                 />
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { IntegrityScore, useIntegrityScore } from '../integrity_score/integrity_score';
@@ -9,6 +9,7 @@ import remarkMath from 'remark-math';
 import rehypeKatex from 'rehype-katex';
 import 'katex/dist/katex.min.css';
 import ReactMarkdown from 'react-markdown';
+import { retryWithBackoff } from '../../utils/retryRequest';
 import './Practise.css';
 
 const PracticeQuiz = ({ user, API_BASE_URL }) => {
@@ -30,6 +31,13 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
 
   const [image1, setImage1] = useState(null); // State for correct answer image
   const [image2, setImage2] = useState(null); // State for incorrect answer image
+  // Questions the server reserved for each outcome of the current question
+  const nextQuestions = useRef(null);
+  // Answer being sent in the background, awaited before the next request
+  const pendingSubmission = useRef(Promise.resolve());
+  // Background answers that failed after their retries, in order; practice waits until they are sent
+  const unsentSubmissions = useRef([]);
+  const [submissionFailed, setSubmissionFailed] = useState(false);
 
   // Integrity score hook
   const {
@@ -50,34 +58,83 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
     }
   }, [currentQuestion, setQuestionStartTime]);
 
+  const sendPractice = useCallback(
+    async (submission) => {
+      const token = localStorage.getItem('access_token');
+      const encodedSubject = encodeURIComponent(subject);
+      const encodedTopic = encodeURIComponent(topic);
+      const encodedSubtopic = encodeURIComponent(subtopic);
+
+      const url = `${API_BASE_URL}/${encodedSubject}/${encodedTopic}/${encodedSubtopic}/practise/?prefetch=true`;
+
+      const response = await axios.post(url, submission, {
+        headers: {
+          'user-id': user.user_id,
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      nextQuestions.current = response.data.next_questions || null;
+      return response.data;
+    },
+    [API_BASE_URL, subject, topic, subtopic, user.user_id]
+  );
+
+  const postPractice = useCallback(
+    async (submission) => {
+      await pendingSubmission.current;
+      if (unsentSubmissions.current.length) {
+        throw new Error('An earlier answer has not been saved');
+      }
+      return sendPractice(submission);
+    },
+    [sendPractice]
+  );
+
+  // Send an answer in the background after the ones before it, retrying with backoff;
+  // if it still fails, keep it and block practice until the student sends it again
+  const queueSubmission = (submission) => {
+    pendingSubmission.current = pendingSubmission.current
+      .then(() => {
+        if (unsentSubmissions.current.length) {
+          throw new Error('An earlier answer has not been saved');
+        }
+        return retryWithBackoff(() => sendPractice(submission));
+      })
+      .catch((error) => {
+        console.error('Error submitting practice answer:', error);
+        unsentSubmissions.current.push(submission);
+        setSubmissionFailed(true);
+        setIsTimerPaused(true);
+      });
+  };
+
+  const resendAnswer = () => {
+    const submissions = unsentSubmissions.current;
+    unsentSubmissions.current = [];
+    setSubmissionFailed(false);
+    setIsTimerPaused(false);
+    submissions.forEach(queueSubmission);
+  };
+
+  const showQuestion = (question, hardness_level) => {
+    setCurrentQuestion(question);
+    setHardnessLevel(hardness_level);
+    setSelectedOption('');
+    setIsAnswerSubmitted(false);
+    setIsAnswerIncorrect(false);
+    setShowCongrats(false);
+    setIsTimerPaused(false);
+  };
+
   const fetchPracticeQuestion = useCallback(
     async (submission = null) => {
       setIsLoading(true);
       try {
-        const token = localStorage.getItem('access_token');
-        const encodedSubject = encodeURIComponent(subject);
-        const encodedTopic = encodeURIComponent(topic);
-        const encodedSubtopic = encodeURIComponent(subtopic);
-
-        const url = `${API_BASE_URL}/${encodedSubject}/${encodedTopic}/${encodedSubtopic}/practise/`;
-
-        const response = await axios.post(url, submission, {
-          headers: {
-            'user-id': user.user_id,
-            Authorization: `Bearer ${token}`,
-          },
-        });
-
-        const { question, hardness_level, message, questions_tried, number_correct, image1, image2 } = response.data;
+        const { question, hardness_level, message, questions_tried, number_correct, image1, image2 } =
+          await postPractice(submission);
 
         if (question) {
-          setCurrentQuestion(question);
-          setHardnessLevel(hardness_level);
-          setSelectedOption('');
-          setIsAnswerSubmitted(false);
-          setIsAnswerIncorrect(false);
-          setShowCongrats(false);
-          setIsTimerPaused(false);
+          showQuestion(question, hardness_level);
           setImage1(image1);
           setImage2(image2);
 
@@ -104,7 +161,7 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
         setIsLoading(false);
       }
     },
-    [API_BASE_URL, subject, topic, subtopic, user.user_id]
+    [postPractice]
   );
 
   // Fetch the first practice question on mount
@@ -112,6 +169,18 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
     fetchPracticeQuestion();
   }, [fetchPracticeQuestion]);
 
+  // Show the question prefetched for this outcome at once and send the answer in the background;
+  // without one, wait for the server as before
+  const submitAnswer = (submission) => {
+    const next = nextQuestions.current && nextQuestions.current[submission.is_correct ? 'correct' : 'incorrect'];
+    if (!next) {
+      return fetchPracticeQuestion(submission);
+    }
+    nextQuestions.current = null;
+    showQuestion(next.question, next.hardness_level);
+    queueSubmission(submission);
+  };
+
   const handleAnswerSelect = async (option) => {
     setSelectedOption(option);
 
@@ -139,7 +208,7 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
           questions_tried: questionsTried + 1,
           response_time: responseTime,
         };
-        await fetchPracticeQuestion(submission);
+        await submitAnswer(submission);
       }, 1500); // Wait 1.5 seconds before moving to next question
     }
   };
@@ -175,7 +244,7 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
       questions_tried: questionsTried + 1,
       response_time: responseTime,
     };
-    await fetchPracticeQuestion(submission);
+    await submitAnswer(submission);
   };
 
   const handleCompletePractice = () => {
@@ -292,7 +361,7 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
                 value={option}
                 checked={selectedOption === option}
                 onChange={() => handleAnswerSelect(option)}
-                disabled={isAnswerSubmitted && isAnswerIncorrect}
+                disabled={(isAnswerSubmitted && isAnswerIncorrect) || submissionFailed}
               />
               <label htmlFor={`q-${currentQuestion.id}-${option}`}>
                 {option.toUpperCase()}: <MathText>{currentQuestion[`option_${option}`]}</MathText>
@@ -309,7 +378,7 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
               <p>Well done! You selected the right answer.</p>
               {image1 && (
                 <img
-                  src={`data:image/png;base64,${image1}`}
+                  src={`${API_BASE_URL}${image1}`}
                   alt="Correct feedback"
                   style={{
                     maxWidth: '100%',
@@ -334,7 +403,7 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
               <p>Your answer was incorrect.</p>
               {image2 && (
                 <img
-                  src={`data:image/png;base64,${image2}`}
+                  src={`${API_BASE_URL}${image2}`}
                   alt="Incorrect feedback"
                   style={{
                     maxWidth: '70%',
@@ -364,6 +433,21 @@ const PracticeQuiz = ({ user, API_BASE_URL }) => {
           </div>
         </div>
       )}
+      {submissionFailed && (
+        <div className="modal-overlay">
+          <div className="modal-content">
+            <div className="feedback incorrect">
+              <h3>Answer not saved</h3>
+              <p>Your last answer could not be sent. Check your connection and try again.</p>
+            </div>
+            <div className="action-buttons">
+              <button onClick={resendAnswer} className="next-button" style={{ display: 'flex', justifyContent: 'center', width: '100%' }}>
+                Try Again
+              </button>
+            </div>
+          </div>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,10 +1,11 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { IntegrityScore, useIntegrityScore } from '../integrity_score/integrity_score';
 import { processQuizText, MathText } from '../ProcessText/ProcessQuiz'; // Add this import
 import Stopwatch from '../Stopwatch/Stopwatch';
 import LoadingScreen from '../LoadingScreen/LoadingScreen';
+import { retryWithBackoff } from '../../utils/retryRequest';
 import './quiz.css';
 
 const Quiz = ({ user, API_BASE_URL, subject, topic, subtopic, onCompleteQuiz }) => {
@@ -25,6 +26,13 @@ const Quiz = ({ user, API_BASE_URL, subject, topic, subtopic, onCompleteQuiz })
   const [image1, setImage1] = useState(null);
   const [image2, setImage2] = useState(null);
   const [completionDate, setCompletionDate] = useState('');
+  // Questions the server reserved for each outcome of the current question
+  const nextQuestions = useRef(null);
+  // Answer being sent in the background, awaited before the next request
+  const pendingSubmission = useRef(Promise.resolve());
+  // Background answers that failed after their retries, in order; the quiz waits until they are sent
+  const unsentSubmissions = useRef([]);
+  const [submissionFailed, setSubmissionFailed] = useState(false);
   const navigate = useNavigate();
   const {
     questionStartTime,
@@ -49,34 +57,74 @@ const Quiz = ({ user, API_BASE_URL, subject, topic, subtopic, onCompleteQuiz })
     fetchQuizQuestion();
   }, []);
 
-const fetchQuizQuestion = async (submission = null) => {
-    setIsLoading(true);
+  const sendQuiz = async (submission) => {
+    const token = localStorage.getItem('access_token');
     const encodedSubtopic = encodeURIComponent(subtopic);
-    try {
-         const token = localStorage.getItem('access_token');
-          const encodedSubtopic = encodeURIComponent(subtopic);
-      const response = await axios.post(
-         `${API_BASE_URL}/${encodeURIComponent(subject)}/${encodeURIComponent(topic)}/${encodedSubtopic }/quiz/`,
-        submission,
-        {
-           headers: { 
-              'user-id': user.user_id,
-              'Authorization': `Bearer ${token}`
-            }
-          }
-        );
+    const response = await axios.post(
+      `${API_BASE_URL}/${encodeURIComponent(subject)}/${encodeURIComponent(topic)}/${encodedSubtopic}/quiz/?prefetch=true`,
+      submission,
+      {
+        headers: {
+          'user-id': user.user_id,
+          'Authorization': `Bearer ${token}`
+        }
+      }
+    );
+    nextQuestions.current = response.data.next_questions || null;
+    return response.data;
+  };
 
+  const postQuiz = async (submission) => {
+    await pendingSubmission.current;
+    if (unsentSubmissions.current.length) {
+      throw new Error('An earlier answer has not been saved');
+    }
+    return sendQuiz(submission);
+  };
+
+  // Send an answer in the background after the ones before it, retrying with backoff;
+  // if it still fails, keep it and block the quiz until the student sends it again
+  const queueSubmission = (submission) => {
+    pendingSubmission.current = pendingSubmission.current
+      .then(() => {
+        if (unsentSubmissions.current.length) {
+          throw new Error('An earlier answer has not been saved');
+        }
+        return retryWithBackoff(() => sendQuiz(submission));
+      })
+      .catch((error) => {
+        console.error('Error submitting quiz answer:', error);
+        unsentSubmissions.current.push(submission);
+        setSubmissionFailed(true);
+        setIsTimerPaused(true);
+      });
+  };
+
+  const resendAnswer = () => {
+    const submissions = unsentSubmissions.current;
+    unsentSubmissions.current = [];
+    setSubmissionFailed(false);
+    setIsTimerPaused(false);
+    submissions.forEach(queueSubmission);
+  };
+
+  const showQuestion = (question, hardness_level) => {
+    setCurrentQuestion(question);
+    setHardnessLevel(hardness_level);
+    setSelectedOption('');
+    setIsAnswerSubmitted(false);
+    setIsAnswerIncorrect(false);
+    setShowCongrats(false);
+    setIsTimerPaused(false);
+  };
 
-      const { question, hardness_level, message, attempt_id, questions_tried, correct_answers,image1,image2 } = response.data;
+const fetchQuizQuestion = async (submission = null) => {
+    setIsLoading(true);
+    try {
+      const { question, hardness_level, message, attempt_id, questions_tried, correct_answers,image1,image2 } = await postQuiz(submission);
       if (question) {
-        setCurrentQuestion(question);
-        setHardnessLevel(hardness_level);
+        showQuestion(question, hardness_level);
         setAttemptId(attempt_id);
-        setSelectedOption('');
-        setIsAnswerSubmitted(false);
-        setIsAnswerIncorrect(false);
-        setShowCongrats(false);
-        setIsTimerPaused(false);
 
         setImage1(image1); // Store image1
         setImage2(image2); // Store image2
@@ -117,6 +165,18 @@ const fetchQuizQuestion = async (submission = null) => {
     }
   };
 
+  // Show the question prefetched for this outcome at once and send the answer in the background;
+  // without one, wait for the server as before
+  const submitAnswer = (submission) => {
+    const next = nextQuestions.current && nextQuestions.current[submission.is_correct ? 'correct' : 'incorrect'];
+    if (!next) {
+      return fetchQuizQuestion(submission);
+    }
+    nextQuestions.current = null;
+    showQuestion(next.question, next.hardness_level);
+    queueSubmission(submission);
+  };
+
   const handleAnswerSelect = async (option) => {
     setSelectedOption(option);
 
@@ -147,7 +207,7 @@ const fetchQuizQuestion = async (submission = null) => {
       setShowCongrats(true);
       setIsTimerPaused(true);
       setTimeout(async () => {
-        await fetchQuizQuestion(submission);
+        await submitAnswer(submission);
       }, 1500);
     }
     // For incorrect answers, do not fetch new question immediately
@@ -170,7 +230,7 @@ const fetchQuizQuestion = async (submission = null) => {
         response_time: responseTime
       };
       setQuestionsTried((prev) => prev + 1);
-      fetchQuizQuestion(submission);
+      submitAnswer(submission);
     }
   };
 
@@ -193,7 +253,7 @@ const fetchQuizQuestion = async (submission = null) => {
       attempt_id: attemptId,
       response_time: responseTime
     };
-    await fetchQuizQuestion(submission);
+    await submitAnswer(submission);
   };
 
   const handleCompleteQuiz = () => {
@@ -279,7 +339,7 @@ const fetchQuizQuestion = async (submission = null) => {
               value={option}
               checked={selectedOption === option}
               onChange={() => handleAnswerSelect(option)}
-              disabled={isAnswerSubmitted}
+              disabled={isAnswerSubmitted || submissionFailed}
             />
             <label htmlFor={`q-${currentQuestion.id}-${option}`}>
               {option.toUpperCase()}: <MathText>{currentQuestion[`option_${option}`]}</MathText>
@@ -297,7 +357,7 @@ const fetchQuizQuestion = async (submission = null) => {
 
              {image1 && (
                 <img
-                  src={`data:image/png;base64,${image1}`}
+                  src={`${API_BASE_URL}${image1}`}
                   alt="Correct feedback"
                   style={{
                     maxWidth: '100%',
@@ -322,7 +382,7 @@ const fetchQuizQuestion = async (submission = null) => {
   <p>Your answer was incorrect.</p>
   {image2 && (
     <img
-      src={`data:image/png;base64,${image2}`}
+      src={`${API_BASE_URL}${image2}`}
       alt="Incorrect feedback"
       style={{
         maxWidth: '70%',
@@ -348,6 +408,21 @@ const fetchQuizQuestion = async (submission = null) => {
         </div>
       </div>
     )}
+    {submissionFailed && (
+      <div className="modal-overlay">
+        <div className="modal-content">
+          <div className="feedback incorrect">
+            <h3>Answer not saved</h3>
+            <p>Your last answer could not be sent. Check your connection and try again.</p>
+          </div>
+          <div className="action-buttons">
+            <button onClick={resendAnswer} className="next-button" style={{ display: 'flex', justifyContent: 'center', width: '100%' }}>
+              Try Again
+            </button>
+          </div>
+        </div>
+      </div>
+    )}
   </div>
 );
 };
@@ -263,7 +263,7 @@ const Quiz1 = ({ user, API_BASE_URL, onCompleteQuiz }) => {
               <p>Well done! You selected the right answer.</p>
                {image1 && (
                 <img
-                  src={`data:image/png;base64,${image1}`}
+                  src={`${API_BASE_URL}${image1}`}
                   alt="Correct feedback"
                   style={{
                     maxWidth: '100%',
@@ -288,7 +288,7 @@ const Quiz1 = ({ user, API_BASE_URL, onCompleteQuiz }) => {
               <p>Your answer was incorrect.</p>
                 {image2 && (
                 <img
-                  src={`data:image/png;base64,${image2}`}
+                  src={`${API_BASE_URL}${image2}`}
                   alt="Incorrect feedback"
                   style={{
                     maxWidth: '70%',
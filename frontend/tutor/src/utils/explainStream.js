@@ -0,0 +1,67 @@
+/**
+ * POST an explain query to the streaming endpoint (/explains/stream/) and read its server-sent events
+ * @param {string} url - Full URL of the explains/stream/ endpoint
+ * @param {object} body - Request body ({ query, is_initial })
+ * @param {object} headers - Auth headers ('user-id', 'Authorization')
+ * @param {object} handlers - onMeta({ image }) before the first delta, onDelta(text) per markdown piece
+ * @returns {Promise<object>} The ExplainResponse sent with the final "done" event
+ */
+export const streamExplain = async (url, body, headers, { onMeta, onDelta } = {}) => {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+      ...headers
+    },
+    body: JSON.stringify(body)
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Explain stream failed: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line: "event: <name>\ndata: <json>\n\n"
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      let data = '';
+      block.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) {
+          event = line.slice('event: '.length);
+        } else if (line.startsWith('data: ')) {
+          data += line.slice('data: '.length);
+        }
+      });
+      const payload = data ? JSON.parse(data) : {};
+
+      if (event === 'meta' && onMeta) {
+        onMeta(payload);
+      } else if (event === 'delta' && onDelta) {
+        onDelta(payload.text);
+      } else if (event === 'error') {
+        throw new Error(payload.detail || 'Explain stream failed');
+      } else if (event === 'done') {
+        reader.cancel();
+        return payload;
+      }
+    }
+  }
+
+  throw new Error('Explain stream ended before the answer was complete');
+};
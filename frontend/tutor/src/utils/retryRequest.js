@@ -0,0 +1,20 @@
+/**
+ * Run a request until it succeeds, waiting baseDelayMs, then twice as long, and so on between attempts
+ * @param {function} request - Returns the request's promise (e.g. an axios call)
+ * @param {object} options - retries: attempts after the first; baseDelayMs: wait before the first retry
+ * @returns {Promise<any>} The first successful result; rejects with the last error. Responses with a
+ * 4xx status are not retried, since sending them again will not change the answer
+ */
+export const retryWithBackoff = async (request, { retries = 4, baseDelayMs = 500 } = {}) => {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await request();
+    } catch (error) {
+      const status = error.response && error.response.status;
+      if (attempt >= retries || (status && status < 500)) {
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, baseDelayMs * 2 ** attempt));
+    }
+  }
+};